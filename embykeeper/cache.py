@@ -1,5 +1,17 @@
+import asyncio
+import atexit
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import copy
+from datetime import datetime, timezone
 import json
-from typing import Any, List
+import os
+from pathlib import Path
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 from loguru import logger
 
@@ -7,111 +19,1005 @@ from .utils import CachedFuncProxy
 from .config import config
 
 
-class Cache:
-    def __init__(self):
-        self._mongo_client = None
-        if hasattr(config, "mongodb") and config.mongodb:
-            try:
-                from pymongo import MongoClient
+class CacheJournal:
+    """JSON 缓存的追加写入日志.
 
-                self._mongo_client = MongoClient(config.mongodb)
-                self._db = self._mongo_client.embykeeper
-                self._collection = self._db.cache
-            except ImportError:
-                logger.warning("没有安装 pymongo 包, 将使用 JSON 存储缓存.")
-                self._setup_json_cache()
-        else:
-            self._setup_json_cache()
+    每次修改仅向日志文件追加一行记录, 短时间内的多次写入将被合并为一次落盘,
+    日志超过一定大小后在后台线程中压缩为完整的快照文件.
+
+    Args:
+        path: 快照文件路径, 日志文件为同目录下的 ".journal" 后缀文件
+        dump: 返回当前完整缓存内容 (已序列化字符串) 的函数, 在持有 lock 时调用
+        lock: 保护缓存数据的锁
+        max_size: 日志文件超过该字节数时进行压缩
+        delay: 合并写入的等待时间 (秒)
+    """
 
-    def _setup_json_cache(self):
-        self._cache_file = config.basedir / "cache.json"
-        self._data = {}
-        if self._cache_file.exists():
+    def __init__(
+        self,
+        path: Path,
+        dump: Callable[[], str],
+        lock: threading.RLock,
+        max_size: int = 1024 * 1024,
+        delay: float = 0.05,
+    ):
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self.max_size = max_size
+        self.delay = delay
+
+        self._dump = dump
+        self._lock = lock
+        self._io_lock = threading.Lock()
+        self._pending: List[str] = []
+        self._wakeup = threading.Event()
+        self._size = 0
+        self._thread = None
+
+    def load(self) -> dict:
+        """读取快照并重放日志, 返回缓存内容."""
+        data = {}
+        if self.path.exists():
             try:
-                with open(self._cache_file, "r", encoding="utf-8") as f:
-                    self._data = json.load(f)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
             except json.JSONDecodeError:
                 logger.warning("缓存文件损坏, 将使用全新缓存.")
+        if self.journal_path.exists():
+            good = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        # 写入过程中崩溃导致的不完整记录, 丢弃其后所有内容
+                        logger.debug("缓存日志末尾存在不完整记录, 已忽略.")
+                        break
+                    self.replay(data, record)
+                    good += len(line)
+            if good < self.journal_path.stat().st_size:
+                with open(self.journal_path, "r+b") as f:
+                    f.truncate(good)
+            self._size = good
+        return data
 
-    def get(self, key: str, default: Any = None) -> Any:
-        if self._mongo_client:
-            result = self._collection.find_one({"_id": key})
-            return result["value"] if result else default
-        else:
-            value = self._data
+    @staticmethod
+    def replay(data: dict, record: list):
+        op, key = record[0], record[1]
+        metas = data.setdefault(META_KEY, {})
+        if op == "set":
+            _nested_set(data, key, record[2])
+            _meta_set(metas, key, record[3] if len(record) > 3 else None)
+        elif op == "del":
+            removed = _nested_delete(data, key)
+            if removed is not _MISSING:
+                _meta_delete(metas, key, isinstance(removed, dict))
+
+    def append(self, op: str, key: str, *args):
+        """记录一次修改, 调用者需持有 lock."""
+        self._pending.append(json.dumps([op, key, *args], ensure_ascii=False) + "\n")
+        if not self._thread:
+            self._thread = threading.Thread(target=self._worker, name="cache-journal", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def _worker(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.delay)
+            self._wakeup.clear()
             try:
-                for part in key.split("."):
-                    value = value.get(part, {})
-                return default if value == {} else value
-            except (AttributeError, TypeError):
-                return default
-
-    def set(self, key: str, value: Any) -> None:
-        if self._mongo_client:
-            self._collection.update_one({"_id": key}, {"$set": {"value": value}}, upsert=True)
+                self.flush()
+            except OSError as e:
+                logger.warning(f"缓存文件写入失败: {e}.")
+
+    def flush(self, compact: bool = False):
+        """将所有待写入的记录落盘, 必要时压缩日志."""
+        with self._io_lock:
+            with self._lock:
+                records, self._pending = self._pending, []
+                chunk = "".join(records).encode("utf-8")
+                compact = compact or (self._size + len(chunk) > self.max_size)
+                # 快照与日志在同一锁内取得, 保证两者内容一致
+                snapshot = self._dump() if compact else None
+            if chunk:
+                with open(self.journal_path, "ab") as f:
+                    f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._size += len(chunk)
+            if snapshot is not None:
+                self._write_snapshot(snapshot)
+                with open(self.journal_path, "wb") as f:
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._size = 0
+
+    def _write_snapshot(self, content: str):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+META_KEY = "__meta__"
+_MISSING = object()
+
+# query_by_prefix 支持的条件运算符: 运算符 => 判断函数 (条目中该位置的值, 条件值)
+QUERY_OPS = {
+    "==": lambda a, b: a == b,
+    "in": lambda a, b: a in b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "<": lambda a, b: a is not None and a < b,
+    "has": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def match_conditions(value: Any, conditions: Iterable[Tuple[int, str, Any]]) -> bool:
+    """判断列表值是否满足所有 (位置, 运算符, 条件值) 条件."""
+    if not isinstance(value, list):
+        return False
+    for pos, op, expected in conditions:
+        if pos >= len(value) or not QUERY_OPS[op](value[pos], expected):
+            return False
+    return True
+
+
+def _nested_set(data: dict, key: str, value: Any):
+    parts = key.split(".")
+    current = data
+    for part in parts[:-1]:
+        child = current.get(part, None)
+        if not isinstance(child, dict):
+            child = current[part] = {}
+        current = child
+    current[parts[-1]] = value
+
+
+def _nested_delete(data: dict, key: str) -> Any:
+    """删除嵌套字典中的键, 返回被删除的值, 不存在时返回 _MISSING."""
+    parts = key.split(".")
+    current = data
+    path = []
+
+    # 遍历路径, 检查每一层
+    for part in parts[:-1]:
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        path.append((current, part))
+        current = current[part]
+
+    # 检查并删除最后一个键
+    if not (isinstance(current, dict) and parts[-1] in current):
+        return _MISSING
+    removed = current.pop(parts[-1])
+
+    # 清理空字典
+    for parent, part in reversed(path):
+        if not parent[part]:
+            del parent[part]
         else:
-            parts = key.split(".")
-            current = self._data
-            for part in parts[:-1]:
-                current = current.setdefault(part, {})
-            current[parts[-1]] = value
-            with open(self._cache_file, "w", encoding="utf-8") as f:
-                json.dump(self._data, f, ensure_ascii=False)
+            break
+    return removed
 
-    def delete(self, key: str) -> None:
-        if self._mongo_client:
-            self._collection.delete_one({"_id": key})
+
+def _meta_set(metas: dict, key: str, meta: Optional[list]):
+    if meta:
+        metas[key] = meta
+    else:
+        metas.pop(key, None)
+
+
+def _meta_delete(metas: dict, key: str, subtree: bool):
+    metas.pop(key, None)
+    if subtree:
+        prefix = key + "."
+        for k in [k for k in metas if k.startswith(prefix)]:
+            del metas[k]
+
+
+def _flatten(data: dict, prefix: str = "", items: Dict[str, Any] = None) -> Dict[str, Any]:
+    """将嵌套字典展开为以 "." 连接的叶子键."""
+    if items is None:
+        items = {}
+    for k, v in data.items():
+        path = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            _flatten(v, path, items)
         else:
-            parts = key.split(".")
-            current = self._data
-            path = []
+            items[path] = v
+    return items
 
-            # 遍历路径, 检查每一层
-            for part in parts[:-1]:
-                if not isinstance(current, dict) or part not in current:
-                    return
-                current = current[part]
-                path.append((part, current))
-
-            # 检查并删除最后一个键
-            if isinstance(current, dict) and parts[-1] in current:
-                del current[parts[-1]]
-
-                # 清理空字典
-                for part, parent in reversed(path):
-                    if isinstance(parent, dict) and part in parent and not parent[part]:
-                        del parent[part]
-                    else:
-                        break
 
-            with open(self._cache_file, "w", encoding="utf-8") as f:
-                json.dump(self._data, f, ensure_ascii=False, indent=2)
+class CacheBackend:
+    """缓存存储后端基类.
+
+    写入时可附带元数据 meta = [写入时间, 过期时间], 均为时间戳, 过期时间可为 None.
+    仅带有有效期或属于保留策略命名空间的键会附带元数据.
+    blocking 为 True 的后端读写涉及网络或磁盘 I/O, 异步接口会将其移至 I/O 线程执行.
+    """
+
+    blocking = True
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, meta: Optional[list] = None) -> None:
+        self.set_many({key: value}, {key: meta})
+
+    def set_many(self, items: Dict[str, Any], metas: Dict[str, Optional[list]] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        self.delete_many([key])
+
+    def delete_many(self, keys: List[str]) -> None:
+        raise NotImplementedError
 
     def find_by_prefix(self, prefix: str) -> List[str]:
-        if self._mongo_client:
-            return [
-                doc["_id"] for doc in self._collection.find({"_id": {"$regex": f"^{prefix}"}}, {"_id": 1})
-            ]
+        raise NotImplementedError
+
+    def get_by_prefix(self, prefix: str) -> Dict[str, Any]:
+        """返回以 prefix 开头的所有 (展开后的) 键与值."""
+        return self.get_many(self.find_by_prefix(prefix))
+
+    def query_by_prefix(self, prefix: str, conditions: List[Tuple[int, str, Any]]) -> Dict[str, Any]:
+        """返回以 prefix 开头, 值为列表且满足所有 (位置, 运算符, 条件值) 条件的键与值, 运算符见 QUERY_OPS.
+
+        基类在读取后筛选, 适用于数据已在内存中的后端; 其他后端应在存储端完成筛选.
+        """
+        return {k: v for k, v in self.get_by_prefix(prefix).items() if match_conditions(v, conditions)}
+
+    def expired_keys(self, now: float) -> List[str]:
+        """返回所有已过期的键."""
+        raise NotImplementedError
+
+    def stamped_keys(self, prefix: str) -> Iterable[Tuple[str, float]]:
+        """返回以 prefix 开头且带有元数据的键及其写入时间."""
+        raise NotImplementedError
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        result = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                result[key] = value
+        return result
+
+    def delete_by_prefix(self, prefix: str) -> None:
+        self.delete_many(self.find_by_prefix(prefix))
+
+    def delete_trees(self, keys: List[str]) -> None:
+        """删除键及其下所有子键."""
+        self.delete_many(keys)
+
+    def flush(self, compact: bool = False) -> None:
+        pass
+
+    def storage_size(self) -> Optional[int]:
+        """返回存储占用的字节数, 无法获取时返回 None."""
+        return None
+
+
+class JSONCacheBackend(CacheBackend):
+    """以嵌套字典形式存储于 cache.json 的缓存, 修改通过 CacheJournal 追加写入."""
+
+    blocking = False
+
+    def __init__(self, path: Path):
+        self._lock = threading.RLock()
+        self._journal = CacheJournal(path, dump=self._dump, lock=self._lock)
+        self._data = self._journal.load()
+        self._meta: Dict[str, list] = self._data.pop(META_KEY, {})
+        atexit.register(self.flush)
+
+    def _dump(self):
+        data = {**self._data, META_KEY: self._meta} if self._meta else self._data
+        return json.dumps(data, ensure_ascii=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        meta = self._meta.get(key, None)
+        if meta and meta[1] and meta[1] <= time.time():
+            self.delete(key)
+            return default
+        value = self._data
+        try:
+            for part in key.split("."):
+                value = value.get(part, {})
+            return default if value == {} else value
+        except (AttributeError, TypeError):
+            return default
+
+    def set_many(self, items: Dict[str, Any], metas: Dict[str, Optional[list]] = None) -> None:
+        metas = metas or {}
+        with self._lock:
+            for key, value in items.items():
+                meta = metas.get(key, None)
+                _nested_set(self._data, key, value)
+                _meta_set(self._meta, key, meta)
+                if meta:
+                    self._journal.append("set", key, value, meta)
+                else:
+                    self._journal.append("set", key, value)
+
+    def delete_many(self, keys: List[str]) -> None:
+        with self._lock:
+            for key in keys:
+                removed = _nested_delete(self._data, key)
+                if removed is not _MISSING:
+                    _meta_delete(self._meta, key, isinstance(removed, dict))
+                    self._journal.append("del", key)
+
+    def _prefix_items(self, prefix: str) -> Dict[str, Any]:
+        """仅遍历与 prefix 匹配的子树, 返回展开后的键与值."""
+        *parents, last = prefix.split(".")
+        with self._lock:
+            node = self._data
+            for part in parents:
+                node = node.get(part, None)
+                if not isinstance(node, dict):
+                    return {}
+            base = ".".join(parents) + "." if parents else ""
+            items = {}
+            for k, v in node.items():
+                if not k.startswith(last):
+                    continue
+                if isinstance(v, dict):
+                    _flatten(v, base + k, items)
+                else:
+                    items[base + k] = v
+            return items
+
+    def find_by_prefix(self, prefix: str) -> List[str]:
+        return list(self._prefix_items(prefix))
+
+    def get_by_prefix(self, prefix: str) -> Dict[str, Any]:
+        items = self._prefix_items(prefix)
+        now = time.time()
+        with self._lock:
+            for key in [k for k in items if k in self._meta]:
+                expire_at = self._meta[key][1]
+                if expire_at and expire_at <= now:
+                    del items[key]
+        return items
+
+    def expired_keys(self, now: float) -> List[str]:
+        with self._lock:
+            return [k for k, (_, expire_at) in self._meta.items() if expire_at and expire_at <= now]
+
+    def stamped_keys(self, prefix: str) -> Iterable[Tuple[str, float]]:
+        with self._lock:
+            return [(k, set_at) for k, (set_at, _) in self._meta.items() if k.startswith(prefix)]
+
+    def flush(self, compact: bool = False) -> None:
+        self._journal.flush(compact=compact)
+
+    def storage_size(self) -> Optional[int]:
+        paths = (self._journal.path, self._journal.journal_path)
+        return sum(p.stat().st_size for p in paths if p.exists())
+
+
+class MemoryCache:
+    """带有按命名空间有效期的进程内 LRU 缓存, 用于远程缓存后端的读穿透.
+
+    不存在的键同样会被缓存 (负缓存). 每次失效会增加代数, 读取数据库前记录代数,
+    若写入内存前代数已变化则放弃写入, 以免并发的写入或失效被旧值覆盖.
+
+    Args:
+        maxsize: 最大条目数
+        ttls: 命名空间到有效期 (秒) 的字典, 以最长匹配前缀为准, "" 为默认有效期
+    """
+
+    def __init__(self, maxsize: int, ttls: Dict[str, float]):
+        self.maxsize = maxsize
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data: OrderedDict[str, Tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl(self, key: str) -> float:
+        parts = key.split(".")
+        for i in range(len(parts), -1, -1):
+            ns = ".".join(parts[:i])
+            if ns in self.ttls:
+                return self.ttls[ns]
+        return 0
+
+    def get(self, key: str) -> Any:
+        """返回缓存的值, 不存在时返回 _MISSING, 未缓存或已过期时返回 None."""
+        with self._lock:
+            entry = self._data.get(key, None)
+            if entry and entry[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0] if entry[0] is _MISSING else copy.deepcopy(entry[0])
+            if entry:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any, generation: int = None, expire_at: Optional[float] = None):
+        """缓存值, value 为 _MISSING 表示键不存在, expire_at 为数据本身的过期时间戳."""
+        ttl = self.ttl(key)
+        if ttl <= 0:
+            return
+        if expire_at:
+            ttl = min(ttl, expire_at - time.time())
+            if ttl <= 0:
+                return
+        if value is not _MISSING:
+            value = copy.deepcopy(value)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[str] = None, prefixes: Iterable[str] = None):
+        """使指定键及以指定前缀开头的键失效, 均不指定时清空缓存."""
+        with self._lock:
+            self.generation += 1
+            if keys is None and prefixes is None:
+                self._data.clear()
+                return
+            for key in keys or ():
+                self._data.pop(key, None)
+            prefixes = tuple(prefixes or ())
+            if prefixes:
+                for key in [k for k in self._data if k.startswith(prefixes)]:
+                    del self._data[key]
+
+
+class MongoCacheBackend(CacheBackend):
+    """以 "_id" 为键存储于 MongoDB 集合的缓存, 过期时间由 TTL 索引清理.
+
+    读取经过进程内 MemoryCache, 写入和删除同时更新内存缓存. 启用 watch 时通过变更流
+    使其他实例的修改失效内存缓存 (需要 MongoDB 副本集).
+    """
+
+    def __init__(self, uri: str, memory: MemoryCache = None, watch: bool = False):
+        from pymongo import MongoClient
+
+        self._mongo_client = MongoClient(uri)
+        self._db = self._mongo_client.embykeeper
+        self._collection = self._db.cache
+        self._collection.create_index("expire_at", expireAfterSeconds=0)
+        self.memory = memory
+        if memory and watch:
+            self._watcher = threading.Thread(target=self._watch_worker, name="cache-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch_worker(self):
+        from pymongo.errors import PyMongoError
+
+        while True:
+            try:
+                with self._collection.watch() as stream:
+                    self.memory.invalidate()
+                    for change in stream:
+                        if "documentKey" in change:
+                            self.memory.invalidate(keys=[change["documentKey"]["_id"]])
+                        else:
+                            self.memory.invalidate()
+            except PyMongoError as e:
+                if getattr(e, "code", None) == 40573:
+                    logger.warning("MongoDB 不是副本集, 无法监听缓存变更, 内存缓存将仅依赖有效期失效.")
+                    return
+                logger.debug(f"监听 MongoDB 缓存变更时发生错误, 将重试: {e}.")
+                self.memory.invalidate()
+                time.sleep(10)
+
+    @staticmethod
+    def _prefix_query(prefix: str):
+        return {"_id": {"$regex": f"^{re.escape(prefix)}"}}
+
+    @staticmethod
+    def _update(value: Any, meta: Optional[list]):
+        if meta:
+            set_at, expire_at = meta
+            update = {"$set": {"value": value, "set_at": datetime.fromtimestamp(set_at, timezone.utc)}}
+            if expire_at:
+                update["$set"]["expire_at"] = datetime.fromtimestamp(expire_at, timezone.utc)
+            else:
+                update["$unset"] = {"expire_at": ""}
         else:
+            update = {"$set": {"value": value}, "$unset": {"set_at": "", "expire_at": ""}}
+        return update
+
+    @staticmethod
+    def _alive(doc: dict):
+        expire_at = doc.get("expire_at", None)
+        if not expire_at:
+            return True
+        if not expire_at.tzinfo:
+            expire_at = expire_at.replace(tzinfo=timezone.utc)
+        return expire_at > datetime.now(timezone.utc)
+
+    def _remember(self, key: str, doc: Optional[dict], generation: int):
+        if not self.memory:
+            return
+        if doc and self._alive(doc):
+            expire_at = doc.get("expire_at", None)
+            if expire_at and not expire_at.tzinfo:
+                expire_at = expire_at.replace(tzinfo=timezone.utc)
+            self.memory.put(key, doc["value"], generation, expire_at.timestamp() if expire_at else None)
+        else:
+            self.memory.put(key, _MISSING, generation)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self.memory:
+            value = self.memory.get(key)
+            if value is not None:
+                return default if value is _MISSING else value
+            generation = self.memory.generation
+        result = self._collection.find_one({"_id": key})
+        if self.memory:
+            self._remember(key, result, generation)
+        return result["value"] if result and self._alive(result) else default
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        result = {}
+        if self.memory:
+            remaining = []
+            for key in keys:
+                value = self.memory.get(key)
+                if value is None:
+                    remaining.append(key)
+                elif value is not _MISSING:
+                    result[key] = value
+            keys = remaining
+            generation = self.memory.generation
+        if not keys:
+            return result
+        docs = {doc["_id"]: doc for doc in self._collection.find({"_id": {"$in": keys}})}
+        for key in keys:
+            doc = docs.get(key, None)
+            if self.memory:
+                self._remember(key, doc, generation)
+            if doc and self._alive(doc):
+                result[key] = doc["value"]
+        return result
+
+    def set_many(self, items: Dict[str, Any], metas: Dict[str, Optional[list]] = None) -> None:
+        from pymongo import UpdateOne
 
-            def get_keys_with_prefix(d, current_path="", keys=None):
-                if keys is None:
-                    keys = []
-                for k, v in d.items():
-                    path = f"{current_path}.{k}" if current_path else k
-                    if isinstance(v, dict):
-                        get_keys_with_prefix(v, path, keys)
-                    else:
-                        if path.startswith(prefix):
-                            keys.append(path)
-                return keys
+        metas = metas or {}
+        if items:
+            self._collection.bulk_write(
+                [
+                    UpdateOne({"_id": k}, self._update(v, metas.get(k, None)), upsert=True)
+                    for k, v in items.items()
+                ],
+                ordered=False,
+            )
+            if self.memory:
+                self.memory.invalidate(keys=items)
+                generation = self.memory.generation
+                for k, v in items.items():
+                    expire_at = (metas.get(k, None) or [None, None])[1]
+                    self.memory.put(k, v, generation, expire_at)
 
-            return get_keys_with_prefix(self._data)
+    def delete(self, key: str) -> None:
+        self._collection.delete_one({"_id": key})
+        if self.memory:
+            self.memory.invalidate(keys=[key])
+
+    def delete_many(self, keys: List[str]) -> None:
+        self._collection.delete_many({"_id": {"$in": keys}})
+        if self.memory:
+            self.memory.invalidate(keys=keys)
 
     def delete_by_prefix(self, prefix: str) -> None:
-        keys = self.find_by_prefix(prefix)
+        self._collection.delete_many(self._prefix_query(prefix))
+        if self.memory:
+            self.memory.invalidate(prefixes=[prefix])
+
+    def delete_trees(self, keys: List[str]) -> None:
+        if keys:
+            pattern = "^(" + "|".join(re.escape(k) for k in keys) + r")\."
+            self._collection.delete_many({"$or": [{"_id": {"$in": keys}}, {"_id": {"$regex": pattern}}]})
+            if self.memory:
+                self.memory.invalidate(keys=keys, prefixes=[k + "." for k in keys])
+
+    def find_by_prefix(self, prefix: str) -> List[str]:
+        return [doc["_id"] for doc in self._collection.find(self._prefix_query(prefix), {"_id": 1})]
+
+    def get_by_prefix(self, prefix: str) -> Dict[str, Any]:
+        docs = self._collection.find(self._prefix_query(prefix), {"_id": 1, "value": 1, "expire_at": 1})
+        return {doc["_id"]: doc["value"] for doc in docs if self._alive(doc)}
+
+    def query_by_prefix(self, prefix: str, conditions: List[Tuple[int, str, Any]]) -> Dict[str, Any]:
+        clauses = [self._prefix_query(prefix)]
+        for pos, op, expected in conditions:
+            field = f"value.{int(pos)}"
+            if op in ("==", "has"):
+                clauses.append({field: expected})
+            elif op == "in":
+                clauses.append({field: {"$in": list(expected)}})
+            else:
+                clauses.append({field: {"$gte" if op == ">=" else "$lt": expected}})
+        docs = self._collection.find({"$and": clauses}, {"_id": 1, "value": 1, "expire_at": 1})
+        return {doc["_id"]: doc["value"] for doc in docs if self._alive(doc)}
+
+    def expired_keys(self, now: float) -> List[str]:
+        query = {"expire_at": {"$lte": datetime.fromtimestamp(now, timezone.utc)}}
+        return [doc["_id"] for doc in self._collection.find(query, {"_id": 1})]
+
+    def stamped_keys(self, prefix: str) -> Iterable[Tuple[str, float]]:
+        query = {**self._prefix_query(prefix), "set_at": {"$exists": True}}
+        for doc in self._collection.find(query, {"_id": 1, "set_at": 1}):
+            set_at = doc["set_at"]
+            if not set_at.tzinfo:
+                set_at = set_at.replace(tzinfo=timezone.utc)
+            yield doc["_id"], set_at.timestamp()
+
+    def storage_size(self) -> Optional[int]:
+        try:
+            return self._db.command("collStats", self._collection.name).get("storageSize", None)
+        except Exception:
+            return None
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """存储于 cache.db 的缓存, 每个展开后的叶子键一行, 以主键 B 树索引支持前缀范围查询.
+
+    写入字典值时会展开为多行, 读取不存在的键时从其下的叶子键重建字典, 与 JSON 缓存的行为一致.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, set_at REAL, expire_at REAL"
+            ") WITHOUT ROWID"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(cache)")]
+        for column in ("set_at", "expire_at"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE cache ADD COLUMN {column} REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expire_at ON cache (expire_at)")
+        # 列表值首个元素 (如任务索引的开始时间) 的索引, 供 query_by_prefix 对其进行范围查询
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS cache_list_head ON cache ({self._LIST_HEAD}) WHERE value LIKE '[%'"
+        )
+        atexit.register(self._conn.close)
+
+    _ALIVE = "(expire_at IS NULL OR expire_at > ?)"
+    _LIST_HEAD = "json_extract(value, '$[0]')"
+
+    @staticmethod
+    def _prefix_range(prefix: str):
+        """返回以 prefix 开头的字符串所在的左闭右开区间."""
+        if not prefix:
+            return "", None
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def _select_prefix(
+        self, prefix: str, columns: str = "key, value", where: str = None, args=(), index: str = None
+    ):
+        low, high = self._prefix_range(prefix)
+        table = f"cache INDEXED BY {index}" if index else "cache"
+        if high is None:
+            sql, params = f"SELECT {columns} FROM {table} WHERE key >= ?", (low,)
+        else:
+            sql, params = f"SELECT {columns} FROM {table} WHERE key >= ? AND key < ?", (low, high)
+        if where:
+            sql += f" AND {where}"
+        return self._conn.execute(sql, (*params, *args))
+
+    def _delete_key(self, key: str):
+        """删除键本身, 其下所有子键, 以及作为叶子存在的上级键."""
+        low, high = self._prefix_range(key + ".")
+        self._conn.execute("DELETE FROM cache WHERE key >= ? AND key < ?", (low, high))
+        parts = key.split(".")
+        ancestors = [".".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        self._conn.execute(
+            f"DELETE FROM cache WHERE key IN ({','.join('?' * len(ancestors))})",
+            ancestors,
+        )
+
+    def _insert(self, key: str, value: Any, meta: Optional[list]):
+        self._delete_key(key)
+        set_at, expire_at = meta or (None, None)
+        if isinstance(value, dict):
+            items = {f"{key}.{k}": v for k, v in _flatten(value).items()}
+        else:
+            items = {key: value}
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO cache (key, value, set_at, expire_at) VALUES (?, ?, ?, ?)",
+            [(k, json.dumps(v, ensure_ascii=False), set_at, expire_at) for k, v in items.items()],
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM cache WHERE key = ? AND {self._ALIVE}", (key, now)
+            ).fetchone()
+            if row:
+                return json.loads(row[0])
+            rows = self._select_prefix(key + ".", where=self._ALIVE, args=(now,)).fetchall()
+        if not rows:
+            return default
+        data = {}
+        for k, v in rows:
+            _nested_set(data, k[len(key) + 1 :], json.loads(v))
+        return data
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        result = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(chunk))}) AND {self._ALIVE}",
+                    (*chunk, now),
+                )
+                result.update((k, json.loads(v)) for k, v in rows)
         for key in keys:
-            self.delete(key)
+            if key not in result:
+                value = self.get(key)
+                if value is not None:
+                    result[key] = value
+        return result
+
+    def set_many(self, items: Dict[str, Any], metas: Dict[str, Optional[list]] = None) -> None:
+        metas = metas or {}
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            for key, value in items.items():
+                self._insert(key, value, metas.get(key, None))
+
+    def delete_many(self, keys: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            for key in keys:
+                self._delete_key(key)
+
+    def delete_by_prefix(self, prefix: str) -> None:
+        with self._lock, self._conn:
+            low, high = self._prefix_range(prefix)
+            if high is None:
+                self._conn.execute("DELETE FROM cache")
+            else:
+                self._conn.execute("DELETE FROM cache WHERE key >= ? AND key < ?", (low, high))
+
+    def find_by_prefix(self, prefix: str) -> List[str]:
+        with self._lock:
+            return [k for (k,) in self._select_prefix(prefix, columns="key")]
+
+    def get_by_prefix(self, prefix: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._select_prefix(prefix, where=self._ALIVE, args=(time.time(),)).fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    def query_by_prefix(self, prefix: str, conditions: List[Tuple[int, str, Any]]) -> Dict[str, Any]:
+        """首个元素的范围条件使用 cache_list_head 索引进行范围扫描, 其余条件在扫描时筛选."""
+        where, args = [self._ALIVE], [time.time()]
+        index = None
+        if any(pos == 0 and op in (">=", "<") for pos, op, _ in conditions):
+            index = "cache_list_head"
+            where.append("value LIKE '[%'")
+        for pos, op, expected in conditions:
+            path = f"'$[{int(pos)}]'"
+            if op == "in":
+                expected = list(expected)
+                if not expected:
+                    return {}
+                where.append(f"json_extract(value, {path}) IN ({','.join('?' * len(expected))})")
+                args.extend(expected)
+            elif op == "has":
+                where.append(f"EXISTS (SELECT 1 FROM json_each(cache.value, {path}) AS e WHERE e.value = ?)")
+                args.append(expected)
+            else:
+                where.append(f"json_extract(value, {path}) {'=' if op == '==' else op} ?")
+                args.append(expected)
+        with self._lock:
+            rows = self._select_prefix(prefix, where=" AND ".join(where), args=args, index=index).fetchall()
+        return {k: v for k, v in ((k, json.loads(v)) for k, v in rows) if isinstance(v, list)}
+
+    def expired_keys(self, now: float) -> List[str]:
+        with self._lock:
+            return [k for (k,) in self._conn.execute("SELECT key FROM cache WHERE expire_at <= ?", (now,))]
+
+    def stamped_keys(self, prefix: str) -> Iterable[Tuple[str, float]]:
+        with self._lock:
+            return self._select_prefix(prefix, columns="key, set_at", where="set_at IS NOT NULL").fetchall()
+
+    def flush(self, compact: bool = False) -> None:
+        if compact:
+            with self._lock:
+                self._conn.execute("VACUUM")
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def storage_size(self) -> Optional[int]:
+        paths = [self.path.with_name(self.path.name + suffix) for suffix in ("", "-wal", "-shm")]
+        return sum(p.stat().st_size for p in paths if p.exists())
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM cache LIMIT 1").fetchone() is None
+
+    def migrate_from_json(self, path: Path) -> int:
+        """从 JSON 缓存文件 (及其日志) 导入所有缓存, 返回导入的条目数."""
+        journal = CacheJournal(path, dump=lambda: "", lock=self._lock)
+        data = journal.load()
+        metas = data.pop(META_KEY, {})
+        items = _flatten(data)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, set_at, expire_at) VALUES (?, ?, ?, ?)",
+                [
+                    (k, json.dumps(v, ensure_ascii=False), *metas.get(k, (None, None)))
+                    for k, v in items.items()
+                ],
+            )
+        for p in (path, journal.journal_path):
+            if p.exists():
+                p.replace(p.with_name(p.name + ".migrated"))
+        return len(items)
+
+
+# 默认的命名空间保留策略: 命名空间 => (保留天数, 最大条目数), 可通过配置文件 cache.retention 覆盖.
+# 条目数按命名空间下的直接子键计算, 如 "runinfo.<id>".
+DEFAULT_RETENTION = {
+    "runinfo": (14, 5000),
+    "runinfo.children": (14, None),
+    "runinfo.edges": (14, None),
+    "runinfo.logs": (14, None),
+    "runinfo.index": (14, None),
+    "monitor.pornfans.answer.qa.data": (None, 20000),
+    "link.results.pornemby_answer": (30, 20000),
+    "link.results.terminus_answer": (30, 5000),
+    "link.results.visual": (30, 5000),
+    "link.results.ocr": (7, 2000),
+    "link.similar.visual": (30, 5000),
+}
+
+# MongoDB 缓存的进程内读穿透有效期 (秒): 命名空间 => 有效期, "" 为默认值, 可通过配置文件 cache.memory_ttl 覆盖.
+DEFAULT_MEMORY_TTL = {
+    "": 30,
+    "emby.env": 3600,
+    "emby.credential": 3600,
+    "scheduler": 3600,
+}
+
+
+class Cache:
+    sweep_interval = 600
+
+    def __init__(self):
+        self.backend: CacheBackend = None
+        cache_config = getattr(config, "cache", None)
+        if hasattr(config, "mongodb") and config.mongodb:
+            try:
+                self.backend = self._setup_mongo_cache(cache_config)
+            except ImportError:
+                logger.warning("没有安装 pymongo 包, 将使用本地存储缓存.")
+        if not self.backend:
+            if cache_config and cache_config.backend == "sqlite":
+                self.backend = self._setup_sqlite_cache()
+            else:
+                self.backend = JSONCacheBackend(config.basedir / "cache.json")
+
+        self.retention: Dict[str, Tuple[Optional[float], Optional[int]]] = dict(DEFAULT_RETENTION)
+        if cache_config and cache_config.retention:
+            for ns, policy in cache_config.retention.items():
+                self.retention[ns] = (policy.days, policy.max_entries)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-io")
+        self._pending = 0
+        self._pending_keys: Dict[str, Future] = {}  # 已提交尚未完成的写入: 键 => 最后写入该键的任务
+        self._pending_lock = threading.Lock()
+
+        self._closed = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_worker, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _setup_mongo_cache(self, cache_config):
+        memory = None
+        if not cache_config or cache_config.memory_size:
+            ttls = dict(DEFAULT_MEMORY_TTL)
+            if cache_config and cache_config.memory_ttl:
+                ttls.update(cache_config.memory_ttl)
+            memory = MemoryCache(cache_config.memory_size if cache_config else 4096, ttls)
+        watch = bool(cache_config and cache_config.watch)
+        return MongoCacheBackend(config.mongodb, memory=memory, watch=watch)
+
+    def _setup_sqlite_cache(self):
+        backend = SQLiteCacheBackend(config.basedir / "cache.db")
+        json_file = config.basedir / "cache.json"
+        journal_file = config.basedir / "cache.json.journal"
+        if backend.is_empty() and (json_file.exists() or journal_file.exists()):
+            count = backend.migrate_from_json(json_file)
+            logger.info(f"已将 JSON 缓存迁移至 SQLite 缓存, 共 {count} 条.")
+        return backend
+
+    def _match_policy(self, key: str) -> Optional[str]:
+        """返回键所属的最长保留策略命名空间."""
+        parts = key.split(".")
+        for i in range(len(parts) - 1, 0, -1):
+            ns = ".".join(parts[:i])
+            if ns in self.retention:
+                return ns
+        return None
+
+    def _meta(self, key: str, ttl: Optional[float]) -> Optional[list]:
+        ns = self._match_policy(key)
+        if ttl is None and ns:
+            days = self.retention[ns][0]
+            ttl = days * 86400 if days else None
+        if ttl is None and not ns:
+            return None
+        now = time.time()
+        return [now, now + ttl if ttl else None]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        self._wait_pending([key])
+        return self.backend.get(key, default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """批量获取多个键的缓存, 返回存在的键与值的字典"""
+        keys = list(keys)
+        self._wait_pending(keys)
+        return self.backend.get_many(keys)
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        """设置缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 有效期 (秒), 默认使用所属命名空间的保留策略, 无策略时永久有效
+        """
+        self._wait_pending([key])
+        self.backend.set(key, value, self._meta(key, ttl))
+
+    def set_many(self, items: Dict[str, Any], ttl: float = None) -> None:
+        """批量设置多个键的缓存
+
+        Args:
+            items: 键与值的字典
+            ttl: 有效期 (秒), 默认使用所属命名空间的保留策略
+        """
+        self._wait_pending(items)
+        self.backend.set_many(items, {k: self._meta(k, ttl) for k in items})
+
+    def delete(self, key: str) -> None:
+        self._wait_pending([key])
+        self.backend.delete(key)
+
+    def find_by_prefix(self, prefix: str) -> List[str]:
+        self._wait_pending(prefix=prefix)
+        return self.backend.find_by_prefix(prefix)
+
+    def get_by_prefix(self, prefix: str) -> Dict[str, Any]:
+        """以一次查询获取以 prefix 开头的所有键与值"""
+        self._wait_pending(prefix=prefix)
+        return self.backend.get_by_prefix(prefix)
+
+    def query_by_prefix(self, prefix: str, conditions: List[Tuple[int, str, Any]]) -> Dict[str, Any]:
+        """获取以 prefix 开头且列表值满足所有条件的键与值, 条件在存储端筛选, 参见 CacheBackend.query_by_prefix"""
+        self._wait_pending(prefix=prefix)
+        return self.backend.query_by_prefix(prefix, conditions)
+
+    def delete_by_prefix(self, prefix: str) -> None:
+        self._wait_pending(prefix=prefix)
+        self.backend.delete_by_prefix(prefix)
 
     def delete_many(self, keys: List[str]) -> None:
         """批量删除多个键的缓存
@@ -119,39 +1025,147 @@ class Cache:
         Args:
             keys: 要删除的键列表
         """
-        if self._mongo_client:
-            self._collection.delete_many({"_id": {"$in": keys}})
-        else:
-            # 批量删除所有键, 只写入一次文件
-            changed = False
+        self._wait_pending(keys)
+        self.backend.delete_many(keys)
+
+    def submit(self, func: Callable, *args, keys: Iterable[str] = (), **kw) -> Future:
+        """在缓存 I/O 线程中执行函数, 供同步代码发起无需等待结果的写入或耗时操作.
+
+        keys 为函数写入的键, 之后涉及这些键的同步读写会先等待该写入完成,
+        以保证读到最新的值且不被较早的写入覆盖; 其他同步读写不受影响.
+        """
+        with self._pending_lock:
+            self._pending += 1
+            future = self._executor.submit(func, *args, **kw)
             for key in keys:
-                parts = key.split(".")
-                current = self._data
-                path = []
+                self._pending_keys[key] = future
+        future.add_done_callback(self._submit_done)
+        return future
 
-                # 遍历路径, 检查每一层
-                for part in parts[:-1]:
-                    if not isinstance(current, dict) or part not in current:
-                        break
-                    current = current[part]
-                    path.append((part, current))
-
-                # 检查并删除最后一个键
-                if isinstance(current, dict) and parts[-1] in current:
-                    del current[parts[-1]]
-                    changed = True
-
-                    # 清理空字典
-                    for part, parent in reversed(path):
-                        if isinstance(parent, dict) and part in parent and not parent[part]:
-                            del parent[part]
-                        else:
-                            break
+    def _submit_done(self, future: Future):
+        with self._pending_lock:
+            self._pending -= 1
+            for key in [k for k, f in self._pending_keys.items() if f is future]:
+                del self._pending_keys[key]
+        if future.exception():
+            logger.debug(f"缓存后台写入时发生错误: {future.exception()}.")
+
+    def _wait_pending(self, keys: Iterable[str] = None, prefix: str = None):
+        """等待已提交的涉及 keys 中的键 (含其上下级) 或以 prefix 开头的键的写入完成, 均未指定时等待所有已提交的任务."""
+        if not self._pending or threading.current_thread().name.startswith("cache-io"):
+            return
+        if keys is None and prefix is None:
+            self._executor.submit(lambda: None).result()
+            return
+        keys = list(keys or ())
+        with self._pending_lock:
+            futures = {
+                f
+                for k, f in self._pending_keys.items()
+                if any(k == key or k.startswith(key + ".") or key.startswith(k + ".") for key in keys)
+                or (prefix is not None and (k.startswith(prefix) or prefix.startswith(k + ".")))
+            }
+        if futures:
+            wait(futures)
+
+    async def _run(self, func: Callable, *args):
+        if not self.backend.blocking and not self._pending:
+            return func(*args)
+        return await asyncio.wrap_future(self._executor.submit(func, *args))
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """异步获取缓存, 不阻塞事件循环"""
+        return await self._run(self.backend.get, key, default)
+
+    async def aget_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """异步批量获取多个键的缓存"""
+        return await self._run(self.backend.get_many, list(keys))
+
+    async def aset(self, key: str, value: Any, ttl: float = None) -> None:
+        """异步设置缓存, 参数同 set"""
+        await self._run(self.backend.set, key, value, self._meta(key, ttl))
+
+    async def aset_many(self, items: Dict[str, Any], ttl: float = None) -> None:
+        """异步批量设置多个键的缓存"""
+        await self._run(self.backend.set_many, items, {k: self._meta(k, ttl) for k in items})
+
+    async def adelete(self, key: str) -> None:
+        """异步删除缓存"""
+        await self._run(self.backend.delete, key)
+
+    async def adelete_many(self, keys: List[str]) -> None:
+        """异步批量删除多个键的缓存"""
+        await self._run(self.backend.delete_many, keys)
+
+    async def afind_by_prefix(self, prefix: str) -> List[str]:
+        """异步查找以 prefix 开头的键"""
+        return await self._run(self.backend.find_by_prefix, prefix)
+
+    async def aget_by_prefix(self, prefix: str) -> Dict[str, Any]:
+        """异步获取以 prefix 开头的所有键与值"""
+        return await self._run(self.backend.get_by_prefix, prefix)
+
+    async def aquery_by_prefix(self, prefix: str, conditions: List[Tuple[int, str, Any]]) -> Dict[str, Any]:
+        """异步按条件获取以 prefix 开头的键与值, 参数同 query_by_prefix"""
+        return await self._run(self.backend.query_by_prefix, prefix, conditions)
+
+    def stats(self) -> Optional[Tuple[int, int]]:
+        """返回内存读穿透缓存的命中与未命中次数, 未启用时返回 None"""
+        memory: MemoryCache = getattr(self.backend, "memory", None)
+        if not memory:
+            return None
+        return memory.hits, memory.misses
+
+    def sweep(self) -> int:
+        """清理过期缓存, 并按保留策略删除超出数量限制的最旧条目, 返回删除的条目数"""
+        self._wait_pending()
+        removed = self.backend.expired_keys(time.time())
+        self.backend.delete_many(removed)
+        count = len(removed)
+        for ns, (_, max_entries) in self.retention.items():
+            if not max_entries:
+                continue
+            entries = {}
+            for key, set_at in self.backend.stamped_keys(ns + "."):
+                if self._match_policy(key) != ns:
+                    continue
+                entry = f"{ns}.{key[len(ns) + 1 :].split('.', 1)[0]}"
+                entries[entry] = max(entries.get(entry, 0), set_at)
+            if len(entries) > max_entries:
+                oldest = sorted(entries, key=entries.get)[: len(entries) - max_entries]
+                self.backend.delete_trees(oldest)
+                count += len(oldest)
+        return count
+
+    def _sweep_worker(self):
+        # 清理在缓存 I/O 线程中执行, 与已提交的写入依次进行, 以免删除的记录被较早提交的写入部分重建
+        while not self._closed.wait(self.sweep_interval):
+            try:
+                count = self.submit(self.sweep).result()
+            except Exception as e:
+                logger.debug(f"清理过期缓存时发生错误: {e}.")
+            else:
+                if count:
+                    logger.debug(f"已清理过期缓存, 共 {count} 条.")
+
+    def close(self) -> None:
+        """停止定期清理, 并在已提交的任务完成后关闭缓存 I/O 线程"""
+        self._closed.set()
+        self._executor.shutdown()
+
+    def flush(self, compact: bool = False) -> None:
+        """将待写入内容立即落盘
+
+        Args:
+            compact: 是否同时重写存储以回收空间 (JSON 缓存压缩日志为完整快照, SQLite 缓存执行 VACUUM)
+        """
+        self._wait_pending()
+        self.backend.flush(compact=compact)
 
-            # 只在有改动时写入一次文件
-            if changed:
-                with open(self._cache_file, "w", encoding="utf-8") as f:
-                    json.dump(self._data, f, ensure_ascii=False, indent=2)
+    def storage_size(self) -> Optional[int]:
+        """返回缓存存储占用的字节数, 无法获取时返回 None"""
+        self._wait_pending()
+        return self.backend.storage_size()
 
 
 cache: Cache = CachedFuncProxy(lambda: Cache())
@@ -1,8 +1,20 @@
+import asyncio
+from datetime import datetime
+import json
+from pathlib import Path
+import sqlite3
+import time
+
+from loguru import logger
 from rich.prompt import Prompt
 
 from .cache import cache
+from .utils import vacuum_sqlite
 from .var import console
 
+# 孤立的任务记录在写入后超过该时间 (秒) 才会被清理, 避免误删其他进程中运行中任务的记录
+ORPHAN_GRACE = 86400
+
 
 def get_cache_options():
     """获取缓存清理选项"""
@@ -57,14 +69,147 @@ def clean_cache(cache_key: str = None, cache_prefix: str = None):
             return f"已清理除凭据和配置外所有缓存, 共 {count} 条"
         else:
             # 常规前缀清理
-            keys = cache.find_by_prefix(cache_prefix)
-            count = len(keys)
-            cache.delete_many(keys)
+            count = len(cache.find_by_prefix(cache_prefix))
+            cache.delete_by_prefix(cache_prefix)
             return f"已清理前缀为 {cache_prefix} 的缓存, 共 {count} 条"
 
     return "请指定要清理的缓存键或前缀"
 
 
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{size} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def compact_cache() -> str:
+    """压缩缓存: 清理过期和超出保留策略的条目, 删除超出保留期的已结束任务和孤立的任务记录, 然后重写存储"""
+    from .runinfo import _running_runs, flush_runinfo
+
+    start = time.perf_counter()
+    flush_runinfo()
+    size_before = cache.storage_size()
+
+    # 过期和超出数量限制的条目
+    removed = cache.sweep()
+
+    # 超出保留期的已结束任务 (包括没有元数据的旧版本记录)
+    now = time.time()
+    running = set(_running_runs.copy())
+    days = (cache.retention.get("runinfo") or (None, None))[0]
+    headers = {}
+    for key, value in cache.get_by_prefix("runinfo.").items():
+        run_id = key[len("runinfo.") :]
+        if "." not in run_id:
+            headers[run_id] = value
+    expired = []
+    if days:
+        for run_id, header in headers.items():
+            if run_id in running:
+                continue
+            try:
+                end_time = json.loads(header).get("end_time", None)
+            except (TypeError, ValueError):
+                expired.append(run_id)
+                continue
+            if end_time and datetime.fromisoformat(end_time).timestamp() < now - days * 86400:
+                expired.append(run_id)
+    cache.delete_many([f"runinfo.{run_id}" for run_id in expired])
+    removed += len(expired)
+    alive = (set(headers) - set(expired)) | running
+
+    # 孤立的日志块, 索引和父子关系
+    stamps = {}
+    for ns in ("runinfo.logs.", "runinfo.index.", "runinfo.edges."):
+        stamps.update(cache.backend.stamped_keys(ns))
+    orphans = []
+    for ns in ("runinfo.logs.", "runinfo.index."):
+        for key in cache.find_by_prefix(ns):
+            run_id = key[len(ns) :].split(".", 1)[0]
+            if run_id not in alive and stamps.get(key, 0) < now - ORPHAN_GRACE:
+                orphans.append(key)
+    for key, value in cache.get_by_prefix("runinfo.children.").items():
+        # 旧版本以列表存储的子任务
+        if isinstance(value, list):
+            children = [c for c in value if c in alive]
+            if not children:
+                orphans.append(key)
+            elif len(children) < len(value):
+                cache.set(key, children)
+    for key in cache.find_by_prefix("runinfo.edges."):
+        child = key[len("runinfo.edges.") :].split(".")[-1]
+        if child not in alive and stamps.get(key, 0) < now - ORPHAN_GRACE:
+            orphans.append(key)
+    cache.delete_many(orphans)
+    removed += len(orphans)
+
+    # 重写存储
+    cache.flush(compact=True)
+    size_after = cache.storage_size()
+    elapsed = time.perf_counter() - start
+
+    if size_before is not None and size_after is not None:
+        size_text = f", 回收 {_format_size(size_before - size_after)} ({_format_size(size_after)} 剩余)"
+    else:
+        size_text = ""
+    return f"已压缩缓存, 删除 {removed} 条{size_text}, 耗时 {elapsed:.2f} 秒"
+
+
+async def compactor(interval: float):
+    """每隔 interval 小时压缩缓存, 压缩在缓存 I/O 线程中执行, 与其他缓存读写依次进行"""
+    from .runinfo import flush_runinfo
+
+    while True:
+        await asyncio.sleep(interval * 3600)
+        try:
+            flush_runinfo()
+            result = await asyncio.wrap_future(cache.submit(compact_cache))
+        except Exception as e:
+            logger.warning(f"定期压缩缓存时发生错误: {e}.")
+        else:
+            logger.debug(result)
+
+
+def _sqlite_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in (path, Path(f"{path}-wal")) if p.is_file())
+
+
+def maintain_sessions(basedir: Path = None) -> str:
+    """报告各 Telegram 会话文件的大小, 并回收其中的空闲空间"""
+    from .config import config
+
+    basedir = Path(basedir or config.basedir)
+    lines = []
+    vacuumed_count = before_total = after_total = 0
+    for path in sorted(basedir.glob("*.session")):
+        before = _sqlite_size(path)
+        try:
+            conn = sqlite3.connect(str(path), timeout=1)
+            try:
+                vacuumed = vacuum_sqlite(conn, ratio=0)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            lines.append(f"{path.name}: {_format_size(before)}, 无法整理 ({e})")
+            after = before
+        else:
+            after = _sqlite_size(path)
+            state = f"-> {_format_size(after)}" if vacuumed else "(无空闲空间)"
+            lines.append(f"{path.name}: {_format_size(before)} {state}")
+            vacuumed_count += vacuumed
+        before_total += before
+        after_total += after
+    if not lines:
+        return f"未找到会话文件: {basedir}"
+    lines.append(
+        f"已整理 {vacuumed_count}/{len(lines)} 个会话文件, 回收 {_format_size(before_total - after_total)} "
+        f"({_format_size(after_total)} 剩余)"
+    )
+    return "\n".join(lines)
+
+
 async def cleaner():
     options = get_cache_options()
     console.rule("缓存文件清理")
@@ -330,6 +330,18 @@ async def main(
         rich_help_panel="调试工具",
         help="显示或清理 Emby 模拟设备和登陆凭据等缓存",
     ),
+    compact_cache: bool = typer.Option(
+        False,
+        "--compact-cache",
+        rich_help_panel="调试工具",
+        help="清理过期的任务记录并压缩缓存存储",
+    ),
+    maintain_sessions: bool = typer.Option(
+        False,
+        "--maintain-sessions",
+        rich_help_panel="调试工具",
+        help="显示 Telegram 会话文件大小并回收空闲空间",
+    ),
 ):
     from .log import initialize, apply_logging_adapter
 
@@ -438,6 +450,20 @@ async def main(
 
         return await cleaner()
 
+    if compact_cache:
+        from .cache import cache
+        from .clean import compact_cache as compact
+
+        logger.info(await asyncio.wrap_future(cache.submit(compact)))
+        return
+
+    if maintain_sessions:
+        from .clean import maintain_sessions as maintain
+
+        for line in (await asyncio.to_thread(maintain)).splitlines():
+            logger.info(line)
+        return
+
     if follow:
         from .telegram.debug import follower
 
@@ -483,6 +509,7 @@ async def main(
 
         return await debug_notifier()
 
+    compact_task = None
     try:
         checkin_man = None
         if checkiner:
@@ -544,6 +571,10 @@ async def main(
 
             streams = await start_notifier()
         if not once:
+            if config.cache and config.cache.compact_interval:
+                from .clean import compactor
+
+                compact_task = asyncio.create_task(compactor(config.cache.compact_interval))
             if checkin_man:
                 pool.add(checkin_man.schedule_all(), "站点签到")
             if register_man:
@@ -576,6 +607,9 @@ async def main(
             if streams:
                 await asyncio.gather(*[stream.join() for stream in streams])
     finally:
+        if compact_task:
+            compact_task.cancel()
+
         from .runinfo import RunContext
 
         RunContext.cancel_all()
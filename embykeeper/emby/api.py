@@ -61,6 +61,7 @@ class Emby:
         self._env = None
         self._token = None
         self._user_id = None
+        self._cache_loaded = False
 
         self.run_id = str(uuid.uuid4()).upper()
         self.cf_clearance = None
@@ -97,14 +98,27 @@ class Emby:
             self._load_credentials()
         return self._user_id
 
-    def _load_credentials(self):
-        data: dict = cache.get(f"emby.credential.{self.hostname}.{self.a.username}", {})
+    def _load_credentials(self, data: dict = None):
+        if data is None:
+            data = cache.get(f"emby.credential.{self.hostname}.{self.a.username}", {})
         self._token = data.get("token", None)
         self._user_id = data.get("userid", None)
 
-    def _load_env(self):
+    async def _aload_cache(self):
+        """预加载缓存的凭据和环境, 缓存读取不阻塞事件循环"""
+        credential_key = f"emby.credential.{self.hostname}.{self.a.username}"
+        env_key = f"emby.env.{self.hostname}.{self.a.username}"
+        data = await cache.aget_many([credential_key, env_key])
+        if not self._token:
+            self._load_credentials(data.get(credential_key, {}))
+        if not self._env:
+            self._load_env(data.get(env_key, {}))
+        self._cache_loaded = True
+
+    def _load_env(self, data: dict = None):
         cache_key = f"emby.env.{self.hostname}.{self.a.username}"
-        data: dict = cache.get(cache_key, {})
+        if data is None:
+            data = cache.get(cache_key, {})
         if data:
             # 检查用户配置是否与缓存一致
             should_clear = False
@@ -245,6 +259,8 @@ class Emby:
         )
 
     async def _request(self, method: str, path: str, _login=False, **kw) -> Response:
+        if not self._cache_loaded:
+            await self._aload_cache()
 
         if path.startswith(("http://", "https://")):
             url = path
@@ -360,7 +376,7 @@ class Emby:
                 "token": self.token,
                 "userid": self.user_id,
             }
-            cache.set(f"emby.credential.{self.hostname}.{self.a.username}", cache_data)
+            await cache.aset(f"emby.credential.{self.hostname}.{self.a.username}", cache_data)
             return self.token
 
     async def play(self, item: Union[dict, int], time: float = 10):
@@ -2,23 +2,50 @@ from __future__ import annotations
 
 from asyncio import Event
 import asyncio
+from collections import deque
 from datetime import datetime
 from enum import IntEnum, auto
-from typing import TYPE_CHECKING, Callable, Dict, List
+import json
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 import random
 import string
 from loguru import logger
 
 from rich.text import Text
-from pydantic import BaseModel, PrivateAttr
+from pydantic import BaseModel, Field, GetCoreSchemaHandler, PrivateAttr
+from pydantic_core import core_schema
 
 from .utils import to_iterable
-from .cache import cache
+from .cache import cache, match_conditions
 
 if TYPE_CHECKING:
     from loguru import Logger
 
 _running_runs: Dict[str, RunContext] = {}
+_sink_id: int = None
+
+# 等待批量写入缓存的 runinfo 键值, 在任务结束等时机统一写入
+_pending_writes: Dict[str, Any] = {}
+_pending_lock = threading.Lock()
+
+
+def flush_runinfo():
+    """将等待写入的任务记录批量提交到缓存 I/O 线程"""
+    with _pending_lock:
+        if not _pending_writes:
+            return
+        items = dict(_pending_writes)
+        _pending_writes.clear()
+    cache.submit(cache.set_many, items, keys=items)
+
+
+def _log_sink(message):
+    """将带有 run_id 的日志分发到对应的运行中任务"""
+    record = message.record
+    run = _running_runs.get(record["extra"].get("run_id"), None)
+    if run:
+        run.log.add(record["level"].name.upper(), record["message"], record["time"])
 
 
 class RunStatus(IntEnum):
@@ -42,23 +69,101 @@ class LogRecord(BaseModel):
     time: datetime
 
 
+class LogBuffer:
+    """任务日志的有界环形缓冲区.
+
+    记录以 (等级, 消息, 时间) 元组存储, 超出容量时丢弃最旧的记录, 迭代时才构造 LogRecord.
+    """
+
+    __slots__ = ("_records", "total")
+
+    capacity = 1000
+
+    def __init__(self, records: Iterable[Union[LogRecord, tuple]] = (), capacity: int = None):
+        self._records: deque[Tuple[str, str, datetime]] = deque(maxlen=capacity or self.capacity)
+        self.total = 0  # 累计写入的记录数, 包括已被丢弃的记录
+        for record in records:
+            self.append(record)
+
+    def add(self, level: str, message: str, time: datetime):
+        self._records.append((level, message, time))
+        self.total += 1
+
+    def append(self, record: Union[LogRecord, tuple]):
+        if isinstance(record, LogRecord):
+            record = (record.level, record.message, record.time)
+        self._records.append(tuple(record))
+        self.total += 1
+
+    def extend(self, records: Iterable[Union[LogRecord, tuple]]):
+        for record in records:
+            self.append(record)
+
+    def records(self) -> List[Tuple[str, str, datetime]]:
+        """返回原始记录元组的列表"""
+        return list(self._records)
+
+    def since(self, total: int) -> List[Tuple[str, str, datetime]]:
+        """返回累计记录数为 total 之后新写入且仍保留的记录"""
+        count = min(self.total - total, len(self._records))
+        if count <= 0:
+            return []
+        return list(self._records)[-count:]
+
+    def copy(self) -> List[LogRecord]:
+        return list(self)
+
+    @property
+    def maxlen(self) -> int:
+        return self._records.maxlen
+
+    def __iter__(self):
+        for level, message, time in self._records:
+            yield LogRecord(level=level, message=message, time=time)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __repr__(self):
+        return f"LogBuffer({len(self._records)}/{self._records.maxlen})"
+
+    @classmethod
+    def _validate(cls, value: Any) -> "LogBuffer":
+        if isinstance(value, LogBuffer):
+            return value
+        return cls(LogRecord.model_validate(r) if isinstance(r, dict) else r for r in value)
+
+    def _serialize(self) -> List[dict]:
+        return [{"level": level, "message": message, "time": time} for level, message, time in self._records]
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler):
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(cls._serialize),
+        )
+
+
 class RunContext(BaseModel):
     _finished: Event = PrivateAttr(default_factory=Event)
     _started: Event = PrivateAttr(default_factory=Event)
     _cancel: Callable = PrivateAttr(default=None)
-    _handler_id: int = PrivateAttr(default=None)
+    _log_saved: int = PrivateAttr(default=0)
+    _log_chunks: int = PrivateAttr(default=0)
 
     id: str
     parent_ids: List[str] = []
-    description: str = None
+    description: Optional[str] = None
+    account: Optional[str] = None
+    site: Optional[str] = None
     status: RunStatus = RunStatus.PENDING
-    status_info: str = None
-    log: List[LogRecord] = []
-    duration: float = None
-    start_time: datetime = None
-    end_time: datetime = None
-    next_time: datetime = None
-    reschedule: int = None
+    status_info: Optional[str] = None
+    log: LogBuffer = Field(default_factory=LogBuffer)
+    duration: Optional[float] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    next_time: Optional[datetime] = None
+    reschedule: Optional[int] = None
 
     def start(self, status: RunStatus = RunStatus.RUNNING):
         """开始任务, 设置开始时间和状态"""
@@ -71,9 +176,7 @@ class RunContext(BaseModel):
 
         if status:
             self.status = status
-            self.log.append(
-                LogRecord(level="DEBUG", message=f"任务状态已设置为 {status.name}", time=datetime.now())
-            )
+            self.log.add("DEBUG", f"任务状态已设置为 {status.name}", datetime.now())
 
     def finish(self, status: RunStatus = None, status_info: str = None):
         """完成任务, 记录状态和时间, 并保存到缓存"""
@@ -88,28 +191,48 @@ class RunContext(BaseModel):
         if self.start_time:
             self.duration = (self.end_time - self.start_time).total_seconds()
 
-        # 从运行中任务列表移除
+        # 从运行中任务列表移除, 之后的日志不再记录到该任务
         if self.id in _running_runs:
             del _running_runs[self.id]
 
         # 设置完成事件
         self._finished.set()
 
-        # 移除logger handler
-        if self._handler_id is not None:
-            try:
-                logger.remove(self._handler_id)
-            except ValueError:
-                pass
-
         # 保存到缓存
         self.save()
 
         return self
 
     def save(self):
-        """保存当前任务到缓存"""
-        cache.set(f"runinfo.{self.id}", self.model_dump_json())
+        """保存当前任务到缓存, 写入在缓存 I/O 线程中进行, 不阻塞事件循环
+
+        任务记录分为不含日志的头部 "runinfo.<id>" 与仅追加的日志块 "runinfo.logs.<id>.<n>",
+        每次保存仅写入头部和上次保存后新增的日志. 同时写入用于 query 的索引 "runinfo.index.<id>".
+        """
+        with _pending_lock:
+            new_logs = self.log.since(self._log_saved)
+            if new_logs:
+                _pending_writes[f"runinfo.logs.{self.id}.{self._log_chunks}"] = [
+                    [level, message, time.isoformat() if time else None] for level, message, time in new_logs
+                ]
+                self._log_chunks += 1
+            self._log_saved = self.log.total
+            header = self.model_dump(mode="json", exclude={"log"})
+            header["log_chunks"] = self._log_chunks
+            _pending_writes[f"runinfo.{self.id}"] = json.dumps(header, ensure_ascii=False)
+            _pending_writes[f"runinfo.index.{self.id}"] = self._index_entry()
+        flush_runinfo()
+
+    def _index_entry(self) -> list:
+        """索引条目: [开始时间戳, 状态, 账号, 站点, 父任务 ID 列表]"""
+        start_time = self.start_time or self.end_time
+        return [
+            start_time.timestamp() if start_time else None,
+            int(self.status),
+            self.account,
+            self.site,
+            list(self.parent_ids),
+        ]
 
     @classmethod
     def cancel_all(cls):
@@ -118,112 +241,311 @@ class RunContext(BaseModel):
             run.cancel_tree()
             if run.status != RunStatus.CATAGORY:
                 run.finish(RunStatus.CANCELLED, "任务被取消")
+        flush_runinfo()
 
     def bind_logger(self, logger: Logger):
         """将 loguru logger 绑定到当前任务"""
         return logger.bind(run_id=self.id)
 
     @classmethod
-    def prepare(cls, description: str = None, parent_ids: List[str] = None):
-        """生成一个新的任务上下文"""
+    def prepare(
+        cls,
+        description: str = None,
+        parent_ids: List[str] = None,
+        log_capacity: int = None,
+        account: str = None,
+        site: str = None,
+    ):
+        """生成一个新的任务上下文
+
+        Args:
+            description: 任务描述
+            parent_ids: 父任务 ID 列表
+            log_capacity: 保留的最大日志条数, 默认为 LogBuffer.capacity
+            account: 任务所属账号, 默认继承自运行中的父任务, 用于 query 查询
+            site: 任务所属站点, 默认继承自运行中的父任务, 用于 query 查询
+        """
+        global _sink_id
 
         # 生成随机6位ID (大写字母和数字) 的运行时
         chars = string.ascii_uppercase + string.digits
         run_id = "".join(random.choices(chars, k=6))
-        run = cls(id=run_id, parent_ids=to_iterable(parent_ids))
+        run = cls(id=run_id, parent_ids=to_iterable(parent_ids), log=LogBuffer(capacity=log_capacity))
         run.description = description
+        for parent_id in run.parent_ids:
+            parent = _running_runs.get(parent_id, None)
+            if parent:
+                account = account or parent.account
+                site = site or parent.site
+        run.account = account
+        run.site = site
 
-        # 设置对 loguru 的监控
-        def log_sink(message):
-            record = message.record
-            if record["extra"].get("run_id") == run_id:
-                log_record = LogRecord(
-                    level=record["level"].name.upper(),
-                    message=record["message"],
-                    time=record["time"],
-                )
-                run.log.append(log_record)
-
-        # 添加日志处理器
-        run._handler_id = logger.add(log_sink, filter=lambda record: "run_id" in record["extra"])
+        # 所有任务共用一个日志处理器, 按 run_id 分发到运行中任务
+        if _sink_id is None:
+            _sink_id = logger.add(_log_sink, filter=lambda record: "run_id" in record["extra"])
 
         # 添加到运行中任务列表
         _running_runs[run_id] = run
 
-        # 如果有父任务, 记录父子关系
+        # 如果有父任务, 记录父子关系, 每条关系为独立的键 "runinfo.edges.<父任务>.<子任务>", 值为创建时间.
+        # 旧版本的 "runinfo.children.<父任务>" 列表仍然保留并读取, 因此关系不能写在其下级.
         if parent_ids:
-            for parent_id in parent_ids:
-                children = cache.get(f"runinfo.children.{parent_id}", [])
-                if run_id not in children:
-                    children.append(run_id)
-                    cache.set(f"runinfo.children.{parent_id}", children)
+            created = datetime.now().timestamp()
+            with _pending_lock:
+                for parent_id in parent_ids:
+                    _pending_writes[f"runinfo.edges.{parent_id}.{run_id}"] = created
 
         return run
 
+    @staticmethod
+    def _merge_children(run_id: str, legacy: Any, edges: Dict[str, Any]) -> List[str]:
+        # 兼容旧版本以列表存储的子任务
+        if not isinstance(legacy, list):
+            legacy = []
+        prefix = f"runinfo.edges.{run_id}."
+        ordered = sorted(
+            (v if isinstance(v, (int, float)) else 0, k[len(prefix) :]) for k, v in edges.items()
+        )
+        return legacy + [c for _, c in ordered if c not in legacy]
+
+    @classmethod
+    def _child_ids(cls, run_id: str) -> List[str]:
+        flush_runinfo()
+        legacy = cache.get(f"runinfo.children.{run_id}", None)
+        return cls._merge_children(run_id, legacy, cache.get_by_prefix(f"runinfo.edges.{run_id}."))
+
+    @classmethod
+    async def _achild_ids(cls, run_id: str) -> List[str]:
+        flush_runinfo()
+        legacy = await cache.aget(f"runinfo.children.{run_id}", None)
+        return cls._merge_children(run_id, legacy, await cache.aget_by_prefix(f"runinfo.edges.{run_id}."))
+
+    @staticmethod
+    def _split_running(run_ids: Iterable[str]) -> Tuple[Dict[str, RunContext], List[str]]:
+        """返回运行中的任务与需要从缓存读取的任务 ID"""
+        runs = {}
+        missing = []
+        for run_id in run_ids:
+            if run_id in _running_runs:
+                runs[run_id] = _running_runs[run_id]
+            else:
+                missing.append(run_id)
+        return runs, missing
+
+    @classmethod
+    def _parse_headers(cls, runs: Dict[str, RunContext], missing: List[str], headers: Dict[str, Any]):
+        """解析任务头部并加入 runs, 返回需要读取的日志块键, 值为 None 表示旧版本记录需按前缀查找"""
+        chunk_keys = {}
+        for run_id in missing:
+            header = headers.get(f"runinfo.{run_id}", None)
+            if not header:
+                continue
+            data = json.loads(header)
+            log_chunks = data.pop("log_chunks", None)
+            run = runs[run_id] = cls.model_validate(data)
+            if len(run.log):
+                continue
+            if log_chunks is None:
+                chunk_keys[run_id] = None
+            else:
+                chunk_keys[run_id] = [f"runinfo.logs.{run_id}.{n}" for n in range(log_chunks)]
+        return chunk_keys
+
+    @staticmethod
+    def _attach_logs(runs: Dict[str, RunContext], chunk_keys: Dict[str, List[str]], chunks: Dict[str, Any]):
+        for run_id, keys in chunk_keys.items():
+            run = runs[run_id]
+            for key in sorted(keys, key=lambda k: int(k.rsplit(".", 1)[1])):
+                for level, message, time in chunks.get(key, ()):
+                    run.log.add(level, message, datetime.fromisoformat(time) if time else None)
+            run._log_saved = run.log.total
+            run._log_chunks = len(keys)
+
+    @classmethod
+    def _load_many(cls, run_ids: Iterable[str]) -> Dict[str, RunContext]:
+        """批量获取任务, 以一次读取获取所有头部, 一次读取获取所有日志块"""
+        runs, missing = cls._split_running(run_ids)
+        if not missing:
+            return runs
+        flush_runinfo()
+        headers = cache.get_many([f"runinfo.{run_id}" for run_id in missing])
+        chunk_keys = cls._parse_headers(runs, missing, headers)
+        for run_id, keys in chunk_keys.items():
+            if keys is None:
+                chunk_keys[run_id] = cache.find_by_prefix(f"runinfo.logs.{run_id}.")
+        cls._attach_logs(runs, chunk_keys, cache.get_many([k for keys in chunk_keys.values() for k in keys]))
+        return runs
+
+    @classmethod
+    async def _aload_many(cls, run_ids: Iterable[str]) -> Dict[str, RunContext]:
+        """异步批量获取任务, 参见 _load_many"""
+        runs, missing = cls._split_running(run_ids)
+        if not missing:
+            return runs
+        flush_runinfo()
+        headers = await cache.aget_many([f"runinfo.{run_id}" for run_id in missing])
+        chunk_keys = cls._parse_headers(runs, missing, headers)
+        for run_id, keys in chunk_keys.items():
+            if keys is None:
+                chunk_keys[run_id] = await cache.afind_by_prefix(f"runinfo.logs.{run_id}.")
+        chunks = await cache.aget_many([k for keys in chunk_keys.values() for k in keys])
+        cls._attach_logs(runs, chunk_keys, chunks)
+        return runs
+
     @classmethod
     def get(cls, run_id: str) -> "RunContext":
-        # 优先从运行中任务获取
-        if run_id in _running_runs:
-            return _running_runs[run_id]
+        return cls._load_many([run_id]).get(run_id, None)
+
+    @classmethod
+    async def aget(cls, run_id: str) -> "RunContext":
+        """异步获取任务, 不阻塞事件循环"""
+        return (await cls._aload_many([run_id])).get(run_id, None)
+
+    @staticmethod
+    def _query_conditions(
+        since: datetime = None,
+        until: datetime = None,
+        status: Union[RunStatus, Iterable[RunStatus]] = None,
+        account: str = None,
+        site: str = None,
+        parent_id: str = None,
+    ) -> List[Tuple[int, str, Any]]:
+        # 索引条目: [开始时间戳, 状态, 账号, 站点, 父任务 ID 列表]
+        conditions = []
+        if status is not None:
+            conditions.append((1, "in", sorted({int(s) for s in to_iterable(status)})))
+        if account is not None:
+            conditions.append((2, "==", account))
+        if site is not None:
+            conditions.append((3, "==", site))
+        if parent_id is not None:
+            conditions.append((4, "has", parent_id))
+        if since:
+            conditions.append((0, ">=", since.timestamp()))
+        if until:
+            conditions.append((0, "<", until.timestamp()))
+        return conditions
+
+    @staticmethod
+    def _query_page(stored: Dict[str, list], conditions, limit: int, offset: int, reverse: bool) -> List[str]:
+        """合并运行中任务的索引条目, 按开始时间排序并分页, 返回任务 ID 列表"""
+        prefix = "runinfo.index."
+        entries = {k[len(prefix) :]: v for k, v in stored.items()}
+        # 运行中的任务尚未写入索引
+        for run_id, run in list(_running_runs.items()):
+            entry = run._index_entry()
+            if match_conditions(entry, conditions):
+                entries[run_id] = entry
+            else:
+                entries.pop(run_id, None)
+        matched = sorted(((entry[0] or 0, run_id) for run_id, entry in entries.items()), reverse=reverse)
+        return [run_id for _, run_id in matched[offset : offset + limit]]
 
-        # 从缓存加载
-        run_json = cache.get(f"runinfo.{run_id}")
-        if run_json:
-            return cls.model_validate_json(run_json)
-        return None
+    @classmethod
+    def query(
+        cls,
+        since: datetime = None,
+        until: datetime = None,
+        status: Union[RunStatus, Iterable[RunStatus]] = None,
+        account: str = None,
+        site: str = None,
+        parent_id: str = None,
+        limit: int = 50,
+        offset: int = 0,
+        reverse: bool = True,
+    ) -> List[RunContext]:
+        """按条件查询任务, 条件在存储端对索引筛选, 按开始时间排序并分页
+
+        Args:
+            since: 开始时间不早于该时间
+            until: 开始时间早于该时间
+            status: 任务状态或状态列表
+            account: 所属账号
+            site: 所属站点
+            parent_id: 父任务 ID
+            limit: 每页数量
+            offset: 跳过的数量
+            reverse: 是否按时间倒序 (最新的在前)
+        """
+        flush_runinfo()
+        conditions = cls._query_conditions(since, until, status, account, site, parent_id)
+        stored = cache.query_by_prefix("runinfo.index.", conditions)
+        page = cls._query_page(stored, conditions, limit, offset, reverse)
+        runs = cls._load_many(page)
+        return [runs[run_id] for run_id in page if run_id in runs]
+
+    @classmethod
+    async def aquery(
+        cls,
+        since: datetime = None,
+        until: datetime = None,
+        status: Union[RunStatus, Iterable[RunStatus]] = None,
+        account: str = None,
+        site: str = None,
+        parent_id: str = None,
+        limit: int = 50,
+        offset: int = 0,
+        reverse: bool = True,
+    ) -> List[RunContext]:
+        """异步按条件查询任务, 参数同 query"""
+        flush_runinfo()
+        conditions = cls._query_conditions(since, until, status, account, site, parent_id)
+        stored = await cache.aquery_by_prefix("runinfo.index.", conditions)
+        page = cls._query_page(stored, conditions, limit, offset, reverse)
+        runs = await cls._aload_many(page)
+        return [runs[run_id] for run_id in page if run_id in runs]
 
     def get_parents(self):
         """获取所有父任务"""
-        parents = []
-        for parent_id in self.parent_ids:
-            parent = RunContext.get(parent_id)
-            if parent:
-                parents.append(parent)
-        return parents
+        runs = RunContext._load_many(self.parent_ids)
+        return [runs[i] for i in self.parent_ids if i in runs]
+
+    async def aget_parents(self):
+        """异步获取所有父任务"""
+        runs = await RunContext._aload_many(self.parent_ids)
+        return [runs[i] for i in self.parent_ids if i in runs]
 
     def get_children(self):
         """获取所有子任务"""
-        children = []
-        child_ids = cache.get(f"runinfo.children.{self.id}", [])
-        for child_id in child_ids:
-            child = RunContext.get(child_id)
-            if child:
-                children.append(child)
-        return children
+        child_ids = self._child_ids(self.id)
+        runs = RunContext._load_many(child_ids)
+        return [runs[i] for i in child_ids if i in runs]
+
+    async def aget_children(self):
+        """异步获取所有子任务"""
+        child_ids = await self._achild_ids(self.id)
+        runs = await RunContext._aload_many(child_ids)
+        return [runs[i] for i in child_ids if i in runs]
 
     def yield_logs(self, reverse: bool = False, include_children: bool = False):
         """按时间顺序产出日志记录"""
-        logs = self.log.copy()
+        logs = self.log.records()
 
         if include_children:
             for child in self.get_children():
-                logs.extend(child.log)
+                logs.extend(child.log.records())
 
         # 确保所有日志都有时间戳
-        for log in logs:
-            if log.time is None:
-                log.time = datetime.now()
+        now = datetime.now()
+        logs = [(level, message, time or now) for level, message, time in logs]
 
         # 按时间排序
-        logs.sort(key=lambda x: x.time, reverse=reverse)
-        yield from logs
+        logs.sort(key=lambda x: x[2], reverse=reverse)
+        for level, message, time in logs:
+            yield LogRecord(level=level, message=message, time=time)
 
     def log_sink(self, message):
         record = message.record
         if record["extra"].get("run_id") == self.id:
-            log_record = LogRecord(
-                level=record["level"].name.upper(),
-                message=Text(record["message"]).plain,
-                time=record["time"],
-            )
-            self.log.append(log_record)
+            self.log.add(record["level"].name.upper(), Text(record["message"]).plain, record["time"])
 
     @classmethod
-    def run(cls, func: Callable, description: str = None, parent_ids: List[str] = None):
+    def run(cls, func: Callable, description: str = None, parent_ids: List[str] = None, **kw):
         async def runner():
             ctx = RunContext.prepare(
                 description=description or func.__name__,
                 parent_ids=parent_ids,
+                **kw,
             )
             task = asyncio.create_task(func(ctx))
             ctx._cancel = task.cancel
@@ -240,12 +562,7 @@ class RunContext(BaseModel):
 
     def get_running_children(self):
         """获取所有正在运行的子任务"""
-        children = []
-        child_ids = cache.get(f"runinfo.children.{self.id}", [])
-        for child_id in child_ids:
-            if child_id in _running_runs:
-                children.append(_running_runs[child_id])
-        return children
+        return [run for run in list(_running_runs.values()) if self.id in run.parent_ids]
 
     def cancel_tree(self):
         """取消当前任务及其所有运行中的子任务"""
@@ -265,6 +582,7 @@ class RunContext(BaseModel):
         description: str = None,
         parent_ids: List[str] = None,
         status: RunStatus = RunStatus.CATAGORY,
+        **kw,
     ):
         """获取现有任务或创建新任务"""
 
@@ -272,7 +590,27 @@ class RunContext(BaseModel):
             existing = cls.get(run_id)
             if existing:
                 return existing
-        ctx = cls.prepare(description=description, parent_ids=parent_ids)
+        ctx = cls.prepare(description=description, parent_ids=parent_ids, **kw)
+        if status:
+            ctx.set(status)
+        return ctx
+
+    @classmethod
+    async def aget_or_create(
+        cls,
+        run_id: str = None,
+        description: str = None,
+        parent_ids: List[str] = None,
+        status: RunStatus = RunStatus.CATAGORY,
+        **kw,
+    ):
+        """异步获取现有任务或创建新任务, 参见 get_or_create"""
+
+        if run_id:
+            existing = await cls.aget(run_id)
+            if existing:
+                return existing
+        ctx = cls.prepare(description=description, parent_ids=parent_ids, **kw)
         if status:
             ctx.set(status)
         return ctx
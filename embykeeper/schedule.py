@@ -119,51 +119,60 @@ class Scheduler:
             self._next_time = self._get_next_time()
         return self._next_time
 
+    def _resolve_next_time(self, cached: dict):
+        """根据缓存内容计算下一次执行时间, 返回执行时间与需要写入缓存的内容 (无需写入时为 None)"""
+        now = datetime.now()
+
+        # Check if config hash matches and time hasn't passed
+        if cached:
+            cached_config_hash = cached.get("config_hash")
+            cached_time = cached.get("next_time")
+            if (
+                cached_config_hash == self._get_scheduler_config()
+                and cached_time
+                and parser.parse(cached_time) > now
+            ):
+                return parser.parse(cached_time), None
+
+        # Calculate interval days
+        if isinstance(self.days, (list, tuple)):
+            interval = self.days[0] + (self.days[1] - self.days[0])
+        else:
+            interval = self.days
+
+        next_time = next_random_datetime(
+            start_time=self.start_time, end_time=self.end_time, interval_days=interval
+        )
+        if not self._cache_key:
+            return next_time, None
+        data = {
+            "config_hash": self._get_scheduler_config(),
+            "next_time": next_time.isoformat(),
+            "description": self.description,
+        }
+        return next_time, data
+
+    def _cache_ttl(self, next_time: datetime):
+        return (next_time - datetime.now()).total_seconds() + 86400
+
     def _get_next_time(self) -> datetime:
         """计算或获取缓存的下一次执行时间"""
         from .cache import cache
 
-        now = datetime.now()
-        next_time = None
-
-        # Try to get cached next execution time
-        if self._cache_key:
-            cached = cache.get(self._cache_key)
-            if cached:
-                cached_config_hash = cached.get("config_hash")
-                cached_time = cached.get("next_time")
-
-                # Check if config hash matches and time hasn't passed
-                if (
-                    cached_config_hash == self._get_scheduler_config()
-                    and cached_time
-                    and parser.parse(cached_time) > now
-                ):
-                    next_time = parser.parse(cached_time)
-
-        # Calculate new next_time if needed
-        if not next_time:
-            # Calculate interval days
-            if isinstance(self.days, (list, tuple)):
-                interval = self.days[0] + (self.days[1] - self.days[0])
-            else:
-                interval = self.days
-
-            next_time = next_random_datetime(
-                start_time=self.start_time, end_time=self.end_time, interval_days=interval
-            )
-
-            # Cache the next execution time with config hash
-            if self._cache_key:
-                cache.set(
-                    self._cache_key,
-                    {
-                        "config_hash": self._get_scheduler_config(),
-                        "next_time": next_time.isoformat(),
-                        "description": self.description,
-                    },
-                )
+        cached = cache.get(self._cache_key) if self._cache_key else None
+        next_time, data = self._resolve_next_time(cached)
+        if data:
+            cache.set(self._cache_key, data, ttl=self._cache_ttl(next_time))
+        return next_time
 
+    async def _aget_next_time(self) -> datetime:
+        """计算或获取缓存的下一次执行时间, 缓存读写不阻塞事件循环"""
+        from .cache import cache
+
+        cached = await cache.aget(self._cache_key) if self._cache_key else None
+        next_time, data = self._resolve_next_time(cached)
+        if data:
+            await cache.aset(self._cache_key, data, ttl=self._cache_ttl(next_time))
         return next_time
 
     async def schedule(self):
@@ -172,7 +181,7 @@ class Scheduler:
 
         while True:
             now = datetime.now()
-            self._next_time = self._get_next_time()
+            self._next_time = await self._aget_next_time()
 
             # Call the hook function if provided
             if self.on_next_time:
@@ -206,7 +215,7 @@ class Scheduler:
 
             if self._cache_key:
                 try:
-                    cache.delete(self._cache_key)
+                    await cache.adelete(self._cache_key)
                 except KeyError:
                     pass
             self._ctx = None
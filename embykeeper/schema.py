@@ -106,6 +106,20 @@ class NotifierConfig(ConfigModel):
     apprise_uri: Optional[str] = None
 
 
+class CacheRetentionConfig(ConfigModel):
+    days: Optional[float] = None
+    max_entries: Optional[int] = Field(None, gt=0)
+
+
+class CacheConfig(ConfigModel):
+    backend: Optional[str] = Field("json", pattern="^(json|sqlite)$")
+    retention: Optional[Dict[str, CacheRetentionConfig]] = {}
+    memory_size: Optional[int] = Field(4096, ge=0)
+    memory_ttl: Optional[Dict[str, float]] = {}
+    watch: Optional[bool] = False
+    compact_interval: Optional[float] = Field(24, ge=0)
+
+
 class SiteConfig(ConfigModel):
     checkiner: Optional[List[str]] = None
     monitor: Optional[List[str]] = None
@@ -198,6 +212,7 @@ class TelegramAccount(ConfigModel):
     api_hash: Optional[str] = None
     session: Optional[str] = None
     enabled: Optional[bool] = True
+    idle_timeout: Optional[int] = 120  # 账号空闲 (无任务使用) 多少秒后断开连接
 
     # 账号单独配置
     site: Optional[SiteConfig] = None
@@ -221,6 +236,8 @@ class TelegramAccount(ConfigModel):
 class TelegramConfig(ConfigModel):
     account: Optional[List[TelegramAccount]] = []
     use_proxy: Optional[bool] = True
+    login_concurrency: Optional[int] = 5  # 同时登录的账号数量上限
+    auth_expiry: Optional[int] = 86400  # 云服务认证结果的缓存时间 (秒), 0 为不缓存
 
 
 class BotConfig(ConfigModel):
@@ -244,6 +261,7 @@ class Config(ConfigModel):
     }
 
     mongodb: Optional[str] = None
+    cache: Optional[CacheConfig] = CacheConfig()
     basedir: Optional[str] = None
     nofail: Optional[bool] = True
     noexit: Optional[bool] = False
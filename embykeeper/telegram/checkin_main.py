@@ -128,8 +128,10 @@ class CheckinerManager:
                 f"下一次 \"{phone_masked}\" 账号 {site_name} 站点的签到将在 {t.strftime('%m-%d %H:%M %p')} 进行."
             )
             date_ctx = RunContext.get_or_create(f"checkiner.date.{t.strftime('%Y%m%d')}")
-            account_ctx = RunContext.get_or_create(f"checkiner.account.{account.phone}")
-            site_ctx = RunContext.get_or_create(f"checkiner.site.{site_name}")
+            account_ctx = RunContext.get_or_create(
+                f"checkiner.account.{account.phone}", account=account.phone
+            )
+            site_ctx = RunContext.get_or_create(f"checkiner.site.{site_name}", site=site_name)
             return RunContext.prepare(
                 description=f"{account.phone} 账号 {site_name} 站点签到",
                 parent_ids=[account_ctx.id, date_ctx.id, site_ctx.id],
@@ -167,7 +169,9 @@ class CheckinerManager:
             phone_masked = TelegramAccount.get_phone_masked(account.phone)
             logger.info(f"下一次 \"{phone_masked}\" 账号的签到将在 {t.strftime('%m-%d %H:%M %p')} 进行.")
             date_ctx = RunContext.get_or_create(f"checkiner.date.{t.strftime('%Y%m%d')}")
-            account_ctx = RunContext.get_or_create(f"checkiner.account.{account.phone}")
+            account_ctx = RunContext.get_or_create(
+                f"checkiner.account.{account.phone}", account=account.phone
+            )
             return RunContext.prepare(
                 description=f"{account.phone} 账号签到",
                 parent_ids=[account_ctx.id, date_ctx.id],
@@ -211,14 +215,18 @@ class CheckinerManager:
         self, ctx: RunContext, at: datetime, account: TelegramAccount, site: str, reschedule: bool = False
     ) -> asyncio.Task:
         try:
-            account_ctx = RunContext.get_or_create(f"checkiner.account.{account.phone}")
+            account_ctx = RunContext.get_or_create(
+                f"checkiner.account.{account.phone}", account=account.phone
+            )
 
             if reschedule:
                 description = f"{account.phone} 账号 {site} 站点重新签到"
             else:
                 description = f"{account.phone} 账号 {site} 站点签到"
 
-            site_ctx = RunContext.prepare(description=description, parent_ids=[account_ctx.id, ctx.id])
+            site_ctx = RunContext.prepare(
+                description=description, parent_ids=[account_ctx.id, ctx.id], site=site
+            )
             site_ctx.reschedule = (ctx.reschedule or 0) + 1
 
             async def _schedule():
@@ -320,7 +328,7 @@ class CheckinerManager:
                 log.debug(f"跳过站点 {site_name}, 该站点有独立的 time_range 配置")
                 continue
 
-            site_ctx = RunContext.prepare(f"{site_name} 站点签到", parent_ids=ctx.id)
+            site_ctx = RunContext.prepare(f"{site_name} 站点签到", parent_ids=ctx.id, site=site_name)
             checkiners.append(
                 cls(
                     client,
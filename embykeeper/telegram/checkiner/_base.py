@@ -757,6 +757,7 @@ class BotCheckin(BaseBotCheckin):
     async def wait_until(self, pattern: str = ".", timeout: float = None):
         """等待特定消息出现."""
         self._waiting[pattern] = e = asyncio.Event()
+        self.client.dispatcher.release_chat()
         try:
             await asyncio.wait_for(e.wait(), timeout)
         except asyncio.TimeoutError:
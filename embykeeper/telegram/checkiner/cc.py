@@ -54,6 +54,7 @@ class CCCheckin(BotCheckin):
         captcha, score = process.extractOne(result, options)
         if score < 50:
             self.log.warning(f"远端答案难以与可用选项相匹配 (分数: {score}/100).")
+            await Link(self.client).forget("ocr", message.photo.file_id)
         self.log.debug(f"[gray50]接收验证码: {captcha}.[/]")
         await asyncio.sleep(random.uniform(2, 4))
         try:
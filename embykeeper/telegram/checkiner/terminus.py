@@ -29,9 +29,12 @@ class TerminusCheckin(AnswerBotCheckin):
                 return
             for i in range(3):
                 result, by = await Link(self.client).visual(message.photo.file_id, options_cleaned)
-                if result:
+                if result in options_cleaned:
                     self.log.debug(f"已通过远端 ({by}) 解析答案: {result}.")
                     break
+                elif result:
+                    self.log.warning(f"远端答案不在可用选项中, 正在重试解析 ({i + 1}/3).")
+                    await Link(self.client).forget("visual", message.photo.file_id, options_cleaned)
                 else:
                     self.log.warning(f"远端解析失败, 正在重试解析 ({i + 1}/3).")
             else:
@@ -1,34 +1,321 @@
 import asyncio
+from contextlib import asynccontextmanager
+from functools import wraps
+import hashlib
+import os
 import random
-from typing import Callable, Coroutine, List, Optional, Tuple, Union
+import time
+from typing import Callable, Coroutine, Dict, List, Optional, Tuple, Union
 import uuid
 from io import BytesIO
 
+from cachetools import TTLCache
+from PIL import Image
 import tomli
 from loguru import logger
-from pyrogram import filters
+from pyrogram import filters, utils
+from pyrogram.file_id import FileId
 from pyrogram.handlers import MessageHandler
 from pyrogram.enums import ParseMode
 from pyrogram.types import Message
 from pyrogram.errors.exceptions.bad_request_400 import YouBlockedUser
 from pyrogram.errors import FloodWait
 
-from embykeeper.utils import async_partial, truncate_str
+from embykeeper.cache import cache
+from embykeeper.config import config
+from embykeeper.utils import async_partial
 
-from .lock import super_ad_shown, super_ad_shown_lock, authed_services, authed_services_lock
+from .lock import super_ad_shown, super_ad_shown_lock, authed_services, authed_services_locks
 from .pyrogram import Client
 
+SIMILAR_DISTANCE = 4  # 视为同一图片的感知哈希最大汉明距离
+
+_stored_services: Dict[str, bool] = {}  # 持久保存结果的服务 => 首个参数是否为图片
+
 
 class LinkError(Exception):
     pass
 
 
+def _digest(parts: list) -> str:
+    """请求内容的哈希, 文本去除多余空白, 选项以 "/" 连接."""
+    texts = []
+    for p in parts:
+        if isinstance(p, (list, tuple)):
+            p = "/".join(str(i) for i in p)
+        texts.append(" ".join(str(p).split()) if p is not None else "")
+    return hashlib.sha256("\n".join(texts).encode("utf-8")).hexdigest()[:32]
+
+
+def _photo_id(photo) -> Optional[str]:
+    """图片的内容标识: Telegram 文件 ID 取其图片 ID (各账号一致), 本地文件或字节取其哈希."""
+    if isinstance(photo, str):
+        try:
+            return f"tg{FileId.decode(photo).media_id}"
+        except Exception:
+            if not os.path.isfile(photo):
+                return None
+            with open(photo, "rb") as f:
+                photo = f.read()
+    elif isinstance(photo, BytesIO):
+        photo = photo.getvalue()
+    if isinstance(photo, (bytes, bytearray)):
+        return hashlib.sha256(photo).hexdigest()[:32]
+    return None
+
+
+def _ahash(image) -> str:
+    """图片的 8x8 均值感知哈希."""
+    with Image.open(image) as im:
+        pixels = list(im.convert("L").resize((8, 8)).getdata())
+    mean = sum(pixels) / len(pixels)
+    return f"{sum(1 << i for i, p in enumerate(pixels) if p > mean):016x}"
+
+
+def _stored_parts(args: tuple, kw: dict, photo: bool) -> Optional[list]:
+    """参与请求内容哈希的各部分, 图片无法识别时返回 None."""
+    parts = [*args, *(f"{k}={v}" for k, v in sorted(kw.items()))]
+    if photo:
+        parts[0] = _photo_id(args[0])
+        if parts[0] is None:
+            return None
+    return parts
+
+
+def _answered(result) -> bool:
+    return bool(result) and (not isinstance(result, tuple) or result[0] is not None)
+
+
+def stored(service: str, photo: bool = False, similar: bool = False):
+    """以请求内容的哈希为键在缓存中持久保存有回答的结果, 命中时不再请求机器人.
+
+    photo: 首个参数为图片, 以其内容标识代替参与哈希.
+    similar: 未命中时在请求的同时下载图片, 按感知哈希查找相近图片的结果, 并在得到回答后记录该哈希.
+    调用时传入 fresh=True 以跳过缓存的结果.
+    """
+
+    _stored_services[service] = photo
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self: "Link", *args, fresh: bool = False, **kw):
+            parts = None if fresh else _stored_parts(args, kw, photo)
+            if parts is None:
+                return await func(self, *args, **kw)
+            digest = _digest(parts)
+            key = f"link.results.{service}.{digest}"
+            result = await cache.aget(key)
+            if result is not None:
+                return self._stored_hit(service, result)
+            variant = _digest(parts[1:])
+            lookup = asyncio.ensure_future(self._similar(service, args[0], variant)) if similar else None
+            request = asyncio.ensure_future(func(self, *args, **kw))
+            try:
+                if lookup:
+                    await asyncio.wait({lookup, request}, return_when=asyncio.FIRST_COMPLETED)
+                    similar_key = None if request.done() else lookup.result()[0]
+                    result = await cache.aget(similar_key) if similar_key else None
+                    if result is not None:
+                        request.cancel()
+                        Link.similar_hits[key] = similar_key
+                        return self._stored_hit(service, result)
+                result = await request
+            except BaseException:
+                request.cancel()
+                if lookup:
+                    lookup.cancel()
+                raise
+            if _answered(result):
+                await cache.aset(key, list(result) if isinstance(result, tuple) else result)
+                if lookup:
+                    task = asyncio.create_task(self._index_similar(service, digest, variant, lookup))
+                    Link.similar_tasks.add(task)
+                    task.add_done_callback(Link.similar_tasks.discard)
+            elif lookup:
+                lookup.cancel()
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def coalesced(service: str):
+    """合并进程内相同内容的请求, 内容为被装饰方法的首个参数, 仅缓存有回答的结果.
+
+    调用时传入 fresh=True 以跳过近期的结果, 该参数同时传递给被装饰方法.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(self: "Link", payload: str, *args, **kw):
+            if kw.get("fresh", False):
+                return await func(self, payload, *args, **kw)
+            key = (service, " ".join(payload.split()))
+            return await Link.coalesce(key, lambda: func(self, payload, *args, **kw))
+
+        return wrapper
+
+    return decorator
+
+
+class LinkChannel:
+    """客户端与云服务机器人之间的常驻通道.
+
+    每个客户端仅注册一个处理器, 请求以命令为键登记在等待表中, 响应按其 command 字段分配.
+    机器人的响应中仅回显命令, 因此不同命令的请求可同时进行, 相同命令的请求依次进行以避免混淆.
+    请求与响应消息加入删除队列, 按会话合并为批量删除请求.
+    存在等待响应的请求时, 机器人会话的更新以高优先级分发.
+    """
+
+    delete_delay = 0.3  # 删除队列的合并等待时间 (秒)
+    delete_batch = 100  # 单次删除请求的最大消息数
+
+    def __init__(self, link: "Link"):
+        self.link = link
+        self.pending: dict = {}  # 命令 => (Future, 条件, 释放事件)
+        self.deleting: Dict[int, Dict[int, asyncio.Future]] = {}  # 会话 => 消息 ID => 删除完成的 Future
+        self.deleter: asyncio.Task = None
+        self.deleting_full = asyncio.Event()
+        self.peer_id: Optional[int] = None  # 机器人会话 ID
+        self.boosted: Optional[int] = None  # 已提升优先级的会话 ID
+        self.handler = MessageHandler(self._handler, filters.text & filters.bot & filters.user(link.bot))
+
+    @classmethod
+    async def of(cls, link: "Link"):
+        """获取客户端的通道, 首次使用时注册处理器."""
+        channel = link.client.link_channel
+        if channel is None:
+            channel = link.client.link_channel = cls(link)
+            await link.client.add_handler(channel.handler, group=1)
+        return channel
+
+    @asynccontextmanager
+    async def request(self, cmd: str, condition=None):
+        """登记一个等待响应的请求, 返回在收到有效响应时完成的 Future."""
+        peer_id = await self._peer_id()
+        while cmd in self.pending:
+            await self.pending[cmd][2].wait()
+        future = asyncio.Future()
+        released = asyncio.Event()
+        self.pending[cmd] = (future, condition, released)
+        if self.boosted is None and peer_id is not None:
+            self.link.client.dispatcher.updates_queue.boost(peer_id)
+            self.boosted = peer_id
+        try:
+            yield future
+        finally:
+            del self.pending[cmd]
+            released.set()
+            if not self.pending and self.boosted is not None:
+                self.link.client.dispatcher.updates_queue.unboost(self.boosted)
+                self.boosted = None
+
+    async def _peer_id(self) -> Optional[int]:
+        """仅查询本地存储获取机器人会话 ID, 无法确定时返回 None."""
+        if self.peer_id is None:
+            try:
+                peer = await self.link.client.storage.get_peer_by_username(self.link.bot.lower())
+                self.peer_id = utils.get_peer_id(peer)
+            except (KeyError, ValueError):
+                pass
+        return self.peer_id
+
+    def discard(self, messages: List[Message]) -> List[asyncio.Future]:
+        """将消息加入删除队列, 返回删除完成时完成的 Future."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for m in messages:
+            pending = self.deleting.setdefault(m.chat.id, {})
+            if m.id not in pending:
+                pending[m.id] = loop.create_future()
+            futures.append(pending[m.id])
+            if len(pending) >= self.delete_batch:
+                self.deleting_full.set()
+        if messages and (self.deleter is None or self.deleter.done()):
+            self.deleter = asyncio.create_task(self._deleter())
+        return futures
+
+    async def _deleter(self):
+        while self.deleting:
+            try:
+                await asyncio.wait_for(self.deleting_full.wait(), self.delete_delay)
+            except asyncio.TimeoutError:
+                pass
+            self.deleting_full.clear()
+            deleting, self.deleting = self.deleting, {}
+            for chat, pending in deleting.items():
+                ids = list(pending)
+                for i in range(0, len(ids), self.delete_batch):
+                    await self._delete(chat, {k: pending[k] for k in ids[i : i + self.delete_batch]})
+
+    async def _delete(self, chat: int, pending: Dict[int, asyncio.Future]):
+        ids = list(pending)
+        while True:
+            try:
+                await self.link.client.delete_messages(chat, ids, revoke=True)
+            except FloodWait as e:
+                self.link.log.debug(f"[gray50]删除 API 消息记录因访问超限而等待 {e.value} 秒.[/]")
+                await asyncio.sleep(e.value)
+                continue
+            except Exception as e:
+                self.link.log.debug(f"[gray50]删除 API 消息记录失败: {e}.[/]")
+            else:
+                self.link.log.debug(f"[gray50]删除了 {len(ids)} 条 API 消息记录.[/]")
+            break
+        for future in pending.values():
+            if not future.done():
+                future.set_result(None)
+
+    async def _handler(self, client: Client, message: Message):
+        try:
+            toml = tomli.loads(message.text)
+        except tomli.TOMLDecodeError:
+            self.discard([message])
+            return
+        entry = self.pending.get(toml.get("command", None), None)
+        if entry:
+            future, condition, _ = entry
+            try:
+                if condition is None:
+                    cond = True
+                elif asyncio.iscoroutinefunction(condition):
+                    cond = await condition(toml)
+                elif callable(condition):
+                    cond = condition(toml)
+                else:
+                    cond = bool(condition)
+            except asyncio.CancelledError as e:
+                try:
+                    await asyncio.wait_for(self.link.delete_messages([message]), 3)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    if not future.done():
+                        future.set_exception(e)
+                    raise
+            if cond:
+                if not future.done():
+                    future.set_result(toml)
+                self.discard([message])
+                return
+        message.continue_propagation()
+
+
 class Link:
     """云服务类, 用于认证和高级权限任务通讯."""
 
     bot = "embykeeper_auth_bot"
     post_count = 0
 
+    inflight = {}  # (服务, 内容) => 进行中请求的 Future
+    results = TTLCache(maxsize=256, ttl=60)  # (服务, 内容) => 近期结果
+    hit_count = 0  # 由近期或缓存结果直接返回的请求数
+    join_count = 0  # 合并到进行中请求的请求数
+    auth_tasks = set()  # 后台重新认证的任务
+    similar_hits = TTLCache(maxsize=256, ttl=600)  # 结果键 => 近期命中的相近图片结果键
+    similar_tasks = set()  # 后台记录感知哈希的任务
+
     def __init__(self, client: Client):
         self.client = client
         self.log = logger.bind(scheme="telelink", username=client.me.full_name)
@@ -40,19 +327,88 @@ class Link:
         rd.seed(uuid.getnode())
         return uuid.UUID(int=rd.getrandbits(128))
 
-    async def delete_messages(self, messages: List[Message]):
-        """删除一系列消息."""
-
-        async def delete(m: Message):
-            try:
-                await asyncio.wait_for(m.delete(revoke=True), 3)
-                text = m.text or m.caption or "图片或其他内容"
-                text = truncate_str(text.replace("\n", ""), 30)
-                self.log.debug(f"[gray50]删除了 API 消息记录: {text}[/]")
-            except asyncio.TimeoutError:
-                pass
+    def _stored_hit(self, service: str, result):
+        Link.hit_count += 1
+        self.log.debug(f"[gray50]使用缓存的服务结果: {service}[/]")
+        return tuple(result) if isinstance(result, list) else result
+
+    async def _index_similar(self, service: str, digest: str, variant: str, lookup: asyncio.Future):
+        """等待感知哈希计算完成, 将其记录到相近图片索引."""
+        _, ahash = await lookup
+        if ahash:
+            await cache.aset(f"link.similar.{service}.{digest}", [ahash, variant])
+
+    async def forget(self, service: str, *args, **kw):
+        """清除服务对该请求的近期及缓存结果, 参数同原请求, 用于结果被证实错误时."""
+        if args and isinstance(args[0], str):
+            Link.results.pop((service, " ".join(args[0].split())), None)
+        parts = _stored_parts(args, kw, _stored_services.get(service, False))
+        if parts is None:
+            return
+        key = f"link.results.{service}.{_digest(parts)}"
+        keys = [key]
+        source = Link.similar_hits.pop(key, None)
+        if source:
+            keys.append(source)
+        for k in list(keys):
+            keys.append(k.replace("link.results.", "link.similar.", 1))
+        for k in keys:
+            await cache.adelete(k)
+        self.log.debug(f"[gray50]已清除错误的服务结果: {service}[/]")
+
+    async def _similar(self, service: str, photo, variant: str) -> Tuple[Optional[str], Optional[str]]:
+        """计算图片的感知哈希, 返回相同请求内容下相近图片的结果键与该哈希."""
+        try:
+            if isinstance(photo, BytesIO):
+                photo = BytesIO(photo.getvalue())  # 请求同时在读取原对象
+            elif isinstance(photo, (bytes, bytearray)):
+                photo = BytesIO(photo)
+            elif isinstance(photo, str) and not os.path.isfile(photo):
+                photo = await self.client.download_media(photo, in_memory=True)
+            ahash = _ahash(photo)
+        except Exception as e:
+            self.log.debug(f"计算图片感知哈希失败: {e}.")
+            return None, None
+        value = int(ahash, 16)
+        prefix = f"link.similar.{service}."
+        for key, (h, v) in (await cache.aget_by_prefix(prefix)).items():
+            if v == variant and bin(int(h, 16) ^ value).count("1") <= SIMILAR_DISTANCE:
+                return f"link.results.{service}.{key[len(prefix):]}", ahash
+        return None, ahash
 
-        return await asyncio.gather(*[delete(m) for m in messages])
+    async def delete_messages(self, messages: List[Message]):
+        """删除一系列消息, 并等待删除队列完成这些消息的删除."""
+        channel = await LinkChannel.of(self)
+        futures = channel.discard(messages)
+        if futures:
+            await asyncio.wait(futures)
+
+    @classmethod
+    async def coalesce(cls, key: tuple, func: Callable[[], Coroutine]):
+        """相同 key 的并发请求仅由首个请求实际执行, 其余请求等待其结果; 首个请求失败时各自重新请求."""
+        if key in cls.results:
+            cls.hit_count += 1
+            return cls.results[key]
+        future = cls.inflight.get(key, None)
+        if future:
+            cls.join_count += 1
+            await asyncio.wait({future})
+            if not future.cancelled():
+                return future.result()
+            return await func()
+        future = cls.inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func()
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            if result and result[0] is not None:
+                cls.results[key] = result
+            return result
+        finally:
+            del cls.inflight[key]
 
     async def post(self, *args, stop_grace: float = 0, **kw):
         async def stop(task: asyncio.Task):
@@ -100,37 +456,34 @@ class Link:
             if photo and file:
                 raise ValueError("can not use both photo and file")
 
+            channel = await LinkChannel.of(self)
+
             for r in range(retries):
                 try:
                     await self.client.mute_chat(self.bot)
                 except FloodWait:
                     self.log.debug(f"[gray50]设置禁用提醒因访问超限而失败: {self.bot}[/]")
-                future = asyncio.Future()
-                handler = MessageHandler(
-                    async_partial(self._handler, cmd=cmd, future=future, condition=condition),
-                    filters.text & filters.bot & filters.user(self.bot),
-                )
-                await self.client.add_handler(handler, group=1)
+                messages = []
                 try:
-                    messages = []
-                    if photo:
-                        messages.append(
-                            await self.client.send_photo(
-                                self.bot, photo, caption=cmd, parse_mode=ParseMode.DISABLED
+                    async with channel.request(cmd, condition) as future:
+                        if photo:
+                            messages.append(
+                                await self.client.send_photo(
+                                    self.bot, photo, caption=cmd, parse_mode=ParseMode.DISABLED
+                                )
                             )
-                        )
-                    elif file:
-                        messages.append(
-                            await self.client.send_document(
-                                self.bot, file, caption=cmd, parse_mode=ParseMode.DISABLED
+                        elif file:
+                            messages.append(
+                                await self.client.send_document(
+                                    self.bot, file, caption=cmd, parse_mode=ParseMode.DISABLED
+                                )
                             )
-                        )
-                    else:
-                        messages.append(
-                            await self.client.send_message(self.bot, cmd, parse_mode=ParseMode.DISABLED)
-                        )
-                    self.log.debug(f"[gray50]-> {cmd}[/]")
-                    results = await asyncio.wait_for(future, timeout=timeout)
+                        else:
+                            messages.append(
+                                await self.client.send_message(self.bot, cmd, parse_mode=ParseMode.DISABLED)
+                            )
+                        self.log.debug(f"[gray50]-> {cmd}[/]")
+                        results = await asyncio.wait_for(future, timeout=timeout)
                 except asyncio.CancelledError:
                     try:
                         await asyncio.wait_for(self.delete_messages(messages), 3)
@@ -139,7 +492,7 @@ class Link:
                     finally:
                         raise
                 except asyncio.TimeoutError:
-                    await self.delete_messages(messages)
+                    channel.discard(messages)
                     if r + 1 < retries:
                         self.log.info(f"{name}超时 ({r + 1}/{retries}), 将在 3 秒后重试.")
                         await asyncio.sleep(3)
@@ -159,7 +512,7 @@ class Link:
                         self.log.error(msg)
                         return None
                 else:
-                    await self.delete_messages(messages)
+                    channel.discard(messages)
                     status, errmsg = [results.get(p, None) for p in ("status", "errmsg")]
                     if status == "error":
                         if fail:
@@ -176,67 +529,30 @@ class Link:
                         else:
                             self.log.warning(f"{name}出现未知错误.")
                             return False
-                finally:
-                    try:
-                        await self.client.remove_handler(handler, group=1)
-                    except:
-                        pass
 
         finally:
             Link.post_count -= 1
 
-    async def _handler(
-        self,
-        client: Client,
-        message: Message,
-        cmd: str,
-        future: asyncio.Future,
-        condition: Union[bool, Callable[..., Coroutine], Callable] = None,
-    ):
-        try:
-            toml = tomli.loads(message.text)
-        except tomli.TOMLDecodeError:
-            await self.delete_messages([message])
-        else:
-            try:
-                if toml.get("command", None) == cmd:
-                    if condition is None:
-                        cond = True
-                    elif asyncio.iscoroutinefunction(condition):
-                        cond = await condition(toml)
-                    elif callable(condition):
-                        cond = condition(toml)
-                    if cond:
-                        if not future.done():
-                            future.set_result(toml)
-                        await asyncio.sleep(0.5)
-                        await self.delete_messages([message])
-                        return
-            except asyncio.CancelledError as e:
-                try:
-                    await asyncio.wait_for(self.delete_messages([message]), 3)
-                except asyncio.TimeoutError:
-                    pass
-                finally:
-                    if not future.done():
-                        future.set_exception(e)
-                    raise
-            else:
-                message.continue_propagation()
-
     async def auth(self, service: str, log_func=None):
         """向机器人发送授权请求."""
-        async with authed_services_lock:
+        lock = authed_services_locks.setdefault((self.client.me.id, service), asyncio.Lock())
+        async with lock:
             user_auth_cache = authed_services.get(self.client.me.id, {}).get(service, None)
             if user_auth_cache is not None:
                 return user_auth_cache
 
+            if await self._stored_auth(service):
+                authed_services.setdefault(self.client.me.id, {})[service] = True
+                return True
+
             # No cache, perform auth
             if not log_func:
                 result = await self.post(
                     f"/auth {service} {self.instance}", name=f"服务 {service.upper()} 认证"
                 )
                 authed_services.setdefault(self.client.me.id, {})[service] = bool(result)
+                if result:
+                    await self._store_auth(service)
                 return bool(result)
             else:
                 try:
@@ -253,8 +569,45 @@ class Link:
                     return False
                 else:
                     authed_services.setdefault(self.client.me.id, {})[service] = True
+                    await self._store_auth(service)
                     return True
 
+    def _auth_key(self, service: str):
+        return f"link.auth.{self.client.me.id}.{service}"
+
+    async def _stored_auth(self, service: str) -> bool:
+        """检查缓存中本设备未过期的认证结果, 超过有效时间一半时在后台重新认证."""
+        expiry = config.telegram.auth_expiry
+        if not expiry:
+            return False
+        stored = await cache.aget(self._auth_key(service))
+        if not stored or stored.get("instance", None) != str(self.instance):
+            return False
+        age = time.time() - stored["time"]
+        if age > expiry:
+            return False
+        if age > expiry / 2:
+            task = asyncio.create_task(self._revalidate_auth(service))
+            Link.auth_tasks.add(task)
+            task.add_done_callback(Link.auth_tasks.discard)
+        return True
+
+    async def _store_auth(self, service: str):
+        expiry = config.telegram.auth_expiry
+        if expiry:
+            value = {"time": time.time(), "instance": str(self.instance)}
+            await cache.aset(self._auth_key(service), value, ttl=expiry)
+
+    async def _revalidate_auth(self, service: str):
+        """在后台重新认证, 超时则保留原结果, 认证被拒绝则清除缓存."""
+        result = await self.post(f"/auth {service} {self.instance}", name=f"服务 {service.upper()} 认证")
+        if result:
+            await self._store_auth(service)
+        elif result is False:
+            await cache.adelete(self._auth_key(service))
+            authed_services.setdefault(self.client.me.id, {})[service] = False
+            self.log.warning(f"服务 {service.upper()} 认证已失效, 相关功能将停用.")
+
     async def _show_super_ad(self):
         async with super_ad_shown_lock:
             user_super_ad_shown = super_ad_shown.get(self.client.me.id, False)
@@ -309,6 +662,8 @@ class Link:
         else:
             return None, None
 
+    @coalesced("pornemby_answer")
+    @stored("pornemby_answer")
     async def pornemby_answer(self, question: str) -> Tuple[Optional[str], Optional[str]]:
         """向机器人发送问题回答请求."""
         results = await self.post(
@@ -319,6 +674,8 @@ class Link:
         else:
             return None, None
 
+    @coalesced("terminus_answer")
+    @stored("terminus_answer")
     async def terminus_answer(self, question: str) -> Tuple[Optional[str], Optional[str]]:
         """向机器人发送问题回答请求."""
         results = await self.post(
@@ -337,6 +694,7 @@ class Link:
         else:
             return None, None
 
+    @stored("visual", photo=True, similar=True)
     async def visual(self, photo, options: List[str], question=None) -> Tuple[Optional[str], Optional[str]]:
         """向机器人发送视觉问题解答请求."""
         cmd = f"/visual {self.instance} {'/'.join(options)}"
@@ -348,6 +706,7 @@ class Link:
         else:
             return None, None
 
+    @stored("ocr", photo=True)
     async def ocr(self, photo) -> Optional[str]:
         """向机器人发送 OCR 解答请求."""
         cmd = f"/ocr {self.instance}"
@@ -18,4 +18,4 @@ super_ad_shown = {}  # uid: bool
 super_ad_shown_lock = asyncio.Lock()
 
 authed_services = {}  # uid: {service: bool}
-authed_services_lock = asyncio.Lock()
+authed_services_locks = {}  # (uid, service): lock
@@ -55,7 +55,7 @@ class _PornfansAnswerAnswerMonitor(Monitor):
 
     async def update_cache(self, to_date=None):
         if not to_date:
-            to_date = datetime.fromtimestamp(cache.get(f"{QA_CACHE_KEY}.timestamp", 0))
+            to_date = datetime.fromtimestamp(await cache.aget(f"{QA_CACHE_KEY}.timestamp", 0))
 
         if not to_date:
             self.log.info("首次使用 PornFans 问题回答, 正在缓存问题答案历史.")
@@ -69,6 +69,7 @@ class _PornfansAnswerAnswerMonitor(Monitor):
         while not finished:
             finished = True
             m: Message
+            batch = {}
             for g in to_iterable(self.history_chat_name):
                 async for m in self.client.search_messages(g, limit=100, offset=count, query="答案为"):
                     if m.date < to_date:
@@ -78,12 +79,14 @@ class _PornfansAnswerAnswerMonitor(Monitor):
                     if m.text:
                         for key in _PornfansAnswerResultMonitor.keys(_PornfansAnswerResultMonitor, m):
                             qs += 1
-                            cache.set(f"{QA_CACHE_KEY}.data.{key[0]}", key[5])
+                            batch[f"{QA_CACHE_KEY}.data.{key[0]}"] = key[5]
+            if batch:
+                await cache.aset_many(batch)
             if count and (finished or count % 500 == 0):
                 self.log.info(f"读取问题答案历史: 已读取 {qs} 问题 / {count} 信息.")
                 await asyncio.sleep(2)
         self.log.debug(f"已向问题答案历史缓存写入 {qs} 条问题.")
-        cache.set(f"{QA_CACHE_KEY}.timestamp", datetime.now().timestamp())
+        await cache.aset(f"{QA_CACHE_KEY}.timestamp", datetime.now().timestamp())
 
     async def update(self):
         try:
@@ -118,7 +121,8 @@ class _PornfansAnswerAnswerMonitor(Monitor):
         if random.random() > self.config.get("possibility", 1.0):
             self.log.info(f"由于概率设置不作答: {spec}.")
             return
-        result = cache.get(f"{QA_CACHE_KEY}.data.{key[0]}")
+        prompt = None
+        result = await cache.aget(f"{QA_CACHE_KEY}.data.{key[0]}")
         if result:
             self.log.info(f"从缓存回答问题为{result}: {spec}.")
         elif self.config.get("only_history", False):
@@ -128,9 +132,10 @@ class _PornfansAnswerAnswerMonitor(Monitor):
             question = key[0]
             choices = key[2]
             question = re.sub(r"\([^\)]*From资料库:第\d+题\)", "", question)
+            prompt = question + "\n" + choices
             for _ in range(3):
                 self.log.debug(f"未从历史缓存找到问题, 开始请求云端问题回答: {spec}.")
-                result, by = await Link(self.client).pornemby_answer(question + "\n" + choices)
+                result, by = await Link(self.client).pornemby_answer(prompt)
                 if result:
                     self.log.info(f"请求 {by or '云端'} 问题回答为 {result}: {spec}.")
                     break
@@ -154,6 +159,8 @@ class _PornfansAnswerAnswerMonitor(Monitor):
                 self.log.info(f"点击失败: 未找到匹配的按钮文本 {result} {spec}.")
         except KeyError:
             self.log.info(f"点击失败: {result} 不是可用的答案 {spec}.")
+            if prompt:
+                await Link(self.client).forget("pornemby_answer", prompt)
         except RPCError:
             self.log.info(f"点击失败: 问题已失效.")
 
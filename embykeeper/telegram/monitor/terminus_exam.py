@@ -20,7 +20,7 @@ class TerminusExamMonitor(Monitor):
 
     async def init(self):
         self.log.info("您已开启终点站考试辅助, 正在测试答题服务状态.")
-        result, _ = await Link(self.client).terminus_answer("请输出'正常'两个字!")
+        result, _ = await Link(self.client).terminus_answer("请输出'正常'两个字!", fresh=True)
         if result:
             self.log.info("终点站考试辅助正常已启用, 请在机器人触发考试开始.")
             return True
@@ -61,7 +61,9 @@ class MonitorManager:
             logger.warning(f"账户 {account.phone} 的监控已经在执行.")
             return
 
-        account_ctx = RunContext.get_or_create(f"monitor.account.{account.phone}")
+        account_ctx = await RunContext.aget_or_create(
+            f"monitor.account.{account.phone}", account=account.phone
+        )
 
         self._running.add(account.phone)
         try:
@@ -106,7 +108,7 @@ class MonitorManager:
                 site_name = cls.templ_name
             else:
                 site_name = cls.__module__.rsplit(".", 1)[-1]
-            site_ctx = RunContext.prepare(f"{site_name} 站点监控", parent_ids=ctx.id)
+            site_ctx = RunContext.prepare(f"{site_name} 站点监控", parent_ids=ctx.id, site=site_name)
             monitor = cls(
                 client,
                 context=site_ctx,
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import base64
-from collections import OrderedDict
-from contextlib import asynccontextmanager
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 import asyncio
 import inspect
+import itertools
 import os
 from pathlib import Path
 import sqlite3
@@ -17,7 +19,7 @@ import logging
 from rich.prompt import Prompt
 from loguru import logger
 import pyrogram
-from pyrogram import raw, types, filters, dispatcher
+from pyrogram import raw, types, filters, dispatcher, utils
 from pyrogram.enums import SentCodeType
 from pyrogram.errors import (
     BadRequest,
@@ -43,12 +45,15 @@ from pyrogram.handlers.handler import Handler
 
 from embykeeper import var, __name__ as __product__, __version__
 from embykeeper.schema import TelegramAccount
-from embykeeper.utils import async_partial, show_exception
+from embykeeper.utils import show_exception, vacuum_sqlite
 
 var.tele_used.set()
 
 logger = logger.bind(scheme="telegram", nonotify=True)
 
+# 正在处理当前更新的工作协程, 处理器内创建的任务同样继承该值
+_current_worker: ContextVar[asyncio.Task] = ContextVar("_current_worker", default=None)
+
 
 class LogRedirector(logging.StreamHandler):
     def emit(self, record):
@@ -67,12 +72,379 @@ for h in pyrogram_session_logger.handlers[:]:
 pyrogram_session_logger.addHandler(LogRedirector())
 
 
+def _route_keys(flt, sets: list = None):
+    """提取过滤器所限定的会话 / 用户键, 无法确定范围时返回 None.
+
+    sets: 记录所读取的 filters.chat / filters.user 集合及其内容快照 (长度, 哈希).
+    """
+    if isinstance(flt, (filters.chat, filters.user)):
+        if sets is not None:
+            sets.append((flt, len(flt), hash(frozenset(flt))))
+        if "me" in flt:
+            return None
+        kind = "chat" if isinstance(flt, filters.chat) else "user"
+        return frozenset((kind, k) for k in flt)
+    elif isinstance(flt, filters.AndFilter):
+        keys = _route_keys(flt.base, sets)
+        return keys if keys is not None else _route_keys(flt.other, sets)
+    elif isinstance(flt, filters.OrFilter):
+        base = _route_keys(flt.base, sets)
+        other = _route_keys(flt.other, sets)
+        return None if base is None or other is None else base | other
+    else:
+        return None
+
+
+def _message_keys(message: types.Message):
+    """生成消息可能命中的会话 / 用户键, 与 filters.chat / filters.user 的匹配规则一致."""
+    keys = []
+    chat = message.chat
+    if chat:
+        keys.append(("chat", chat.id))
+        if chat.username:
+            keys.append(("chat", chat.username.lower()))
+    user = message.from_user
+    if user:
+        keys.append(("user", user.id))
+        if user.username:
+            keys.append(("user", user.username.lower()))
+    return keys
+
+
+_MESSAGE_UPDATES = {
+    raw.types.UpdateNewMessage: MessageHandler,
+    raw.types.UpdateNewChannelMessage: MessageHandler,
+    raw.types.UpdateEditMessage: EditedMessageHandler,
+    raw.types.UpdateEditChannelMessage: EditedMessageHandler,
+}
+
+
+def _raw_usernames(entity):
+    if entity is None:
+        return []
+    names = [entity.username] if getattr(entity, "username", None) else []
+    names.extend(u.username for u in getattr(entity, "usernames", None) or [])
+    return [n.lower() for n in names]
+
+
+def _raw_message_keys(message, users: dict, chats: dict):
+    """由原始消息生成可能命中的会话 / 用户键, 不需解析消息, 结果为 _message_keys 的超集."""
+    keys = []
+    peer = getattr(message, "peer_id", None)
+    peer_id = utils.get_raw_peer_id(peer)
+    if peer_id:
+        keys.append(("chat", utils.get_peer_id(peer)))
+        entity = users.get(peer_id) if isinstance(peer, raw.types.PeerUser) else chats.get(peer_id)
+        keys.extend(("chat", n) for n in _raw_usernames(entity))
+    user_id = utils.get_raw_peer_id(getattr(message, "from_id", None)) or peer_id
+    if user_id:
+        keys.append(("user", user_id))
+        keys.extend(("user", n) for n in _raw_usernames(users.get(user_id)))
+    return keys
+
+
+class HandlerGroup:
+    """处理器组快照, 将限定会话 / 用户的消息处理器按键建立路由索引."""
+
+    __slots__ = ("handlers", "unscoped", "index", "sets")
+
+    def __init__(self, handlers, route: bool = True):
+        self.handlers = tuple(handlers)
+        unscoped = []
+        index = {}
+        sets = []
+        for i, handler in enumerate(self.handlers):
+            keys = None
+            if route and isinstance(handler, (MessageHandler, EditedMessageHandler)):
+                keys = _route_keys(handler.filters, sets)
+            if keys is None:
+                unscoped.append(i)
+            else:
+                for k in keys:
+                    index.setdefault(k, []).append(i)
+        self.unscoped = tuple(unscoped)
+        self.index = {k: tuple(v) for k, v in index.items()}
+        self.sets = tuple(sets)
+
+    def stale(self):
+        """建立索引后过滤器的会话 / 用户集合是否被修改."""
+        return any(len(f) != n or hash(frozenset(f)) != h for f, n, h in self.sets)
+
+    def select(self, keys):
+        """按注册顺序返回可能匹配的处理器, 非消息更新 (keys 为 None) 仅返回不限定范围的处理器."""
+        if not self.index:
+            return self.handlers
+        if keys is None:
+            positions = self.unscoped
+        else:
+            found = set(self.unscoped)
+            for k in keys:
+                found.update(self.index.get(k, ()))
+            positions = sorted(found)
+        return [self.handlers[i] for i in positions]
+
+
+def _update_key(update):
+    """取得原始更新所属会话的 ID, 不属于特定会话时返回 None."""
+    peer = getattr(getattr(update, "message", None), "peer_id", None) or getattr(update, "peer", None)
+    if isinstance(peer, raw.base.Peer):
+        return utils.get_peer_id(peer)
+    else:
+        return None
+
+
+class UpdateQueue:
+    """按会话分片的优先级更新队列.
+
+    每个会话拥有独立的队列, 同一时刻仅被一个工作协程持有, 从而保证会话内按顺序处理;
+    有待处理更新的会话进入就绪队列, 任一空闲工作协程均可取走, 不属于特定会话的更新各自独立.
+    就绪队列分为三条通道, 总是优先取出高优先级通道中的会话 (见 lane):
+    高: 正在等待回复或编辑的会话 (见 boost); 中: 私聊及不属于特定会话的更新; 低: 群组和频道消息.
+    低优先级通道积压超过 low_limit 条时, 丢弃该会话最早的待处理更新, 会话无积压时丢弃新更新.
+    wanted 返回 False 的更新在入队前即被跳过.
+    """
+
+    HIGH, NORMAL, LOW = range(3)
+    low_limit = 1000
+
+    def __init__(self, wanted=None):
+        self.wanted = wanted
+        self.chats: dict = {}
+        self.lanes = (deque(), deque(), deque())
+        self.ready = asyncio.Semaphore(0)
+        self.boosted: dict = {}
+        self.low_pending = 0
+        self.dropped = 0
+
+    def lane(self, key):
+        """会话的优先级通道: 被 boost 的会话为高, 群组和频道 (负数 ID) 为低, 其余为中."""
+        if key in self.boosted:
+            return self.HIGH
+        elif isinstance(key, int) and key < 0:
+            return self.LOW
+        else:
+            return self.NORMAL
+
+    def _move(self, key, lane: int):
+        """将会话及其已排队的更新移至 lane 通道, 正被持有的会话在释放时进入新通道."""
+        chat = self.chats.get(key)
+        if chat is None or chat[0] == lane:
+            return
+        old, pending = chat
+        if old == self.LOW:
+            self.low_pending -= len(pending)
+        if lane == self.LOW:
+            self.low_pending += len(pending)
+        chat[0] = lane
+        try:
+            self.lanes[old].remove(key)
+        except ValueError:
+            pass
+        else:
+            self.lanes[lane].append(key)
+
+    def boost(self, key: int):
+        """在 unboost 前将会话视为高优先级, 该会话已排队的更新一并提升."""
+        self.boosted[key] = self.boosted.get(key, 0) + 1
+        self._move(key, self.HIGH)
+
+    def unboost(self, key: int):
+        count = self.boosted.pop(key, 0) - 1
+        if count > 0:
+            self.boosted[key] = count
+        else:
+            self._move(key, self.lane(key))
+
+    def put_nowait(self, packet):
+        if packet is None:
+            self.lanes[self.LOW].append(None)
+            self.ready.release()
+            return
+        if self.wanted and not self.wanted(packet):
+            return
+        key = _update_key(packet[0])
+        if key is None:
+            key = object()
+        chat = self.chats.get(key)
+        if chat is None:
+            lane = self.lane(key)
+            if lane == self.LOW and self.low_pending >= self.low_limit:
+                self.dropped += 1
+                return
+            self.chats[key] = [lane, deque([packet])]
+            self.lanes[lane].append(key)
+            self.ready.release()
+        else:
+            lane, pending = chat
+            if lane == self.LOW and self.low_pending >= self.low_limit:
+                self.dropped += 1
+                if not pending:
+                    return
+                pending.popleft()
+                self.low_pending -= 1
+            pending.append(packet)
+        if lane == self.LOW:
+            self.low_pending += 1
+
+    async def get(self):
+        """取得一个就绪会话的下一条更新, 该会话在 release 前不会被再次取出."""
+        await self.ready.acquire()
+        key = next(l for l in self.lanes if l).popleft()
+        if key is None:
+            return None, None
+        lane, pending = self.chats[key]
+        if lane == self.LOW:
+            self.low_pending -= 1
+        return key, pending.popleft()
+
+    def release(self, key):
+        """释放会话, 若仍有待处理更新则重新加入就绪队列."""
+        lane, pending = self.chats[key]
+        if pending:
+            self.lanes[lane].append(key)
+            self.ready.release()
+        else:
+            del self.chats[key]
+
+    def depths(self):
+        """各通道中待处理的更新数."""
+        depths = [0, 0, 0]
+        for lane, pending in self.chats.values():
+            depths[lane] += len(pending)
+        return depths
+
+    def qsize(self):
+        return sum(self.depths())
+
+
+class ReplyDemux:
+    """等待中的回复与编辑.
+
+    分配器在处理器组之前查询, 等待回复无需增删处理器. 等待以会话 ID 或用户名为键登记,
+    同一消息命中多个等待时, 按登记顺序交给首个通过过滤器的等待, 且不再传递给其他处理器.
+    """
+
+    def __init__(self):
+        self.replies: dict = {}
+        self.edits: dict = {}
+        self.seq = itertools.count()
+
+    @contextmanager
+    def wait(self, table: dict, keys, flt):
+        """在 table 中以 keys 登记一个等待, 返回在首个匹配 flt 的消息到达时完成的 Future."""
+        future = asyncio.Future()
+        seq = next(self.seq)
+        waiter = (future, Handler(None, flt))
+        for k in keys:
+            table.setdefault(k, {})[seq] = waiter
+        try:
+            yield future
+        finally:
+            for k in keys:
+                waiters = table.get(k)
+                if waiters is not None:
+                    waiters.pop(seq, None)
+                    if not waiters:
+                        del table[k]
+
+    async def resolve(self, client: Client, message: types.Message, edited: bool = False):
+        """将消息交给匹配的等待, 返回是否被消费."""
+        table = self.edits if edited else self.replies
+        if not table:
+            return False
+        candidates = {}
+        for k in (*_message_keys(message), ("chat", "me")):
+            candidates.update(table.get(k, ()))
+        for _, (future, handler) in sorted(candidates.items(), key=lambda i: i[0]):
+            try:
+                if not await handler.check(client, message):
+                    continue
+            except Exception as e:
+                logger.warning(f"更新处理器发生错误, 可能遗漏消息.")
+                show_exception(e, regular=False)
+                continue
+            if not future.done():
+                future.set_result(message)
+            return True
+        return False
+
+
 class Dispatcher(dispatcher.Dispatcher):
+    """更新分配器.
+
+    处理器变更时重建不可变的处理器快照 (按组排序的元组), 工作协程无锁读取当前快照.
+    限定会话 / 用户的消息处理器在注册时建立路由索引, 每条消息仅检查可能匹配的处理器.
+    过滤器的会话 / 用户集合在注册后修改时, 在处理下一条更新前重建快照和路由索引.
+    更新按会话分片 (见 UpdateQueue), 处理超过 offload_after 秒的工作协程将脱离 (见 detach), 不再占用工作协程数量,
+    其所属会话在处理完成前保持占用; 处理器等待同一会话的后续消息时释放该会话 (见 release_chat).
+    没有处理器可能关注的消息更新在解析前即被跳过 (见 wanted).
+    消息在交给处理器组之前先交给等待中的回复与编辑 (见 ReplyDemux).
+    """
+
     updates_count = 0
+    skipped_count = 0
+    offload_after = 0.5
 
     def __init__(self, client: Client):
         super().__init__(client)
-        self.mutex = asyncio.Lock()
+        self.updates_queue = UpdateQueue(self.wanted)
+        self.demux = ReplyDemux()
+        self.busy: dict = {}
+        self.detached: set = set()
+        self.released: set = set()
+        self.offload_task: asyncio.Task = None
+        self.version = 0
+        self._rebuild()
+
+    def _rebuild(self):
+        self.snapshot = tuple(HandlerGroup(g) for _, g in sorted(self.groups.items()) if g)
+        self.version += 1
+
+        # 各消息处理器类型关注的会话 / 用户键, None 表示存在不限定范围的处理器
+        watched = {MessageHandler: set(), EditedMessageHandler: set()}
+        for group in self.snapshot:
+            for i in group.unscoped:
+                handler = group.handlers[i]
+                for handler_type in watched:
+                    if isinstance(handler, (handler_type, RawUpdateHandler)):
+                        watched[handler_type] = None
+            for key, positions in group.index.items():
+                for handler_type, keys in watched.items():
+                    if keys is not None and any(
+                        isinstance(group.handlers[i], handler_type) for i in positions
+                    ):
+                        keys.add(key)
+        self.watched = watched
+
+    def wanted(self, packet):
+        """在解析前根据原始消息的会话 / 用户判断是否有处理器可能关注该更新."""
+        if any(g.stale() for g in self.snapshot):
+            self._rebuild()
+        update, users, chats = packet
+        handler_type = _MESSAGE_UPDATES.get(type(update))
+        if handler_type is None:
+            return True
+        keys = self.watched[handler_type]
+        if keys is None:
+            return True
+        raw_keys = _raw_message_keys(update.message, users, chats)
+        waiting = self.demux.replies if handler_type is MessageHandler else self.demux.edits
+        if (
+            not keys.isdisjoint(raw_keys)
+            or ("chat", "me") in waiting
+            or not waiting.keys().isdisjoint(raw_keys)
+        ):
+            return True
+        Dispatcher.skipped_count += 1
+        return False
+
+    def _done(self, exc: Exception = None) -> asyncio.Future:
+        future = self.client.loop.create_future()
+        if exc:
+            future.set_exception(exc)
+        else:
+            future.set_result(None)
+        return future
 
     async def start(self):
         phone_masked = TelegramAccount.get_phone_masked(self.client.phone_number)
@@ -88,6 +460,7 @@ class Dispatcher(dispatcher.Dispatcher):
         if not self.client.no_updates:
             for _ in range(self.client.workers):
                 self.handler_worker_tasks.append(self.client.loop.create_task(self.handler_worker()))
+            self.offload_task = self.client.loop.create_task(self.offload_monitor())
 
             if not self.client.skip_updates:
                 await self.client.recover_gaps()
@@ -109,111 +482,179 @@ class Dispatcher(dispatcher.Dispatcher):
             for i in range(self.client.workers):
                 self.updates_queue.put_nowait(None)
 
-            for i in self.handler_worker_tasks:
+            if self.offload_task:
+                self.offload_task.cancel()
+                self.offload_task = None
+            for i in list(self.handler_worker_tasks):
                 i.cancel()
                 try:
                     await i
                 except asyncio.CancelledError:
                     pass
+            self.detached.clear()
+            self.released.clear()
             if clear_handlers:
                 self.handler_worker_tasks.clear()
                 self.groups.clear()
+                self._rebuild()
 
         logger.debug(f'Telegram 更新分配器已停止: "{phone_masked}".')
 
     def add_handler(self, handler, group: int):
-        async def fn():
-            async with self.mutex:
-                if group not in self.groups:
-                    self.groups[group] = []
-                    self.groups = OrderedDict(sorted(self.groups.items()))
-                self.groups[group].append(handler)
-                # logger.debug(f"增加了 Telegram 更新处理器: {handler.__class__.__name__}.")
-
-        return self.client.loop.create_task(fn())
+        """增加处理器并立即生效, 返回已完成的 Future 以兼容 await 调用"""
+        if group not in self.groups:
+            self.groups[group] = []
+            self.groups = OrderedDict(sorted(self.groups.items()))
+        self.groups[group].append(handler)
+        self._rebuild()
+        return self._done()
 
     def remove_handler(self, handler, group: int):
-        async def fn():
-            async with self.mutex:
-                if group not in self.groups:
-                    raise ValueError(f"Group {group} does not exist. Handler was not removed.")
-                self.groups[group].remove(handler)
-                # logger.debug(f"移除了 Telegram 更新处理器: {handler.__class__.__name__}.")
-
-        return self.client.loop.create_task(fn())
+        """移除处理器并立即生效, 返回已完成的 Future 以兼容 await 调用"""
+        if group not in self.groups:
+            return self._done(ValueError(f"Group {group} does not exist. Handler was not removed."))
+        try:
+            self.groups[group].remove(handler)
+        except ValueError as e:
+            return self._done(e)
+        self._rebuild()
+        return self._done()
 
     async def handler_worker(self):
+        worker = asyncio.current_task()
+        _current_worker.set(worker)
         while True:
-            packet = await self.updates_queue.get()
+            key, packet = await self.updates_queue.get()
             Dispatcher.updates_count += 1
 
             if packet is None:
                 break
 
+            self.busy[worker] = (self.client.loop.time(), key)
             try:
-                update, users, chats = packet
-                parser = self.update_parsers.get(type(update), None)
+                await self.process(packet)
+            finally:
+                del self.busy[worker]
+                if worker in self.released:
+                    self.released.discard(worker)
+                else:
+                    self.updates_queue.release(key)
 
-                try:
-                    parsed_update, handler_type = (
-                        await parser(update, users, chats) if parser is not None else (None, type(None))
-                    )
-                except (ValueError, BadRequest) as e:
-                    logger.warning(f"更新处理器发生错误, 可能遗漏消息.")
-                    show_exception(e, regular=False)
-                    continue
+            if worker in self.detached:
+                self.detached.discard(worker)
+                self.handler_worker_tasks.remove(worker)
+                break
 
-                async with self.mutex:
-                    groups = {i: g[:] for i, g in self.groups.items()}
-
-                for group in groups.values():
-                    for handler in group:
-                        args = None
-
-                        if isinstance(handler, handler_type):
-                            try:
-                                if await handler.check(self.client, parsed_update):
-                                    args = (parsed_update,)
-                            except Exception as e:
-                                logger.warning(f"更新处理器发生错误, 可能遗漏消息.")
-                                show_exception(e, regular=False)
-                                continue
-
-                        elif isinstance(handler, RawUpdateHandler):
-                            try:
-                                if await handler.check(self.client, update):
-                                    args = (update, users, chats)
-                            except Exception as e:
-                                logger.warning(f"更新处理器发生错误, 可能遗漏消息.")
-                                show_exception(e, regular=False)
-                                continue
-
-                        if args is None:
-                            continue
+    def detach(self, worker: asyncio.Task):
+        """将正在处理更新的工作协程标记为脱离, 并启动新的工作协程补足数量, 脱离的协程完成当前更新后退出.
+
+        脱离不释放其会话. 脱离的工作协程至多 client.workers 个, 达到上限时返回 False, 由 offload_monitor 稍后重试.
+        """
+        if worker not in self.busy:
+            return False
+        if worker in self.detached:
+            return True
+        if len(self.detached) >= self.client.workers:
+            return False
+        self.detached.add(worker)
+        self.handler_worker_tasks.append(self.client.loop.create_task(self.handler_worker()))
+        return True
+
+    def release_chat(self, worker: asyncio.Task = None):
+        """释放工作协程 (默认为当前工作协程) 所持有的会话并将其脱离, 用于处理器等待同一会话的后续消息前.
+
+        会话被释放后其后续更新可能先于当前更新处理完成, 因此仅在明确等待后续消息时调用.
+        """
+        worker = worker or _current_worker.get()
+        if worker not in self.busy or worker in self.released:
+            return
+        self.released.add(worker)
+        self.updates_queue.release(self.busy[worker][1])
+        self.detach(worker)
+
+    async def offload_monitor(self):
+        """将处理超过 offload_after 秒或已释放会话的工作协程脱离."""
+        while True:
+            await asyncio.sleep(self.offload_after)
+            now = self.client.loop.time()
+            for worker, (start, _) in list(self.busy.items()):
+                if worker not in self.detached and (
+                    worker in self.released or now - start > self.offload_after
+                ):
+                    self.detach(worker)
+
+    async def process(self, packet):
+        """处理单个更新."""
+        try:
+            update, users, chats = packet
+            parser = self.update_parsers.get(type(update), None)
 
+            try:
+                parsed_update, handler_type = (
+                    await parser(update, users, chats) if parser is not None else (None, type(None))
+                )
+            except (ValueError, BadRequest) as e:
+                logger.warning(f"更新处理器发生错误, 可能遗漏消息.")
+                show_exception(e, regular=False)
+                return
+
+            if any(g.stale() for g in self.snapshot):
+                self._rebuild()
+            if isinstance(parsed_update, types.Message):
+                edited = handler_type is EditedMessageHandler
+                if await self.demux.resolve(self.client, parsed_update, edited=edited):
+                    return
+                keys = _message_keys(parsed_update)
+            else:
+                keys = None
+            for group in self.snapshot:
+                for handler in group.select(keys):
+                    args = None
+
+                    if isinstance(handler, handler_type):
                         try:
-                            if inspect.iscoroutinefunction(handler.callback):
-                                await handler.callback(self.client, *args)
-                            else:
-                                await self.client.loop.run_in_executor(
-                                    self.client.executor, handler.callback, self.client, *args
-                                )
-                        except pyrogram.StopPropagation:
-                            raise
-                        except pyrogram.ContinuePropagation:
+                            if await handler.check(self.client, parsed_update):
+                                args = (parsed_update,)
+                        except Exception as e:
+                            logger.warning(f"更新处理器发生错误, 可能遗漏消息.")
+                            show_exception(e, regular=False)
                             continue
+
+                    elif isinstance(handler, RawUpdateHandler):
+                        try:
+                            if await handler.check(self.client, update):
+                                args = (update, users, chats)
                         except Exception as e:
-                            logger.error(f"更新回调函数内发生错误.")
+                            logger.warning(f"更新处理器发生错误, 可能遗漏消息.")
                             show_exception(e, regular=False)
-                        break
-                    else:
+                            continue
+
+                    if args is None:
+                        continue
+
+                    try:
+                        if inspect.iscoroutinefunction(handler.callback):
+                            await handler.callback(self.client, *args)
+                        else:
+                            await self.client.loop.run_in_executor(
+                                self.client.executor, handler.callback, self.client, *args
+                            )
+                    except pyrogram.StopPropagation:
+                        raise
+                    except pyrogram.ContinuePropagation:
                         continue
+                    except Exception as e:
+                        logger.error(f"更新回调函数内发生错误.")
+                        show_exception(e, regular=False)
                     break
-            except pyrogram.StopPropagation:
-                pass
-            except Exception as e:
-                logger.warning("更新控制器错误.")
-                show_exception(e, regular=False)
+                else:
+                    continue
+                break
+        except pyrogram.StopPropagation:
+            pass
+        except Exception as e:
+            logger.warning("更新控制器错误.")
+            show_exception(e, regular=False)
 
 
 class FileStorage(SQLiteStorage):
@@ -268,6 +709,9 @@ class FileStorage(SQLiteStorage):
             self.conn.execute("PRAGMA journal_mode=WAL")
         else:
             self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA cache_size=-8192")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
 
         # Check if database has required tables before calling update
         database_is_valid = False
@@ -333,9 +777,9 @@ class FileStorage(SQLiteStorage):
                 await self.date(0)
         else:
             await self.update()
-
-        with self.conn:
-            self.conn.execute("VACUUM")
+            # 仅在空闲页较多时重写数据库
+            with self.conn:
+                vacuum_sqlite(self.conn)
 
     async def delete(self):
         try:
@@ -345,6 +789,11 @@ class FileStorage(SQLiteStorage):
         except OSError as e:
             logger.warning(f"删除会话文件失败: {self.database}, 错误: {e}")
             raise
+        for suffix in ("-wal", "-shm"):
+            try:
+                os.remove(f"{self.database}{suffix}")
+            except OSError:
+                pass
 
 
 class Client(pyrogram.Client):
@@ -357,12 +806,17 @@ class Client(pyrogram.Client):
             )
         else:
             self.storage = FileStorage(
-                self.name, workdir=self.workdir, session_string=self.session_string, in_memory=self.in_memory
+                self.name,
+                workdir=self.workdir,
+                session_string=self.session_string,
+                in_memory=self.in_memory,
+                use_wal=True,
             )
 
         self.dispatcher: Dispatcher = Dispatcher(self)
 
         self.stop_handlers = []
+        self.link_channel = None
 
     async def authorize(self):
         if self.bot_token:
@@ -479,24 +933,32 @@ class Client(pyrogram.Client):
 
     @asynccontextmanager
     async def catch_reply(self, chat_id: Union[int, str], outgoing=False, filter=None):
-        async def handler_func(client, message, future: asyncio.Future):
-            try:
-                future.set_result(message)
-            except asyncio.InvalidStateError:
-                pass
-
-        future = asyncio.Future()
         f = filters.chat(chat_id)
+        keys = [("chat", k) for k in f]
         if not outgoing:
             f = f & (~filters.outgoing)
         if filter:
             f = f & filter
-        handler = MessageHandler(async_partial(handler_func, future=future), f)
-        await self.add_handler(handler, group=0)
-        try:
-            yield future
-        finally:
-            await self.remove_handler(handler, group=0)
+        if isinstance(chat_id, int):
+            peer_id = chat_id
+        else:
+            # 仅查询本地存储以提升该会话的优先级, 不发起网络请求, 无法确定 ID 时不提升
+            try:
+                username = chat_id.lower().strip("@")
+                peer_id = utils.get_peer_id(await self.storage.get_peer_by_username(username))
+            except (KeyError, ValueError):
+                peer_id = None
+        demux = self.dispatcher.demux
+        with demux.wait(demux.replies, keys, f) as future:
+            # 在处理器中等待回复时, 回复可能在同一会话中排队, 需释放该会话
+            self.dispatcher.release_chat()
+            if peer_id is not None:
+                self.dispatcher.updates_queue.boost(peer_id)
+            try:
+                yield future
+            finally:
+                if peer_id is not None:
+                    self.dispatcher.updates_queue.unboost(peer_id)
 
     @asynccontextmanager
     async def catch_edit(self, message: types.Message, filter=None):
@@ -506,22 +968,17 @@ class Client(pyrogram.Client):
 
             return filters.create(func, "MessageFilter")
 
-        async def handler_func(client, message, future: asyncio.Future):
-            try:
-                future.set_result(message)
-            except asyncio.InvalidStateError:
-                pass
-
-        future = asyncio.Future()
         f = filter_message(message.id)
         if filter:
             f = f & filter
-        handler = EditedMessageHandler(async_partial(handler_func, future=future), f)
-        await self.add_handler(handler, group=0)
-        try:
-            yield future
-        finally:
-            await self.remove_handler(handler, group=0)
+        demux = self.dispatcher.demux
+        with demux.wait(demux.edits, [("chat", message.chat.id)], f) as future:
+            self.dispatcher.release_chat()
+            self.dispatcher.updates_queue.boost(message.chat.id)
+            try:
+                yield future
+            finally:
+                self.dispatcher.updates_queue.unboost(message.chat.id)
 
     async def wait_reply(
         self,
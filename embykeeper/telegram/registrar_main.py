@@ -170,8 +170,10 @@ class RegisterManager:
                 f"下一次 \"{phone_masked}\" 账号 {site_name} 站点的注册将在 {t.strftime('%m-%d %H:%M %p')} 进行."
             )
             date_ctx = RunContext.get_or_create(f"registrar.date.{t.strftime('%Y%m%d')}")
-            account_ctx = RunContext.get_or_create(f"registrar.account.{account.phone}")
-            site_ctx = RunContext.get_or_create(f"registrar.site.{site_name}")
+            account_ctx = RunContext.get_or_create(
+                f"registrar.account.{account.phone}", account=account.phone
+            )
+            site_ctx = RunContext.get_or_create(f"registrar.site.{site_name}", site=site_name)
             return RunContext.prepare(
                 description=f"{account.phone} 账号 {site_name} 站点定时注册",
                 parent_ids=[account_ctx.id, date_ctx.id, site_ctx.id],
@@ -271,7 +273,9 @@ class RegisterManager:
                 async def loop():
                     while True:
                         try:
-                            account_ctx = RunContext.get_or_create(f"registrar.account.{account.phone}")
+                            account_ctx = await RunContext.aget_or_create(
+                                f"registrar.account.{account.phone}", account=account.phone
+                            )
                             await RunContext.run(
                                 lambda c: self._run_single_site(c, account, site_name, site_config),
                                 description=f"{account.phone} 账号 {site_name} 站点间隔注册",
@@ -366,8 +370,12 @@ class RegisterManager:
                 async def loop():
                     while True:
                         try:
-                            account_ctx = RunContext.get_or_create(f"register.account.{account.phone}")
-                            site_ctx = RunContext.get_or_create(f"register.site.{site_name}")
+                            account_ctx = await RunContext.aget_or_create(
+                                f"register.account.{account.phone}", account=account.phone
+                            )
+                            site_ctx = await RunContext.aget_or_create(
+                                f"register.site.{site_name}", site=site_name
+                            )
                             ctx = RunContext.prepare(
                                 description=f"{client.me.full_name} 账号 {site_name} 站点间隔注册",
                                 parent_ids=[account_ctx.id, site_ctx.id],
@@ -468,7 +476,7 @@ class RegisterManager:
                 log.warning(f"站点 {site_name} 未配置注册设置, 将跳过")
                 continue
 
-            site_ctx = RunContext.prepare(f"{site_name} 站点注册", parent_ids=ctx.id)
+            site_ctx = RunContext.prepare(f"{site_name} 站点注册", parent_ids=ctx.id, site=site_name)
             registers.append(
                 cls(
                     client,
@@ -11,6 +11,7 @@ from pathlib import Path
 from typing import List
 import os
 import random
+import time
 
 import httpx
 from pyrogram.errors import ApiIdPublishedFlood, AuthKeyDuplicated, BadMsgNotification, RPCError, Unauthorized
@@ -46,28 +47,36 @@ API_HASH = _decode(_hash)
 class ClientsSession:
     pool = {}
     lock = asyncio.Lock()
-    watch = None
+    registered = False
+    timeouts = {}  # 各账号空闲断开时间
+    timers = {}  # 空闲账号的断开定时器
+    cleaners = set()
+    login_sem = None
+    probes = {}  # (检测项目, 代理) => (检测时间, 检测任务)
+    probe_ttl = 600
 
     @classmethod
-    async def watchdog(cls, timeout=120):
-        logger.debug("Telegram 账号池看门狗启动.")
-        counter = {}
-        while True:
-            await asyncio.sleep(10)
-            for p in list(cls.pool):
-                try:
-                    if cls.pool[p][1] <= 0:
-                        if p in counter:
-                            counter[p] += 1
-                            if counter[p] >= timeout / 10:
-                                counter[p] = 0
-                                await cls.clean(p)
-                        else:
-                            counter[p] = 1
-                    else:
-                        counter.pop(p, None)
-                except (TypeError, KeyError):
-                    pass
+    def schedule_clean(cls, phone: str):
+        """账号计数降至 0 时启动断开定时器."""
+        cls.cancel_clean(phone)
+        timeout = cls.timeouts.get(phone)
+        if timeout is None:
+            timeout = 120
+        cls.timers[phone] = asyncio.get_running_loop().call_later(timeout, cls._fire_clean, phone)
+
+    @classmethod
+    def cancel_clean(cls, phone: str):
+        """账号被再次使用时取消断开定时器."""
+        timer = cls.timers.pop(phone, None)
+        if timer:
+            timer.cancel()
+
+    @classmethod
+    def _fire_clean(cls, phone: str):
+        cls.timers.pop(phone, None)
+        task = asyncio.create_task(cls.clean(phone))
+        cls.cleaners.add(task)
+        task.add_done_callback(cls.cleaners.discard)
 
     @classmethod
     async def clean(cls, phone: str, force: bool = False):
@@ -86,6 +95,7 @@ class ClientsSession:
             except TypeError:
                 return
             if force or (not ref):
+                cls.cancel_clean(phone)
                 phone_masked = TelegramAccount.get_phone_masked(client.phone_number)
                 logger.debug(f'正在停止账号 "{phone_masked}" 上的监听和任务.')
                 cls.pool.pop(phone, None)
@@ -122,13 +132,14 @@ class ClientsSession:
         self.accounts = accounts
         self.phones = []
         self.done = asyncio.Queue()
+        self.joiners = []
         self.in_memory = in_memory
 
         self._proxy = proxy
         self._basedir = basedir
 
-        if not self.watch:
-            self.__class__.watch = asyncio.create_task(self.watchdog())
+        if not self.registered:
+            self.__class__.registered = True
             var.exit_handlers.append(self.__class__.shutdown)
 
     @property
@@ -139,6 +150,27 @@ class ClientsSession:
     def proxy(self):
         return self._proxy or (config.proxy if config.telegram.use_proxy else None)
 
+    def probe(self, func):
+        """在进程内缓存网络 / 时间检测的结果, 过期后在后台刷新, 刷新完成前沿用上次结果.
+
+        返回的任务为各会话共享, 等待时需使用 asyncio.shield; 被取消或出错的检测将重新进行.
+        """
+        key = (func.__name__, get_proxy_str(self.proxy))
+        now = time.monotonic()
+        entry = self.probes.get(key, None)
+        if entry:
+            checked, task = entry
+            failed = task.get_loop() is not asyncio.get_running_loop() or (
+                task.done() and (task.cancelled() or task.exception() is not None)
+            )
+            if not failed:
+                if task.done() and now - checked >= self.probe_ttl:
+                    self.probes[key] = (now, asyncio.create_task(func()))
+                return task
+        task = asyncio.create_task(func())
+        self.probes[key] = (now, task)
+        return task
+
     async def test_network(self):
         url = "https://telegram.org"
         proxy_str = get_proxy_str(self.proxy)
@@ -445,8 +477,16 @@ class ClientsSession:
             show_exception(e, regular=False)
             return None
 
+    @classmethod
+    def login_semaphore(cls):
+        """限制同时登录的账号数量."""
+        if cls.login_sem is None:
+            cls.login_sem = asyncio.Semaphore(max(1, config.telegram.login_concurrency or 1))
+        return cls.login_sem
+
     async def loginer(self, account: TelegramAccount):
-        client = await self.login(account)
+        async with self.login_semaphore():
+            client = await self.login(account)
         async with self.lock:
             if isinstance(client, Client) and client.me:
                 self.pool[account.phone] = (client, 1)
@@ -458,37 +498,40 @@ class ClientsSession:
                 self.pool[account.phone] = None
                 await self.done.put((account, None))
 
+    async def joiner(self, account: TelegramAccount, task: asyncio.Task):
+        """等待其他会话中正在进行的登录完成后增加账号计数."""
+        await asyncio.wait({task})
+        async with self.lock:
+            self.acquire(account)
+
+    def acquire(self, account: TelegramAccount):
+        """增加已登录账号的计数并交付客户端, 需持有锁."""
+        entry = self.pool.get(account.phone, None)
+        if not entry or isinstance(entry, asyncio.Task):
+            self.done.put_nowait((account, None))
+            return
+        client, ref = entry
+        ref += 1
+        self.pool[account.phone] = (client, ref)
+        self.cancel_clean(account.phone)
+        self.phones.append(account.phone)
+        self.done.put_nowait((account, client))
+        phone_masked = TelegramAccount.get_phone_masked(account.phone)
+        logger.debug(f'Telegram 账号池计数增加: "{phone_masked}" => {ref}')
+
     async def __aenter__(self):
-        await self.test_network()
-        asyncio.create_task(self.test_time())
-        for a in self.accounts:
-            try:
-                await self.lock.acquire()
+        await asyncio.shield(self.probe(self.test_network))
+        self.probe(self.test_time)
+        async with self.lock:
+            for a in self.accounts:
+                self.timeouts[a.phone] = a.idle_timeout
+                entry = self.pool.get(a.phone, None)
                 if a.phone not in self.pool:
                     self.pool[a.phone] = asyncio.create_task(self.loginer(a))
+                elif isinstance(entry, asyncio.Task):
+                    self.joiners.append(asyncio.create_task(self.joiner(a, entry)))
                 else:
-                    if not self.pool[a.phone]:
-                        await self.done.put((a, None))
-                        continue
-                    if isinstance(self.pool[a.phone], asyncio.Task):
-                        self.lock.release()
-                        await self.pool[a.phone]
-                        await self.lock.acquire()
-                    result = self.pool[a.phone]
-                    if not result:
-                        await self.done.put((a, None))
-                    client, ref = result
-                    ref += 1
-                    self.pool[a.phone] = (client, ref)
-                    self.phones.append(a.phone)
-                    await self.done.put((a, client))
-                    phone_masked = TelegramAccount.get_phone_masked(a.phone)
-                    logger.debug(f'Telegram 账号池计数增加: "{phone_masked}" => {ref}')
-            finally:
-                try:
-                    self.lock.release()
-                except RuntimeError:
-                    pass
+                    self.acquire(a)
         return self
 
     async def __aiter__(self):
@@ -500,6 +543,8 @@ class ClientsSession:
                 yield account, client
 
     async def __aexit__(self, type, value, tb):
+        for t in self.joiners:
+            t.cancel()
         async with self.lock:
             for phone in self.phones:
                 entry = self.pool.get(phone, None)
@@ -509,3 +554,5 @@ class ClientsSession:
                     self.pool[phone] = (client, ref)
                     phone_masked = TelegramAccount.get_phone_masked(phone)
                     logger.debug(f'Telegram 账号池计数降低: "{phone_masked}" => {ref}')
+                    if ref <= 0:
+                        self.schedule_clean(phone)
@@ -22,6 +22,8 @@ async def topper():
     """在控制台底部实时显示系统资源使用情况."""
 
     process = psutil.Process()
+    loop = asyncio.get_running_loop()
+    lag = 0.0
 
     def get_client_stats(pool: Dict[str, Tuple[Union[Client, Task], int]]) -> Tuple[int, int, int, str]:
         """统计 Client 状态数量"""
@@ -41,15 +43,21 @@ async def topper():
                 # 获取队列和任务统计
                 if hasattr(client, "dispatcher"):
                     try:
-                        qsize = client.dispatcher.updates_queue.qsize()
+                        queue = client.dispatcher.updates_queue
+                        high, normal, low = queue.depths()
+                        qsize = high + normal + low
                         tasks = client.dispatcher.handler_worker_tasks
                         active = sum(1 for t in tasks if t.get_coro().cr_await.__name__ != "get")
-                        if qsize > 0 or active > 0:
+                        if qsize > 0 or active > 0 or queue.dropped:
+                            # 按 高/中/低 优先级通道显示队列长度, 并显示低优先级通道丢弃的更新数
+                            text = f"{high}/{normal}/{low}:{active}/{len(tasks)}"
+                            if queue.dropped:
+                                text += f" -{queue.dropped}"
                             # 当队列超过10或handler使用率超过80%时显示红色
                             if qsize >= 10 or (active / len(tasks) >= 0.8):
-                                queue_stats.append(f"[red][{qsize}:{active}/{len(tasks)}][/red]")
+                                queue_stats.append(f"[red][{text}][/red]")
                             else:
-                                queue_stats.append(f"[{qsize}:{active}/{len(tasks)}]")
+                                queue_stats.append(f"[{text}]")
                     except:
                         queue_stats.append("[Error]")
 
@@ -100,11 +108,30 @@ async def topper():
             if client_stats:
                 sys_stats.append((f"Tele: {'/'.join(client_stats)}{queue_text}", "bright_blue"))
 
-            if Link.post_count > 0:
-                sys_stats.append((f"Link: {Link.post_count}", "bright_blue"))
+            if Link.post_count > 0 or Link.hit_count or Link.join_count:
+                shared = (
+                    f" (Hit {Link.hit_count}, Join {Link.join_count})"
+                    if Link.hit_count or Link.join_count
+                    else ""
+                )
+                sys_stats.append((f"Link: {Link.post_count}{shared}", "bright_blue"))
 
             if Dispatcher.updates_count > 0:
-                sys_stats.append((f"Updates: {Dispatcher.updates_count}", "bright_blue"))
+                skipped = f" (Skip {Dispatcher.skipped_count})" if Dispatcher.skipped_count else ""
+                sys_stats.append((f"Updates: {Dispatcher.updates_count}{skipped}", "bright_blue"))
+
+        # 缓存命中率
+        from .cache import cache
+
+        cache_stats = cache.stats()
+        if cache_stats and sum(cache_stats):
+            hits, misses = cache_stats
+            sys_stats.append((f"Cache: {hits / (hits + misses):.0%} ({hits}/{hits + misses})", "bright_blue"))
+
+        # 事件循环延迟, 即定时器被阻塞而推迟执行的时间
+        if lag >= 0.05:
+            lag_text = f"[red]{lag * 1000:.0f}[/red]" if lag >= 0.5 else f"{lag * 1000:.0f}"
+            sys_stats.append((f"Lag: {lag_text} ms", "bright_blue"))
 
         if emby_used:
             from .emby.api import Emby
@@ -129,7 +156,9 @@ async def topper():
         live.start()
         while True:
             live.update(get_stats())
+            start = loop.time()
             await asyncio.sleep(1)
+            lag = max(0.0, loop.time() - start - 1)
     except (KeyboardInterrupt, asyncio.CancelledError):
         live.update("")  # 先清空显示内容
         live.stop()  # 然后停止 Live
@@ -3,6 +3,7 @@ from contextlib import asynccontextmanager
 from datetime import date, datetime, time, timedelta
 from pathlib import Path
 import random
+import sqlite3
 import sys
 import site
 import traceback
@@ -13,6 +14,9 @@ from loguru import logger
 from . import __url__, __name__, __version__
 from .schema import ProxyConfig
 
+# Telegram 会话文件中空闲页占比超过该值时, 打开时执行 VACUUM
+SESSION_VACUUM_RATIO = 0.3
+
 
 def get_path_frame(e, path):
     """获取指定路径下的最后一个错误栈帧.
@@ -309,6 +313,17 @@ def format_byte_human(B: float):
         return "{0:.2f} TB".format(B / TB)
 
 
+def vacuum_sqlite(conn: sqlite3.Connection, ratio: float = SESSION_VACUUM_RATIO) -> bool:
+    """当空闲页占比超过 ratio 时执行 VACUUM, 返回是否执行"""
+    total = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not free or free / total < ratio:
+        return False
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return True
+
+
 @asynccontextmanager
 async def nonblocking(lock: asyncio.Lock):
     """如果锁需要等待释放, 就跳过该部分."""
@@ -0,0 +1,379 @@
+import asyncio
+from datetime import datetime
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from embykeeper.config import config
+from embykeeper.schema import Config
+from embykeeper.cache import _MISSING, Cache, MemoryCache
+
+
+@pytest.fixture()
+def make_cache(tmp_path: Path):
+    """按缓存配置创建位于临时目录的缓存, 测试结束时停止定期清理并关闭缓存 I/O 线程."""
+    caches = []
+
+    def make(**cache_config) -> Cache:
+        config.basedir = tmp_path
+        config.set(Config(cache=cache_config))
+        caches.append(Cache())
+        return caches[-1]
+
+    yield make
+    for c in caches:
+        c.close()
+
+
+@pytest.fixture()
+def cache(make_cache):
+    return make_cache()
+
+
+def test_journal_replay(cache: Cache, make_cache):
+    cache.set("a.b", 1)
+    cache.set("a.c", [1, 2])
+    cache.delete("a.b")
+    cache.flush()
+    reloaded = make_cache()
+    assert reloaded.get("a.b") is None
+    assert reloaded.get("a.c") == [1, 2]
+
+
+def test_journal_torn_write(cache: Cache, make_cache, tmp_path: Path):
+    cache.set("x", 1)
+    cache.flush()
+    with open(tmp_path / "cache.json.journal", "a", encoding="utf-8") as f:
+        f.write('["set", "y", ')
+    reloaded = make_cache()
+    assert reloaded.get("x") == 1
+    assert reloaded.get("y") is None
+
+
+def test_journal_compact(cache: Cache, tmp_path: Path):
+    cache.set("a.b", 1)
+    cache.flush(compact=True)
+    assert (tmp_path / "cache.json.journal").stat().st_size == 0
+    with open(tmp_path / "cache.json", encoding="utf-8") as f:
+        assert json.load(f) == {"a": {"b": 1}}
+
+
+def test_sqlite_migrate(cache: Cache, make_cache):
+    cache.set("emby.env.example.com.user", {"device": "A", "client": "B"})
+    cache.set("runinfo.children.ABC", ["DEF"])
+    cache.flush()
+    sqlite = make_cache(backend="sqlite")
+    assert sqlite.get("emby.env.example.com.user") == {"device": "A", "client": "B"}
+    assert sqlite.get_many(["runinfo.children.ABC", "missing"]) == {"runinfo.children.ABC": ["DEF"]}
+    sqlite.delete_by_prefix("emby.env")
+    assert sqlite.find_by_prefix("") == ["runinfo.children.ABC"]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_ttl_and_retention(make_cache, backend: str):
+    cache = make_cache(backend=backend, retention={"runs": {"max_entries": 2}})
+    cache.set("short", 1, ttl=-1)
+    cache.set("long", 1, ttl=3600)
+    assert cache.get("short") is None
+    assert cache.get("long") == 1
+    cache.sweep()
+    assert cache.find_by_prefix("short") == []
+    for i in range(4):
+        cache.set(f"runs.R{i}", i)
+    assert cache.sweep() == 2
+    assert sorted(cache.find_by_prefix("runs")) == ["runs.R2", "runs.R3"]
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_async_api(make_cache, backend: str):
+    cache = make_cache(backend=backend)
+
+    async def main():
+        await cache.aset("a.b", 1)
+        await cache.aset_many({"a.c": 2, "a.d": 3})
+        await cache.adelete("a.d")
+        return await cache.aget("a.b"), await cache.aget_many(["a.c", "a.d"])
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(main()) == (1, {"a.c": 2})
+    finally:
+        loop.close()
+    cache.submit(cache.set, "x", 1, keys=["x"])
+    assert cache.get("x") == 1
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_submit_then_sync_write(make_cache, backend: str):
+    cache = make_cache(backend=backend)
+
+    def slow_set(key, value):
+        time.sleep(0.1)
+        cache.backend.set(key, value, None)
+
+    cache.submit(slow_set, "x", "old", keys=["x"])
+    cache.set("x", "new")
+    cache.submit(slow_set, "y.z", "old", keys=["y.z"])
+    cache.delete("y")
+    cache._executor.submit(lambda: None).result()
+    assert cache.get("x") == "new"
+    assert cache.get("y.z") is None
+
+    # 同步读写仅等待涉及相同键的已提交写入
+    cache.submit(slow_set, "a.b", 1, keys=["a.b"])
+    start = time.perf_counter()
+    assert cache.get("c") is None
+    assert time.perf_counter() - start < 0.05
+    assert cache.get_by_prefix("a.") == {"a.b": 1}
+
+
+def test_sweep_after_submitted_writes(make_cache, monkeypatch: pytest.MonkeyPatch):
+    import threading
+
+    monkeypatch.setattr(Cache, "sweep_interval", 0.01)
+    threads = []
+    monkeypatch.setattr(Cache, "sweep", lambda self: threads.append(threading.current_thread().name) or 0)
+    cache = make_cache(backend="sqlite")
+    cache.submit(time.sleep, 0.2)
+    time.sleep(0.1)
+    # 清理与已提交的写入在同一缓存 I/O 线程中依次进行
+    assert threads == []
+    time.sleep(0.2)
+    cache.close()
+    assert threads and all(t.startswith("cache-io") for t in threads)
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_query_by_prefix(make_cache, backend: str):
+    cache = make_cache(backend=backend)
+    cache.set_many(
+        {
+            "idx.A": [10, 1, "u", ["P"]],
+            "idx.B": [20, 2, "u", ["P", "Q"]],
+            "idx.C": [None, 1, "v", []],
+            "idx.D": {"x": 1},
+        }
+    )
+    assert sorted(cache.query_by_prefix("idx.", [])) == ["idx.A", "idx.B", "idx.C"]
+    assert sorted(cache.query_by_prefix("idx.", [(1, "in", [1])])) == ["idx.A", "idx.C"]
+    assert list(cache.query_by_prefix("idx.", [(0, ">=", 15)])) == ["idx.B"]
+    assert list(cache.query_by_prefix("idx.", [(0, "<", 15), (2, "==", "u")])) == ["idx.A"]
+    assert list(cache.query_by_prefix("idx.", [(3, "has", "Q")])) == ["idx.B"]
+    assert cache.query_by_prefix("idx.", [(1, "in", [])]) == {}
+    if backend == "sqlite":
+        # 首个元素的范围条件以 INDEXED BY 指定索引扫描, 索引不可用时查询将报错
+        indexes = [row[1] for row in cache.backend._conn.execute("PRAGMA index_list(cache)")]
+        assert "cache_list_head" in indexes
+        assert list(cache.query_by_prefix("idx.", [(0, ">=", 15), (0, "<", 25)])) == ["idx.B"]
+
+
+def test_memory_cache():
+    memory = MemoryCache(2, {"": 60, "short": 0})
+    generation = memory.generation
+    memory.put("a.b", {"x": 1}, generation)
+    memory.put("a.c", _MISSING, generation)
+    memory.put("short.a", 1)
+    assert memory.get("a.b") == {"x": 1}
+    assert memory.get("a.c") is _MISSING
+    assert memory.get("short.a") is None
+    memory.put("a.d", 1)
+    assert memory.get("a.b") is None
+    memory.invalidate(prefixes=["a."])
+    memory.put("a.e", 1, generation)
+    assert memory.get("a.d") is None and memory.get("a.e") is None
+    assert (memory.hits, memory.misses) == (2, 4)
+
+
+def test_find_by_prefix(cache: Cache):
+    cache.set_many({"a.b.c": 1, "a.bc": 2, "a.d": 3, "x": 4})
+    assert sorted(cache.find_by_prefix("a.b")) == ["a.b.c", "a.bc"]
+    assert cache.find_by_prefix("a.b.") == ["a.b.c"]
+    assert cache.find_by_prefix("a.d.e") == []
+    assert sorted(cache.find_by_prefix("")) == ["a.b.c", "a.bc", "a.d", "x"]
+
+
+def test_runinfo_persistence(make_cache, monkeypatch: pytest.MonkeyPatch):
+    from embykeeper import runinfo
+    from embykeeper.runinfo import RunContext, RunStatus
+
+    monkeypatch.setattr(runinfo, "cache", make_cache())
+    parent = RunContext.prepare("parent")
+    child = RunContext.prepare("child", parent_ids=[parent.id])
+    child.log.add("INFO", "first", datetime.now())
+    child.save()
+    child.log.add("INFO", "second", datetime.now())
+    child.finish(RunStatus.SUCCESS)
+    assert parent.get_running_children() == []
+    loaded = RunContext.get(child.id)
+    assert loaded.status == RunStatus.SUCCESS
+    assert [r.message for r in loaded.log][:2] == ["first", "second"]
+    assert len(runinfo.cache.find_by_prefix(f"runinfo.logs.{child.id}.")) == 2
+    assert [c.id for c in parent.get_children()] == [child.id]
+    parent.finish(RunStatus.SUCCESS)
+
+
+def test_runinfo_shared_log_sink(make_cache, monkeypatch: pytest.MonkeyPatch):
+    from loguru import logger
+
+    from embykeeper import runinfo
+    from embykeeper.runinfo import RunContext, RunStatus
+
+    monkeypatch.setattr(runinfo, "cache", make_cache())
+    runs = [RunContext.prepare(f"run {i}") for i in range(3)]
+    sink_id = runinfo._sink_id
+
+    async def emit(run: RunContext):
+        log = run.bind_logger(logger)
+        for i in range(3):
+            log.info(f"{run.id} {i}")
+            await asyncio.sleep(0)
+
+    async def main():
+        await asyncio.gather(*(emit(run) for run in runs))
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+    logger.info("unbound")
+    # 并发任务共用一个日志处理器, 每条日志仅写入所属任务
+    later = RunContext.prepare("later")
+    assert sink_id is not None and runinfo._sink_id == sink_id
+    for run in runs:
+        assert [r.message for r in run.log] == [f"{run.id} {i}" for i in range(3)]
+    assert len(later.log) == 0
+    for run in runs + [later]:
+        run.finish(RunStatus.SUCCESS)
+
+
+def test_runinfo_log_buffer(make_cache, monkeypatch: pytest.MonkeyPatch):
+    from embykeeper import runinfo
+    from embykeeper.runinfo import LogBuffer, RunContext, RunStatus
+
+    monkeypatch.setattr(runinfo, "cache", make_cache())
+    buffer = LogBuffer(capacity=3)
+    for i in range(5):
+        buffer.add("INFO", str(i), datetime.now())
+    # 超出容量时丢弃最旧的记录
+    assert [r.message for r in buffer] == ["2", "3", "4"]
+    assert (len(buffer), buffer.total, buffer.maxlen) == (3, 5, 3)
+
+    run = RunContext.prepare("run", log_capacity=2)
+    for level in ("DEBUG", "INFO", "WARNING"):
+        run.log.add(level, level.lower(), datetime.now())
+    data = run.model_dump(mode="json")
+    loaded = RunContext.model_validate(data)
+    assert isinstance(loaded.log, LogBuffer)
+    assert [(r.level, r.message) for r in loaded.log] == [("INFO", "info"), ("WARNING", "warning")]
+
+    # 旧版本以列表形式保存的日志
+    data["log"] = [{"level": "INFO", "message": "old", "time": "2024-01-01T00:00:00"}]
+    legacy = RunContext.model_validate(data)
+    assert isinstance(legacy.log, LogBuffer)
+    assert [(r.message, r.time) for r in legacy.log] == [("old", datetime(2024, 1, 1))]
+    run.finish(RunStatus.SUCCESS)
+
+
+def test_runinfo_legacy_children(make_cache, monkeypatch: pytest.MonkeyPatch):
+    from embykeeper import runinfo
+    from embykeeper.runinfo import RunContext, RunStatus
+
+    monkeypatch.setattr(runinfo, "cache", make_cache())
+    parent = RunContext.prepare("parent")
+    old = RunContext.prepare("old")
+    old.finish(RunStatus.SUCCESS)
+    runinfo.flush_runinfo()
+    runinfo.cache.set(f"runinfo.children.{parent.id}", [old.id])
+    new = RunContext.prepare("new", parent_ids=[parent.id])
+    new.finish(RunStatus.SUCCESS)
+    assert [c.id for c in parent.get_children()] == [old.id, new.id]
+
+    async def main():
+        children = await parent.aget_children()
+        return [c.id for c in children], await RunContext.aget(new.id), await new.aget_parents()
+
+    loop = asyncio.new_event_loop()
+    try:
+        ids, loaded, parents = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    assert ids == [old.id, new.id]
+    assert loaded.status == RunStatus.SUCCESS and loaded.log
+    assert parents == [parent]
+    parent.finish(RunStatus.SUCCESS)
+
+
+def test_runinfo_query(make_cache, monkeypatch: pytest.MonkeyPatch):
+    from embykeeper import runinfo
+    from embykeeper.runinfo import RunContext, RunStatus
+
+    monkeypatch.setattr(runinfo, "cache", make_cache(backend="sqlite"))
+    account_ctx = RunContext.get_or_create("checkiner.account.123", account="123")
+    runs = []
+    for site, status in (("a", RunStatus.FAIL), ("b", RunStatus.SUCCESS), ("c", RunStatus.FAIL)):
+        run = RunContext.prepare(f"{site} 站点签到", parent_ids=[account_ctx.id], site=site)
+        run.start()
+        run.finish(status)
+        runs.append(run)
+    failed = RunContext.query(status=RunStatus.FAIL, account="123")
+    assert [r.id for r in failed] == [runs[2].id, runs[0].id]
+    loop = asyncio.new_event_loop()
+    try:
+        failed = loop.run_until_complete(RunContext.aquery(status=RunStatus.FAIL, since=runs[0].start_time))
+    finally:
+        loop.close()
+    assert [r.id for r in failed] == [runs[2].id, runs[0].id]
+    assert [r.site for r in RunContext.query(parent_id=account_ctx.id, limit=1, offset=1)] == ["b"]
+    assert RunContext.query(site="b")[0].log
+    assert [r.id for r in account_ctx.get_children()] == [r.id for r in runs]
+    account_ctx.finish()
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_compactor_uses_cache_thread(make_cache, monkeypatch: pytest.MonkeyPatch, backend: str):
+    import threading
+
+    from embykeeper import clean
+
+    c = make_cache(backend=backend)
+    monkeypatch.setattr(clean, "cache", c)
+    threads = []
+    monkeypatch.setattr(clean, "compact_cache", lambda: threads.append(threading.current_thread().name) or "")
+
+    async def main():
+        task = asyncio.create_task(clean.compactor(0.01 / 3600))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+    assert threads and all(t.startswith("cache-io") for t in threads)
+
+
+def test_compact_cache(make_cache, monkeypatch: pytest.MonkeyPatch):
+    from embykeeper import clean, runinfo
+    from embykeeper.runinfo import RunContext, RunStatus
+
+    c = make_cache()
+    monkeypatch.setattr(runinfo, "cache", c)
+    monkeypatch.setattr(clean, "cache", c)
+    monkeypatch.setattr(clean, "ORPHAN_GRACE", -1)
+    run = RunContext.prepare("run")
+    run.finish(RunStatus.SUCCESS)
+    c.set("runinfo.OLD", json.dumps({"id": "OLD", "end_time": "2000-01-01T00:00:00"}))
+    c.set("runinfo.index.GONE", [0, 5, None, None, []])
+    c.set("runinfo.edges.P.GONE", 1)
+    c.set("runinfo.children.Q", [run.id, "GONE"])
+    result = clean.compact_cache()
+    assert "删除 3 条" in result
+    assert c.get("runinfo.OLD") is None
+    assert c.get("runinfo.children.Q") == [run.id]
+    assert RunContext.get(run.id).status == RunStatus.SUCCESS
@@ -0,0 +1,321 @@
+import asyncio
+from types import MethodType, SimpleNamespace
+
+from pyrogram import filters, raw, types, utils
+from pyrogram.handlers import EditedMessageHandler, MessageHandler
+
+from embykeeper.telegram.pyrogram import Client, Dispatcher, UpdateQueue
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def packet(chat_id: int, text: str, msg_id: int = 1, edit: bool = False):
+    """私聊以正数, 群组以负数表示的原始消息更新."""
+    peer = raw.types.PeerUser(user_id=chat_id) if chat_id > 0 else raw.types.PeerChat(chat_id=-chat_id)
+    message = raw.types.Message(id=msg_id, peer_id=peer, date=0, message=text)
+    update_type = raw.types.UpdateEditMessage if edit else raw.types.UpdateNewMessage
+    return update_type(message=message, pts=0, pts_count=0), {}, {}
+
+
+async def parse(update, users, chats):
+    m = update.message
+    message = types.Message(id=m.id, chat=types.Chat(id=utils.get_peer_id(m.peer_id)), text=m.message)
+    handler_type = EditedMessageHandler if isinstance(update, raw.types.UpdateEditMessage) else MessageHandler
+    return message, handler_type
+
+
+def make_client(workers: int = 2):
+    client = SimpleNamespace(
+        loop=asyncio.get_running_loop(),
+        workers=workers,
+        no_updates=False,
+        skip_updates=True,
+        start_handler=None,
+        stop_handler=None,
+        phone_number="+10000000000",
+        executor=None,
+    )
+    client.dispatcher = Dispatcher(client)
+    client.dispatcher.update_parsers.update(
+        {raw.types.UpdateNewMessage: parse, raw.types.UpdateEditMessage: parse}
+    )
+    client.catch_reply = MethodType(Client.catch_reply, client)
+    client.catch_edit = MethodType(Client.catch_edit, client)
+    return client
+
+
+async def settle(dispatcher: Dispatcher, timeout: float = 2):
+    """等待队列中的更新全部处理完成."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while dispatcher.updates_queue.chats or dispatcher.busy:
+        assert loop.time() < deadline, "updates not drained"
+        await asyncio.sleep(0.01)
+
+
+def test_snapshot_copy_on_write():
+    async def main():
+        client = make_client()
+        d = client.dispatcher
+        seen = []
+
+        async def second(_, message):
+            seen.append(("second", message.text))
+
+        async def first(_, message):
+            seen.append(("first", message.text))
+            await d.remove_handler(h1, 0)
+            await d.add_handler(MessageHandler(second), 0)
+
+        h1 = MessageHandler(first)
+        old = d.snapshot
+        await d.add_handler(h1, 0)
+        assert old == () and len(d.snapshot) == 1
+        await d.start()
+        d.updates_queue.put_nowait(packet(1, "a", 1))
+        await settle(d)
+        d.updates_queue.put_nowait(packet(1, "b", 2))
+        await settle(d)
+        await d.stop()
+        assert seen == [("first", "a"), ("second", "b")]
+
+    run(main())
+
+
+def test_route_index():
+    async def main():
+        client = make_client()
+        d = client.dispatcher
+        seen = []
+
+        def record(name):
+            async def callback(_, message):
+                seen.append((name, message.text))
+                message.continue_propagation()
+
+            return callback
+
+        await d.add_handler(MessageHandler(record("a"), filters.chat(1)), 0)
+        await d.add_handler(MessageHandler(record("any"), filters.text), 0)
+        await d.add_handler(MessageHandler(record("b"), filters.chat([2, 3]) & filters.text), 0)
+        group = d.snapshot[0]
+        assert group.unscoped == (1,)
+        assert group.index[("chat", 2)] == (2,)
+        assert [h.callback for h in group.select([("chat", 2)])] == [
+            group.handlers[1].callback,
+            group.handlers[2].callback,
+        ]
+        await d.start()
+        for chat in (1, 2, 4):
+            d.updates_queue.put_nowait(packet(chat, str(chat)))
+        await settle(d)
+        await d.stop(clear_handlers=False)
+        assert sorted(seen) == [("a", "1"), ("any", "1"), ("any", "2"), ("any", "4"), ("b", "2")]
+
+    run(main())
+
+
+def test_route_index_follows_filter_changes():
+    async def main():
+        client = make_client()
+        d = client.dispatcher
+        seen = []
+        chats = filters.chat(1)
+
+        async def callback(_, message):
+            seen.append(message.chat.id)
+
+        await d.add_handler(MessageHandler(callback, chats), 0)
+        chats.add(2)
+        await d.process(packet(2, "x"))
+        chats.discard(2)
+        await d.process(packet(2, "y", 2))
+        assert seen == [2]
+
+    run(main())
+
+
+def test_chat_order_and_offload():
+    async def main():
+        client = make_client(workers=1)
+        d = client.dispatcher
+        d.offload_after = 0.05
+        seen = []
+
+        async def callback(_, message):
+            if message.text == "slow":
+                await asyncio.sleep(0.3)
+            seen.append(message.text)
+
+        await d.add_handler(MessageHandler(callback), 0)
+        await d.start()
+        d.updates_queue.put_nowait(packet(1, "slow", 1))
+        d.updates_queue.put_nowait(packet(-5, "group", 1))
+        d.updates_queue.put_nowait(packet(1, "after", 2))
+        await settle(d)
+        await d.stop()
+        # 脱离的工作协程不再占用工作协程数量, 群组消息不必等待耗时处理, 同一会话仍按顺序处理
+        assert seen.index("group") < seen.index("slow") < seen.index("after")
+        assert len(d.handler_worker_tasks) == 0
+
+    run(main())
+
+
+def test_detached_workers_capped():
+    async def main():
+        client = make_client(workers=1)
+        d = client.dispatcher
+        d.offload_after = 0.02
+        active = []
+        peak = 0
+
+        async def callback(_, message):
+            nonlocal peak
+            active.append(message.text)
+            peak = max(peak, len(active))
+            await asyncio.sleep(0.15)
+            active.remove(message.text)
+
+        await d.add_handler(MessageHandler(callback), 0)
+        await d.start()
+        for chat in range(1, 5):
+            d.updates_queue.put_nowait(packet(chat, str(chat)))
+        await settle(d)
+        await d.stop()
+        # 脱离的工作协程至多 client.workers 个
+        assert peak == 2
+
+    run(main())
+
+
+def test_handler_waits_for_reply_in_same_chat():
+    async def main():
+        client = make_client(workers=1)
+        d = client.dispatcher
+        d.offload_after = 10
+        replies = []
+
+        async def ask():
+            async with client.catch_reply(777) as f:
+                replies.append((await asyncio.wait_for(f, 1)).text)
+
+        async def callback(_, message):
+            # 与签到器相同, 在处理器创建的任务中等待
+            if message.text == "ask":
+                await asyncio.create_task(ask())
+
+        await d.add_handler(MessageHandler(callback, filters.chat(777)), 0)
+        await d.start()
+        d.updates_queue.put_nowait(packet(777, "ask", 1))
+        d.updates_queue.put_nowait(packet(777, "answer", 2))
+        await settle(d)
+        await d.stop()
+        assert replies == ["answer"]
+
+    run(main())
+
+
+def test_update_queue_lanes():
+    async def main():
+        queue = UpdateQueue()
+        queue.low_limit = 2
+        for i in range(3):
+            queue.put_nowait(packet(-5, f"g{i}", i))
+        queue.put_nowait(packet(1, "p"))
+        assert queue.dropped == 1
+        assert queue.depths() == [0, 1, 2]
+        key, p = await queue.get()
+        assert (key, p[0].message.message) == (1, "p")
+        queue.release(key)
+
+        # 提升会话时, 其已排队的更新一并移入高优先级通道
+        queue.put_nowait(packet(2, "q"))
+        queue.boost(-5)
+        assert queue.depths() == [2, 1, 0]
+        key, p = await queue.get()
+        assert (key, p[0].message.message) == (-5, "g1")
+        queue.unboost(-5)
+        queue.release(key)
+        assert queue.depths() == [0, 1, 1]
+        key, _ = await queue.get()
+        assert key == 2
+
+    run(main())
+
+
+def test_prefilter_skips_unwatched_chats():
+    async def main():
+        client = make_client()
+        d = client.dispatcher
+        seen = []
+        chats = filters.chat(1)
+
+        async def callback(_, message):
+            seen.append(message.text)
+
+        await d.add_handler(MessageHandler(callback, chats), 0)
+        skipped = Dispatcher.skipped_count
+        await d.start()
+        d.updates_queue.put_nowait(packet(1, "a"))
+        d.updates_queue.put_nowait(packet(2, "b"))
+        assert Dispatcher.skipped_count == skipped + 1
+        # 过滤器集合在注册后修改, 预过滤随之更新
+        chats.add(2)
+        d.updates_queue.put_nowait(packet(2, "c"))
+        await settle(d)
+        await d.stop()
+        assert sorted(seen) == ["a", "c"]
+
+    run(main())
+
+
+def test_reply_and_edit_demux():
+    async def main():
+        client = make_client()
+        d = client.dispatcher
+
+        async def get_peer_by_username(username):
+            if username == "somebot":
+                return raw.types.InputPeerUser(user_id=5, access_hash=0)
+            raise KeyError(username)
+
+        client.storage = SimpleNamespace(get_peer_by_username=get_peer_by_username)
+        seen = []
+
+        async def callback(_, message):
+            seen.append(message.text)
+
+        await d.add_handler(MessageHandler(callback), 0)
+        await d.add_handler(EditedMessageHandler(callback), 0)
+        await d.start()
+
+        async with client.catch_reply(1) as f:
+            assert d.updates_queue.boosted == {1: 1}
+            d.updates_queue.put_nowait(packet(1, "reply"))
+            assert (await asyncio.wait_for(f, 1)).text == "reply"
+        assert d.updates_queue.boosted == {}
+
+        sent = types.Message(id=7, chat=types.Chat(id=1))
+        async with client.catch_edit(sent) as f:
+            d.updates_queue.put_nowait(packet(1, "other edit", 8, edit=True))
+            d.updates_queue.put_nowait(packet(1, "edited", 7, edit=True))
+            assert (await asyncio.wait_for(f, 1)).text == "edited"
+
+        # 用户名仅在本地存储中解析
+        async with client.catch_reply("@SomeBot"):
+            assert d.updates_queue.boosted == {5: 1}
+        async with client.catch_reply("unknown"):
+            assert d.updates_queue.boosted == {}
+
+        d.updates_queue.put_nowait(packet(1, "plain", 9))
+        await settle(d)
+        await d.stop()
+        assert seen == ["other edit", "plain"]
+
+    run(main())
@@ -0,0 +1,367 @@
+import asyncio
+from io import BytesIO
+from pathlib import Path
+import time
+from types import SimpleNamespace
+
+from cachetools import TTLCache
+from PIL import Image
+from pyrogram import ContinuePropagation, raw, types
+from pyrogram.errors import FloodWait
+import pytest
+
+from embykeeper.cache import Cache
+from embykeeper.config import config
+from embykeeper.schema import Config
+from embykeeper.telegram import link as link_module
+from embykeeper.telegram.link import Link, LinkChannel
+
+
+@pytest.fixture(autouse=True)
+def link_state(monkeypatch):
+    monkeypatch.setattr(Link, "inflight", {})
+    monkeypatch.setattr(Link, "results", TTLCache(maxsize=256, ttl=60))
+    monkeypatch.setattr(Link, "hit_count", 0)
+    monkeypatch.setattr(Link, "join_count", 0)
+    monkeypatch.setattr(Link, "similar_hits", TTLCache(maxsize=256, ttl=600))
+
+
+@pytest.fixture()
+def store(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    config.basedir = tmp_path
+    config.set(Config())
+    cache = Cache()
+    monkeypatch.setattr(link_module, "cache", cache)
+    monkeypatch.setattr(link_module, "authed_services", {})
+    monkeypatch.setattr(link_module, "authed_services_locks", {})
+    yield cache
+    cache.close()
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class FakeQueue:
+    """记录会话优先级提升次数的更新队列."""
+
+    def __init__(self):
+        self.boosted = {}
+
+    def boost(self, key):
+        self.boosted[key] = self.boosted.get(key, 0) + 1
+
+    def unboost(self, key):
+        self.boosted[key] -= 1
+
+
+class FakeStorage:
+    async def get_peer_by_username(self, username):
+        if username != Link.bot:
+            raise KeyError(username)
+        return raw.types.InputPeerUser(user_id=42, access_hash=0)
+
+
+class FakeClient:
+    """按 respond 返回的 (延迟, 文本) 模拟机器人响应的客户端."""
+
+    def __init__(self, respond=None):
+        self.me = SimpleNamespace(id=7, full_name="Test")
+        self.dispatcher = SimpleNamespace(updates_queue=FakeQueue())
+        self.storage = FakeStorage()
+        self.link_channel = None
+        self.stop_handlers = []
+        self.handlers = []
+        self.events = []
+        self.deleted = []
+        self.propagated = []
+        self.respond = respond or (lambda cmd: (0, reply(cmd, cmd)))
+        self.last_id = 0
+
+    def message(self, text: str):
+        self.last_id += 1
+        return types.Message(id=self.last_id, chat=types.Chat(id=1), text=text)
+
+    async def add_handler(self, handler, group=0):
+        self.handlers.append((handler, group))
+
+    async def mute_chat(self, chat):
+        pass
+
+    async def send_message(self, chat, text, parse_mode=None):
+        self.events.append(("send", text))
+        response = self.respond(text)
+        if response:
+            delay, reply = response
+            asyncio.get_running_loop().call_later(delay, asyncio.ensure_future, self.receive(reply))
+        return self.message(text)
+
+    async def receive(self, text: str):
+        message = self.message(text)
+        self.events.append(("recv", text))
+        try:
+            await self.link_channel._handler(self, message)
+        except ContinuePropagation:
+            self.propagated.append(text)
+
+    async def delete_messages(self, chat, ids, revoke=True):
+        self.deleted.append((chat, list(ids)))
+
+
+def reply(cmd: str, answer: str):
+    return f"command = '{cmd}'\nstatus = 'ok'\nanswer = '{answer}'"
+
+
+def test_channel_routes_responses_by_command():
+    async def main():
+        delays = {"/a": 0.1, "/b": 0}
+        client = FakeClient(lambda cmd: (delays[cmd], reply(cmd, cmd[1:])))
+        link = Link(client)
+        a, b = await asyncio.gather(link.post("/a", name="a"), link.post("/b", name="b"))
+        assert (a["answer"], b["answer"]) == ("a", "b")
+        assert len(client.handlers) == 1
+        assert client.link_channel.pending == {}
+        await client.link_channel.deleter
+
+    run(main())
+
+
+def test_channel_serializes_identical_commands():
+    async def main():
+        client = FakeClient(lambda cmd: (0.05, reply(cmd, "x")))
+        link = Link(client)
+        await asyncio.gather(link.post("/same", name="a"), link.post("/same", name="b"))
+        # 机器人仅回显命令, 相同命令的第二个请求在第一个请求收到响应后才发送
+        assert [e for e, _ in client.events] == ["send", "recv", "send", "recv"]
+        await client.link_channel.deleter
+
+    run(main())
+
+
+def test_channel_boosts_bot_while_pending():
+    async def main():
+        client = FakeClient(lambda cmd: (0.05, reply(cmd, "x")) if cmd != "/lost" else None)
+        queue = client.dispatcher.updates_queue
+        link = Link(client)
+        channel = await LinkChannel.of(link)
+        tasks = [asyncio.create_task(link.post(cmd, name=cmd)) for cmd in ("/a", "/b")]
+        await asyncio.sleep(0.01)
+        # 多个等待中的请求仅提升一次, 全部完成后取消提升
+        assert queue.boosted == {42: 1}
+        await asyncio.gather(*tasks)
+        assert queue.boosted == {42: 0} and channel.boosted is None
+        # 等待超时的请求同样取消提升
+        assert await link.post("/lost", timeout=0.05, retries=1, name="lost") is None
+        assert queue.boosted == {42: 0} and channel.pending == {}
+        await channel.deleter
+
+    run(main())
+
+
+def test_channel_discards_and_propagates_unmatched():
+    async def main():
+        client = FakeClient()
+        link = Link(client)
+        channel = await LinkChannel.of(link)
+        channel.delete_delay = 0.01
+        await client.receive("not toml = ")
+        assert list(channel.deleting[1]) == [client.last_id]
+        await client.receive(reply("/other", "x"))
+        assert client.propagated == [reply("/other", "x")]
+        await channel.deleter
+        assert client.deleted == [(1, [1])]
+
+    run(main())
+
+
+def test_delete_queue_batches_per_chat():
+    async def main():
+        client = FakeClient()
+        floods = [FloodWait(value=0)]
+
+        async def delete_messages(chat, ids, revoke=True):
+            if floods:
+                raise floods.pop()
+            client.deleted.append((chat, list(ids)))
+
+        client.delete_messages = delete_messages
+        link = Link(client)
+        channel = await LinkChannel.of(link)
+        channel.delete_delay = 0.05
+        channel.delete_batch = 3
+        messages = [types.Message(id=i, chat=types.Chat(id=i % 2 + 1)) for i in range(1, 9)]
+        channel.discard(messages[:2])
+        # 等待删除完成的消息与队列中其他消息合并为同一批次, 访问超限时等待后重试
+        await link.delete_messages(messages[2:])
+        assert sorted(client.deleted) == [(1, [2, 4, 6]), (1, [8]), (2, [1, 3, 5]), (2, [7])]
+        assert channel.deleting == {}
+
+    run(main())
+
+
+def test_coalesce_caches_answered_results():
+    async def main():
+        calls = []
+
+        async def ask(answer):
+            calls.append(answer)
+            await asyncio.sleep(0.01)
+            return answer, "bot"
+
+        results = await asyncio.gather(*(Link.coalesce(("s", "q"), lambda: ask("a")) for _ in range(3)))
+        assert results == [("a", "bot")] * 3 and calls == ["a"]
+        assert Link.join_count == 2
+        assert await Link.coalesce(("s", "q"), lambda: ask("b")) == ("a", "bot")
+        assert Link.hit_count == 1
+        # 没有回答的结果不缓存
+        await Link.coalesce(("s", "none"), lambda: ask(None))
+        await Link.coalesce(("s", "none"), lambda: ask(None))
+        assert calls == ["a", None, None]
+
+    run(main())
+
+
+@pytest.mark.parametrize("outcome", ["error", "cancel"])
+def test_coalesce_followers_retry_after_leader_fails(outcome):
+    async def main():
+        calls = []
+
+        async def leader():
+            calls.append("leader")
+            await asyncio.sleep(0.05)
+            if outcome == "error":
+                raise RuntimeError()
+            return "x", "bot"
+
+        async def follower():
+            calls.append("follower")
+            return "y", "bot"
+
+        first = asyncio.create_task(Link.coalesce(("s", "q"), leader))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(Link.coalesce(("s", "q"), follower))
+        await asyncio.sleep(0.01)
+        if outcome == "cancel":
+            first.cancel()
+        assert await second == ("y", "bot")
+        with pytest.raises(RuntimeError if outcome == "error" else asyncio.CancelledError):
+            await first
+        assert calls == ["leader", "follower"]
+        assert Link.inflight == {}
+
+    run(main())
+
+
+class PostLink(Link):
+    """以固定回答模拟机器人, 记录发出与完成的请求."""
+
+    def __init__(self, answer="A", delay=0):
+        super().__init__(SimpleNamespace(me=SimpleNamespace(id=7, full_name="Test")))
+        self.answer = answer
+        self.delay = delay
+        self.posts = []
+        self.done = []
+
+    async def post(self, cmd, photo=None, **kw):
+        self.posts.append(cmd)
+        await asyncio.sleep(self.delay)
+        self.done.append(cmd)
+        return {"status": "ok", "answer": self.answer, "by": "bot"}
+
+
+def png(shade: int) -> bytes:
+    im = Image.new("L", (32, 32), 0)
+    im.paste(shade, (0, 0, 16, 32))
+    bio = BytesIO()
+    im.save(bio, format="PNG")
+    return bio.getvalue()
+
+
+def test_stored_results(store: Cache):
+    async def main():
+        link = PostLink()
+        assert await link.terminus_answer("q  1") == ("A", "bot")
+        Link.results.clear()
+        assert await link.terminus_answer("q 1") == ("A", "bot")
+        assert len(link.posts) == 1 and Link.hit_count == 1
+        # fresh 跳过近期及缓存的结果
+        await link.terminus_answer("q 1", fresh=True)
+        assert len(link.posts) == 2
+        await link.forget("terminus_answer", "q 1")
+        await link.terminus_answer("q 1")
+        assert len(link.posts) == 3
+        # 没有回答的结果不保存
+        link.answer = None
+        await link.ocr(b"img")
+        await link.ocr(b"img")
+        assert len(link.posts) == 5
+
+    run(main())
+
+
+def test_stored_similar_images(store: Cache):
+    async def main():
+        link = PostLink(delay=0.2)
+        first, second = png(255), png(250)
+        assert await link.visual(first, ["a", "b"]) == ("A", "bot")
+        await asyncio.gather(*Link.similar_tasks)
+        assert len(await store.aget_by_prefix("link.similar.visual.")) == 1
+
+        # 相近图片在请求完成前命中, 进行中的请求被取消
+        link.answer = "B"
+        assert await link.visual(second, ["a", "b"]) == ("A", "bot")
+        assert (len(link.posts), len(link.done)) == (2, 1)
+        # 选项不同时不视为相同请求
+        assert await link.visual(second, ["a", "c"]) == ("B", "bot")
+        await asyncio.gather(*Link.similar_tasks)
+
+        # 清除命中的结果后, 相近图片的来源结果一并清除
+        await link.forget("visual", second, ["a", "b"])
+        assert await link.visual(second, ["a", "b"]) == ("B", "bot")
+        assert await link.visual(first, ["a", "b"]) == ("B", "bot")
+        await asyncio.gather(*Link.similar_tasks)
+
+    run(main())
+
+
+def test_auth_persisted(store: Cache):
+    async def main():
+        results = []
+
+        async def post(cmd, **kw):
+            results.append(cmd)
+            return outcome
+
+        outcome = {"status": "ok"}
+        link = PostLink()
+        link.post = post
+        key = link._auth_key("gpt")
+        assert await link.auth("gpt")
+        link_module.authed_services.clear()
+        assert await link.auth("gpt")
+        assert len(results) == 1
+        assert store.get(key)["instance"] == str(link.instance)
+
+        # 其他设备保存的认证结果不被使用
+        link_module.authed_services.clear()
+        store.set(key, {"time": time.time(), "instance": "other"})
+        assert await link.auth("gpt")
+        assert len(results) == 2
+
+        # 超过有效时间一半时在后台重新认证, 被拒绝则清除缓存的结果
+        link_module.authed_services.clear()
+        store.set(
+            key, {"time": time.time() - config.telegram.auth_expiry * 0.6, "instance": str(link.instance)}
+        )
+        outcome = False
+        assert await link.auth("gpt")
+        await asyncio.gather(*Link.auth_tasks)
+        assert len(results) == 3
+        assert store.get(key) is None
+        assert link_module.authed_services[7]["gpt"] is False
+
+    run(main())
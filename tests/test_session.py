@@ -0,0 +1,186 @@
+import asyncio
+import sqlite3
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from embykeeper.config import config
+from embykeeper.schema import Config, TelegramAccount
+from embykeeper.telegram import session as session_module
+from embykeeper.telegram.session import ClientsSession
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.fixture()
+def session(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    config.basedir = tmp_path
+    config.set(Config())
+    for name, value in (("probes", {}), ("pool", {}), ("timers", {}), ("timeouts", {}), ("login_sem", None)):
+        monkeypatch.setattr(ClientsSession, name, value)
+    monkeypatch.setattr(ClientsSession, "lock", asyncio.Lock())
+    return ClientsSession([], basedir=tmp_path)
+
+
+def test_probe_memoized_and_shielded(session: ClientsSession):
+    calls = []
+
+    async def test_network():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return True
+
+    async def test_time():
+        return True
+
+    session.test_network = test_network
+    session.test_time = test_time
+
+    async def main():
+        entering = asyncio.create_task(session.__aenter__())
+        await asyncio.sleep(0)
+        entering.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await entering
+        # 取消一个会话的进入不影响共享的检测任务
+        assert await session.__aenter__() is session
+        assert len(calls) == 1
+
+        ClientsSession.probes.clear()
+        cancelled = session.probe(test_network)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert cancelled.cancelled()
+        assert await session.__aenter__() is session
+        assert len(calls) == 2
+
+    run(main())
+
+
+def test_probe_retries_failure(session: ClientsSession):
+    calls = []
+
+    async def test_time():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("probe failed")
+        return True
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await asyncio.shield(session.probe(test_time))
+        assert await asyncio.shield(session.probe(test_time)) is True
+
+    run(main())
+
+
+class FakeClient:
+    def __init__(self, phone: str):
+        self.phone_number = phone
+        self.me = SimpleNamespace(full_name=phone)
+        self.stop_handlers = []
+        self.stopped = False
+
+        async def delete():
+            pass
+
+        self.storage = SimpleNamespace(delete=delete)
+
+    async def stop(self):
+        self.stopped = True
+
+
+def test_idle_clients_evicted(session: ClientsSession):
+    async def main():
+        account = TelegramAccount(phone="+10000000001")
+        client = FakeClient(account.phone)
+        ClientsSession.timeouts[account.phone] = 0.05
+        ClientsSession.pool[account.phone] = (client, 0)
+        ClientsSession.schedule_clean(account.phone)
+        # 定时器触发前再次使用账号将取消断开
+        async with ClientsSession.lock:
+            session.acquire(account)
+        assert account.phone not in ClientsSession.timers
+        await asyncio.sleep(0.1)
+        assert ClientsSession.pool[account.phone] == (client, 1) and not client.stopped
+
+        session.phones = [account.phone]
+        await session.__aexit__(None, None, None)
+        assert account.phone in ClientsSession.timers
+        await asyncio.sleep(0.1)
+        assert account.phone not in ClientsSession.pool and client.stopped
+
+    run(main())
+
+
+def test_concurrent_login(session: ClientsSession, monkeypatch: pytest.MonkeyPatch):
+    config.set(Config(telegram={"login_concurrency": 2}))
+    monkeypatch.setattr(session_module, "Client", FakeClient)
+    active = []
+    peak = []
+    logins = []
+
+    async def login(self, account: TelegramAccount):
+        logins.append(account.phone)
+        active.append(account.phone)
+        peak.append(len(active))
+        await asyncio.sleep(0.05)
+        active.remove(account.phone)
+        return None if account.phone.endswith("4") else FakeClient(account.phone)
+
+    async def probe_ok(self):
+        return True
+
+    monkeypatch.setattr(ClientsSession, "login", login)
+    monkeypatch.setattr(ClientsSession, "test_network", probe_ok)
+    monkeypatch.setattr(ClientsSession, "test_time", probe_ok)
+    accounts = [TelegramAccount(phone=f"+1000000000{i}") for i in range(5)]
+
+    async def collect(accounts):
+        async with ClientsSession(accounts) as clients:
+            return sorted([a.phone async for a, _ in clients])
+
+    async def main():
+        # 两个会话同时请求相同账号时, 每个账号仅登录一次
+        return await asyncio.gather(collect(accounts), collect(accounts[:2]))
+
+    first, second = run(main())
+    expected = [a.phone for a in accounts if not a.phone.endswith("4")]
+    assert first == expected
+    assert second == expected[:2]
+    assert sorted(logins) == [a.phone for a in accounts]
+    assert max(peak) == 2
+
+
+def test_maintain_sessions(tmp_path: Path):
+    from embykeeper.clean import maintain_sessions
+    from embykeeper.utils import vacuum_sqlite
+
+    path = tmp_path / "+10000000000.session"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE peers (id INTEGER PRIMARY KEY, data BLOB)")
+    conn.executemany("INSERT INTO peers (data) VALUES (?)", [(b"x" * 1000,) for _ in range(500)])
+    conn.commit()
+    conn.execute("DELETE FROM peers WHERE id > 10")
+    conn.commit()
+    # 空闲页占比未超过阈值时不整理
+    assert not vacuum_sqlite(conn, ratio=1)
+    conn.close()
+    before = path.stat().st_size
+
+    report = maintain_sessions(tmp_path)
+    assert path.stat().st_size < before
+    assert "+10000000000.session" in report and "已整理 1/1 个会话文件" in report
+    # 无空闲空间或无法整理的文件不计入已整理数量
+    (tmp_path / "+20000000000.session").write_bytes(b"not a database" * 100)
+    report = maintain_sessions(tmp_path)
+    assert "无空闲空间" in report and "无法整理" in report
+    assert "已整理 0/2 个会话文件" in report
+    assert "未找到会话文件" in maintain_sessions(tmp_path / "empty")
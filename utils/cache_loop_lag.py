@@ -0,0 +1,86 @@
+"""测量缓存读写对事件循环造成的延迟.
+
+模拟每次读写耗时 --latency 毫秒的远程缓存 (如 MongoDB), 分别使用同步接口和异步接口
+执行相同的读写负载, 同时以 10 ms 间隔的定时器测量事件循环延迟.
+
+用法: python utils/cache_loop_lag.py [--latency 5] [--ops 200]
+"""
+
+import asyncio
+from pathlib import Path
+import statistics
+import tempfile
+import time
+
+import typer
+
+from embykeeper.cache import Cache, JSONCacheBackend
+from embykeeper.config import config
+from embykeeper.schema import Config
+
+app = typer.Typer()
+
+
+class SlowBackend(JSONCacheBackend):
+    blocking = True
+
+    def __init__(self, path: Path, latency: float):
+        super().__init__(path)
+        self.latency = latency
+
+    def get(self, key, default=None):
+        time.sleep(self.latency)
+        return super().get(key, default)
+
+    def set_many(self, items, metas=None):
+        time.sleep(self.latency)
+        return super().set_many(items, metas)
+
+
+async def probe(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - start - interval))
+
+
+async def measure(cache: Cache, ops: int, use_async: bool):
+    lags = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    for i in range(ops):
+        if use_async:
+            await cache.aset(f"bench.{i}", i)
+            await cache.aget(f"bench.{i}")
+        else:
+            cache.set(f"bench.{i}", i)
+            cache.get(f"bench.{i}")
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await prober
+    return elapsed, lags
+
+
+@app.command()
+def main(latency: float = 5, ops: int = 200):
+    with tempfile.TemporaryDirectory() as d:
+        config.basedir = Path(d)
+        config.set(Config())
+        cache = Cache()
+        cache.backend = SlowBackend(Path(d) / "cache.json", latency / 1000)
+        for name, use_async in (("sync", False), ("async", True)):
+            elapsed, lags = asyncio.run(measure(cache, ops, use_async))
+            lags_ms = sorted(l * 1000 for l in lags) or [0.0]
+            p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+            print(
+                f"{name:>5}: {ops} 次读写耗时 {elapsed:.2f} s, 事件循环延迟 "
+                f"平均 {statistics.mean(lags_ms):.1f} ms / P99 {p99:.1f} ms / 最大 {lags_ms[-1]:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    app()
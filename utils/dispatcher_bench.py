@@ -0,0 +1,81 @@
+"""测量 Telegram 更新分配器在不同处理器数量下的分配速度.
+
+使用伪造的更新和解析器, 仅测量处理器匹配与分配的开销. 每条更新仅被最后注册的一个处理器匹配,
+其余处理器均以 filters.chat 限定在其他会话.
+
+用法: python utils/dispatcher_bench.py [--updates 2000]
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from pyrogram import filters, types
+from pyrogram.enums import ChatType
+from pyrogram.handlers import MessageHandler
+import typer
+
+from embykeeper.telegram.pyrogram import Dispatcher, HandlerGroup
+
+app = typer.Typer()
+
+
+class FakeUpdate:
+    def __init__(self, message):
+        self.message = message
+
+
+class LegacyDispatcher(Dispatcher):
+    """旧实现: 每条更新都复制一次所有处理器组, 并逐个检查全部处理器"""
+
+    @property
+    def snapshot(self):
+        return tuple(HandlerGroup(g[:], route=False) for g in self.groups.values())
+
+    @snapshot.setter
+    def snapshot(self, value):
+        pass
+
+
+async def measure(cls, handlers: int, updates: int) -> float:
+    loop = asyncio.get_running_loop()
+    client = SimpleNamespace(loop=loop, executor=None, phone_number="0")
+    dispatcher = cls(client)
+
+    async def parser(update, users, chats):
+        return update.message, MessageHandler
+
+    dispatcher.update_parsers = {FakeUpdate: parser}
+
+    matched = 0
+
+    async def callback(client, message):
+        nonlocal matched
+        matched += 1
+
+    for i in range(handlers):
+        dispatcher.add_handler(MessageHandler(callback, filters.chat(100000 + i)), group=i % 3)
+    dispatcher.add_handler(MessageHandler(callback, filters.chat(42)), group=3)
+
+    message = types.Message(id=1, chat=types.Chat(id=42, type=ChatType.PRIVATE))
+    for _ in range(updates):
+        dispatcher.updates_queue.put_nowait((FakeUpdate(message), {}, {}))
+    dispatcher.updates_queue.put_nowait(None)
+    start = time.perf_counter()
+    await dispatcher.handler_worker()
+    elapsed = time.perf_counter() - start
+    assert matched == updates
+    return updates / elapsed
+
+
+@app.command()
+def main(updates: int = 2000):
+    print(f"{'处理器数':>6} {'旧实现 (条/秒)':>14} {'当前实现 (条/秒)':>14}")
+    for handlers in (10, 100, 500, 1000):
+        legacy = asyncio.run(measure(LegacyDispatcher, handlers, updates))
+        current = asyncio.run(measure(Dispatcher, handlers, updates))
+        print(f"{handlers:>10} {legacy:>18.0f} {current:>20.0f}")
+
+
+if __name__ == "__main__":
+    app()
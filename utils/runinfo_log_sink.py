@@ -0,0 +1,70 @@
+"""测量存在大量运行中任务时, 每条带 run_id 的日志的处理耗时.
+
+对比旧实现 (每个任务各添加一个 loguru 处理器) 与当前实现 (一个处理器按 run_id 分发).
+
+用法: python utils/runinfo_log_sink.py [--records 2000]
+"""
+
+from pathlib import Path
+import tempfile
+import time
+
+from loguru import logger
+import typer
+
+from embykeeper.config import config
+from embykeeper.runinfo import LogRecord, RunContext, RunStatus
+from embykeeper.schema import Config
+
+app = typer.Typer()
+
+
+def per_run_sinks(runs: int):
+    """旧实现: 每个任务添加一个处理器, 每条日志需经过所有处理器"""
+    handler_ids = []
+    target = None
+    for i in range(runs):
+        run = RunContext(id=f"L{i:05d}")
+
+        def log_sink(message, run=run):
+            record = message.record
+            if record["extra"].get("run_id") == run.id:
+                run.log.append(
+                    LogRecord(
+                        level=record["level"].name.upper(), message=record["message"], time=record["time"]
+                    )
+                )
+
+        handler_ids.append(logger.add(log_sink, filter=lambda record: "run_id" in record["extra"]))
+        target = target or run
+    return target, lambda: [logger.remove(h) for h in handler_ids]
+
+
+def dispatch_sink(runs: int):
+    """当前实现: 所有任务共用一个分发处理器"""
+    contexts = [RunContext.prepare(f"bench-{i}") for i in range(runs)]
+    return contexts[0], lambda: [c.finish(RunStatus.SUCCESS) for c in contexts]
+
+
+@app.command()
+def main(records: int = 2000):
+    logger.remove()
+    config.basedir = Path(tempfile.mkdtemp())
+    config.set(Config())
+    print(f"{'运行中任务数':>8} {'旧实现 (us/条)':>16} {'当前实现 (us/条)':>16}")
+    for runs in (1, 10, 100, 500):
+        results = []
+        for setup in (per_run_sinks, dispatch_sink):
+            target, teardown = setup(runs)
+            log = target.bind_logger(logger)
+            start = time.perf_counter()
+            for i in range(records):
+                log.info(f"日志 {i}")
+            results.append((time.perf_counter() - start) / records * 1e6)
+            assert len(target.log) >= records
+            teardown()
+        print(f"{runs:>14} {results[0]:>20.1f} {results[1]:>22.1f}")
+
+
+if __name__ == "__main__":
+    app()
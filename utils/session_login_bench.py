@@ -0,0 +1,114 @@
+"""测量多账号启动时 ClientsSession 的登录耗时.
+
+使用模拟的登录过程 (固定延迟, 首个账号的延迟为其他账号的 slow 倍), 会话 A 开始登录全部账号后,
+会话 B 立即以相同账号进入, 分别统计两个会话取得首个账号和全部账号的耗时.
+
+用法: python utils/session_login_bench.py [--accounts 50] [--latency 0.3] [--slow 10] [--concurrency 5]
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import typer
+
+from embykeeper.config import config
+from embykeeper.schema import Config, TelegramAccount
+from embykeeper.telegram.pyrogram import Client
+from embykeeper.telegram.session import ClientsSession
+
+app = typer.Typer()
+
+
+class StubSession(ClientsSession):
+    latency = 0.3
+    slow = 10
+
+    async def test_network(self):
+        return True
+
+    async def test_time(self):
+        return True
+
+    async def login(self, account: TelegramAccount, use_telethon=True):
+        await asyncio.sleep(self.latency * (self.slow if account.phone.endswith("0" * 10) else 1))
+        client = Client.__new__(Client)
+        client.me = SimpleNamespace(full_name=account.phone)
+        return client
+
+
+class LegacySession(StubSession):
+    """旧实现: 不限制并发, 逐个等待其他会话中正在进行的登录"""
+
+    async def loginer(self, account: TelegramAccount):
+        client = await self.login(account)
+        async with self.lock:
+            self.pool[account.phone] = (client, 1)
+            self.phones.append(account.phone)
+            await self.done.put((account, client))
+
+    async def __aenter__(self):
+        for a in self.accounts:
+            try:
+                await self.lock.acquire()
+                if a.phone not in self.pool:
+                    self.pool[a.phone] = asyncio.create_task(self.loginer(a))
+                else:
+                    if isinstance(self.pool[a.phone], asyncio.Task):
+                        self.lock.release()
+                        await self.pool[a.phone]
+                        await self.lock.acquire()
+                    client, ref = self.pool[a.phone]
+                    self.pool[a.phone] = (client, ref + 1)
+                    self.phones.append(a.phone)
+                    await self.done.put((a, client))
+            finally:
+                try:
+                    self.lock.release()
+                except RuntimeError:
+                    pass
+        return self
+
+
+async def consume(session: ClientsSession, start: float):
+    await session.__aenter__()
+    first = None
+    async for _ in session:
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def measure(cls, accounts: int, concurrency: int):
+    cls.pool = {}
+    cls.lock = asyncio.Lock()
+    cls.login_sem = asyncio.Semaphore(concurrency)
+    phones = [TelegramAccount(phone=f"+1{i:010d}") for i in range(accounts)]
+    start = time.perf_counter()
+    a = cls(phones)
+    b = cls(phones)
+    task_a = asyncio.create_task(consume(a, start))
+    await asyncio.sleep(0)
+    result_b = await consume(b, start)
+    return await task_a, result_b
+
+
+@app.command()
+def main(accounts: int = 50, latency: float = 0.3, slow: float = 10, concurrency: int = 5):
+    config.set(Config())
+    StubSession.latency = latency
+    StubSession.slow = slow
+
+    async def run():
+        for name, cls in (("旧实现", LegacySession), ("当前实现", StubSession)):
+            (a_first, a_all), (b_first, b_all) = await measure(cls, accounts, concurrency)
+            print(
+                f"{name}: 会话 A 首个 {a_first:.2f} 秒 / 全部 {a_all:.2f} 秒, "
+                f"会话 B 首个 {b_first:.2f} 秒 / 全部 {b_all:.2f} 秒"
+            )
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    app()
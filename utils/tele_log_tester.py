@@ -23,18 +23,18 @@ async def log(config_file: Path):
 @app.async_command()
 async def disconnect(config_file: Path):
     await config.reload_conf(config_file)
-    ClientsSession.watch = asyncio.create_task(ClientsSession.watchdog(40))
+    accounts = [a.model_copy(update={"idle_timeout": 40}) for a in config.telegram.account[:1]]
     print("Sending Test1")
-    async with ClientsSession(config.telegram.account[:1]) as clients:
+    async with ClientsSession(accounts) as clients:
         async for _, client in clients:
             await Link(client).send_msg("ERROR#Test1")
             break
     print("Wait for 40 seconds")
     await asyncio.sleep(40)
-    print("Watchdog should be triggered")
+    print("Idle client should be disconnected")
     print("Wait for another 20 seconds")
     await asyncio.sleep(20)
-    async with ClientsSession(config.telegram.account[:1]) as clients:
+    async with ClientsSession(accounts) as clients:
         async for _, client in clients:
             await Link(client).send_msg("ERROR#Test1")
             break